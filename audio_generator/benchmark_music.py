@@ -0,0 +1,79 @@
+"""مقارنة زمن توليد الموسيقى (ثوانٍ لكل دقيقة صوت) بين الحلقة القديمة والمُركِّب المتجه"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+from scipy import signal
+from src.services.music_synth import MusicSynthesizer, MOOD_SCALES
+
+def legacy_background_music(duration_seconds, mood='neutral', tempo=120, sample_rate=22050):
+    """التنفيذ السابق: نغمة بنغمة في حلقة بايثون ثم filtfilt بدقة float64"""
+    duration_samples = int(duration_seconds * sample_rate)
+    scale = MOOD_SCALES.get(mood, MOOD_SCALES['neutral'])
+
+    music = np.zeros(duration_samples)
+    beat_duration = 60.0 / tempo
+    beat_samples = int(beat_duration * sample_rate)
+
+    for i in range(0, duration_samples, beat_samples):
+        if i + beat_samples > duration_samples:
+            break
+
+        frequency = random.choice(scale)
+        t = np.linspace(0, beat_duration, beat_samples)
+        note = 0.3 * np.sin(2 * np.pi * frequency * t)
+
+        fade_samples = int(0.1 * beat_samples)
+        note[:fade_samples] *= np.linspace(0, 1, fade_samples)
+        note[-fade_samples:] *= np.linspace(1, 0, fade_samples)
+
+        end_idx = min(i + beat_samples, duration_samples)
+        music[i:end_idx] += note[:end_idx-i]
+
+    b, a = signal.butter(4, 0.3, 'low')
+    music = signal.filtfilt(b, a, music)
+    music = music / np.max(np.abs(music)) * 0.7
+
+    return music
+
+def measure(function, duration_seconds, repeats):
+    """أفضل زمن من عدة محاولات، مع حجم المخرج بالبايت"""
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function(duration_seconds)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result.nbytes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--minutes', type=float, nargs='+', default=[1, 10, 90])
+    parser.add_argument('--tempo', type=int, default=120)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    synth = MusicSynthesizer()
+
+    print(f"{'minutes':>8} {'legacy s/min':>14} {'vector s/min':>14} {'speedup':>9} {'legacy MB':>10} {'vector MB':>10}")
+    for minutes in args.minutes:
+        duration = minutes * 60
+        legacy_seconds, legacy_bytes = measure(
+            lambda d: legacy_background_music(d, 'neutral', args.tempo), duration, args.repeats
+        )
+        vector_seconds, vector_bytes = measure(
+            lambda d: synth.render(d, 'neutral', args.tempo, seed=0), duration, args.repeats
+        )
+        print(
+            f"{minutes:>8g} {legacy_seconds / minutes:>14.4f} {vector_seconds / minutes:>14.4f} "
+            f"{legacy_seconds / vector_seconds:>8.1f}x "
+            f"{legacy_bytes / 1e6:>10.1f} {vector_bytes / 1e6:>10.1f}"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -24,10 +24,13 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
 # إضافة نماذج المحتوى الصوتي إلى قاعدة البيانات
-from src.models.audio_content import AudioContent, AudioTask, VoiceProfile
+from src.models.audio_content import AudioContent, AudioTask, VoiceProfile, TTSCacheEntry
+from src.models.audio_content import db as audio_db
+audio_db.init_app(app)
 
 with app.app_context():
     db.create_all()
+    audio_db.create_all()
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
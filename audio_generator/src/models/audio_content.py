@@ -1,3 +1,4 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 
@@ -49,7 +50,7 @@ class AudioContent(db.Model):
 
 class AudioTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    task_type = db.Column(db.String(50), nullable=False)  # tts, music, sound_effect, voice_clone
+    task_type = db.Column(db.String(50), nullable=False)  # tts, tts_batch, music, sound_effect, voice_clone
     movie_id = db.Column(db.Integer, nullable=False)
     scene_id = db.Column(db.Integer, nullable=True)
     text_content = db.Column(db.Text, nullable=True)
@@ -58,6 +59,7 @@ class AudioTask(db.Model):
     result_path = db.Column(db.String(500), nullable=True)
     error_message = db.Column(db.Text, nullable=True)
     progress = db.Column(db.Integer, default=0)  # 0-100
+    line_progress = db.Column(db.Text, nullable=True)  # JSON string: حالة كل سطر في مهام الدفعات
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -73,6 +75,7 @@ class AudioTask(db.Model):
             'result_path': self.result_path,
             'error_message': self.error_message,
             'progress': self.progress,
+            'line_progress': json.loads(self.line_progress) if self.line_progress else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -99,3 +102,37 @@ class VoiceProfile(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+
+class TTSCacheEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    text_content = db.Column(db.Text, nullable=False)  # النص بعد التطبيع
+    engine = db.Column(db.String(50), nullable=False)
+    voice_type = db.Column(db.String(50), nullable=True)
+    language = db.Column(db.String(10), nullable=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_size = db.Column(db.Integer, nullable=True)
+    duration = db.Column(db.Float, nullable=True)
+    sample_rate = db.Column(db.Integer, nullable=True)
+    channels = db.Column(db.Integer, nullable=True)
+    hit_count = db.Column(db.Integer, default=0)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'cache_key': self.cache_key,
+            'text_content': self.text_content,
+            'engine': self.engine,
+            'voice_type': self.voice_type,
+            'language': self.language,
+            'file_path': self.file_path,
+            'file_size': self.file_size,
+            'duration': self.duration,
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'hit_count': self.hit_count,
+            'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -1,13 +1,19 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request, send_file, current_app
 from flask_cors import cross_origin
 from src.models.audio_content import AudioContent, AudioTask, VoiceProfile, db
 from src.services.audio_generator import audio_generator
+from src.services.sample_bank import sample_bank
+from src.services.tts_cache import tts_cache, copy_file
+from src.services.dialogue_batch import dialogue_batcher
+from src.services.effects_engine import EFFECT_TYPES
+from src.services.mastering import TARGET_LUFS, TRUE_PEAK_DB
 import json
 import os
 import uuid
 from datetime import datetime
 import threading
 import logging
+import time
 import numpy as np
 
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +25,21 @@ audio_bp = Blueprint('audio', __name__)
 GENERATED_AUDIO_DIR = os.path.join(os.path.dirname(__file__), '..', 'generated_audio')
 os.makedirs(GENERATED_AUDIO_DIR, exist_ok=True)
 
+# أقل فاصل بالثواني بين حفظ تقدم مهام الدفعات في قاعدة البيانات
+BATCH_PROGRESS_INTERVAL = 1.0
+
+def start_background(target, *args):
+    """تشغيل دالة في خيط منفصل داخل سياق التطبيق (للوصول إلى قاعدة البيانات)"""
+    app = current_app._get_current_object()
+    
+    def run():
+        with app.app_context():
+            target(*args)
+    
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
 @audio_bp.route('/audio-content', methods=['GET'])
 @cross_origin()
 def get_audio_content():
@@ -94,11 +115,7 @@ def text_to_speech():
         db.session.commit()
         
         # بدء توليد الصوت في خيط منفصل
-        thread = threading.Thread(
-            target=generate_tts_async,
-            args=(task.id, text, voice_type, language, engine)
-        )
-        thread.start()
+        start_background(generate_tts_async, task.id, text, voice_type, language, engine)
         
         return jsonify({
             'success': True,
@@ -120,13 +137,13 @@ def generate_tts_async(task_id, text, voice_type, language, engine):
         task.progress = 20
         db.session.commit()
         
-        # توليد الصوت
-        if engine == 'gtts':
-            audio = audio_generator.text_to_speech_gtts(text, language)
-        else:
-            audio = audio_generator.text_to_speech_pyttsx3(text, voice_type)
+        # السطور المكررة تُخدم من المخزن، والطلبات المتزامنة المتطابقة تنتظر توليداً واحداً
+        entry, cached = tts_cache.get_or_create(
+            text, engine, voice_type, language,
+            lambda file_path: audio_generator.synthesize_to_file(text, file_path, engine, voice_type, language)
+        )
         
-        if not audio:
+        if not entry:
             task.status = 'failed'
             task.error_message = 'Failed to generate speech'
             db.session.commit()
@@ -135,53 +152,219 @@ def generate_tts_async(task_id, text, voice_type, language, engine):
         task.progress = 80
         db.session.commit()
         
-        # حفظ الملف الصوتي
+        # ربط الملف المخزن بمسار المحتوى (نسخة واحدة على القرص)
         filename = f"tts_{task_id}_{uuid.uuid4().hex[:8]}.wav"
         file_path = os.path.join(GENERATED_AUDIO_DIR, filename)
+        copy_file(entry.file_path, file_path)
+        
+        # إنشاء سجل المحتوى الصوتي
+        audio_content = AudioContent(
+            movie_id=task.movie_id,
+            scene_id=task.scene_id,
+            content_type='voice',
+            title=f"Generated Speech - {task_id}",
+            text_content=text,
+            file_path=file_path,
+            duration=entry.duration,
+            sample_rate=entry.sample_rate,
+            channels=entry.channels,
+            voice_type=voice_type,
+            language=language,
+            model_used=engine,
+            generation_params=task.parameters,
+            status='completed'
+        )
+        db.session.add(audio_content)
+        
+        # تحديث المهمة
+        task.status = 'completed'
+        task.result_path = file_path
+        task.progress = 100
+        db.session.commit()
+        
+        logger.info(f"TTS generation completed for task {task_id} ({'cached' if cached else 'synthesized'})")
         
-        if audio_generator.save_audio(audio, file_path):
-            # الحصول على معلومات الصوت
-            audio_info = audio_generator.get_audio_info(file_path)
+    except Exception as e:
+        logger.error(f"Error in generate_tts_async: {str(e)}")
+        db.session.rollback()
+        task = AudioTask.query.get(task_id)
+        if task:
+            task.status = 'failed'
+            task.error_message = str(e)
+            db.session.commit()
+
+@audio_bp.route('/text-to-speech/batch', methods=['POST'])
+@cross_origin()
+def text_to_speech_batch():
+    """تحويل حوار مشهد أو فيلم كامل إلى كلام في مهمة واحدة"""
+    try:
+        data = request.json
+        movie_id = data.get('movie_id')
+        scene_id = data.get('scene_id')
+        voice_type = data.get('voice_type', 'default')
+        language = data.get('language', 'ar')
+        engine = data.get('engine', 'gtts')  # gtts أو pyttsx3
+        voices = data.get('voices', {})  # اسم المتحدث -> نوع الصوت
+        
+        if engine not in ('gtts', 'pyttsx3'):
+            return jsonify({'success': False, 'error': f'Unknown engine: {engine}'}), 400
+        
+        raw_lines = data.get('lines')
+        if raw_lines is None:
+            if not movie_id:
+                return jsonify({'success': False, 'error': 'Lines or movie_id are required'}), 400
+            # جلب الحوار من خدمة السيناريو
+            try:
+                raw_lines = dialogue_batcher.fetch_scene_lines(movie_id, scene_id)
+            except Exception as e:
+                logger.error(f"Error fetching dialogue: {str(e)}")
+                return jsonify({'success': False, 'error': f'Could not fetch dialogue: {str(e)}'}), 502
+        
+        lines = []
+        for raw in raw_lines:
+            if isinstance(raw, str):
+                raw = {'text': raw}
+            text = (raw.get('text') or '').strip()
+            if not text:
+                continue
+            speaker = raw.get('speaker')
+            lines.append({
+                'text': text,
+                'speaker': speaker,
+                'scene_id': raw.get('scene_id', scene_id),
+                'voice_type': raw.get('voice_type') or voices.get(speaker) or voice_type,
+                'language': raw.get('language', language),
+                'engine': raw.get('engine', engine)
+            })
+        
+        if not lines:
+            return jsonify({'success': False, 'error': 'No dialogue lines to synthesize'}), 400
+        
+        # مهمة واحدة للدفعة كلها مع حالة كل سطر
+        task = AudioTask(
+            task_type='tts_batch',
+            movie_id=movie_id,
+            scene_id=scene_id,
+            text_content='\n'.join(line['text'] for line in lines),
+            parameters=json.dumps({
+                'voice_type': voice_type,
+                'language': language,
+                'engine': engine,
+                'voices': voices,
+                'line_count': len(lines)
+            }),
+            line_progress=json.dumps([
+                {'index': index, 'speaker': line['speaker'], 'status': 'queued'}
+                for index, line in enumerate(lines)
+            ]),
+            status='processing'
+        )
+        db.session.add(task)
+        db.session.commit()
+        
+        start_background(generate_tts_batch_async, task.id, lines)
+        
+        return jsonify({
+            'success': True,
+            'task_id': task.id,
+            'line_count': len(lines),
+            'message': 'Batch text-to-speech generation started'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error in text_to_speech_batch: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def generate_tts_batch_async(task_id, lines):
+    """توليد سطور الدفعة عبر المجمع ثم حفظ النتائج في معاملة واحدة"""
+    try:
+        task = AudioTask.query.get(task_id)
+        if not task:
+            return
+        
+        line_progress = json.loads(task.line_progress)
+        state = {'done': 0, 'saved_at': time.monotonic()}
+        
+        def on_line(index, result):
+            state['done'] += 1
+            if result is None:
+                line_progress[index]['status'] = 'failed'
+            else:
+                line_progress[index]['status'] = 'cached' if result['cached'] else 'completed'
+                line_progress[index]['duration'] = result['duration']
+            
+            # حفظ التقدم بفواصل زمنية لا بعد كل سطر
+            now = time.monotonic()
+            if now - state['saved_at'] >= BATCH_PROGRESS_INTERVAL:
+                task.line_progress = json.dumps(line_progress)
+                task.progress = int(90 * state['done'] / len(lines))
+                db.session.commit()
+                state['saved_at'] = now
+        
+        results = dialogue_batcher.synthesize(lines, on_line)
+        
+        # كل سجلات المحتوى وحالة المهمة في معاملة واحدة
+        contents = []
+        for index, (line, result) in enumerate(zip(lines, results)):
+            if result is None:
+                continue
+            filename = f"tts_{task_id}_{index:04d}_{uuid.uuid4().hex[:8]}.wav"
+            file_path = os.path.join(GENERATED_AUDIO_DIR, filename)
+            copy_file(result['file_path'], file_path)
             
-            # إنشاء سجل المحتوى الصوتي
             audio_content = AudioContent(
                 movie_id=task.movie_id,
-                scene_id=task.scene_id,
+                scene_id=line['scene_id'],
                 content_type='voice',
-                title=f"Generated Speech - {task_id}",
-                text_content=text,
+                title=f"{line['speaker']} - {index + 1}" if line['speaker'] else f"Dialogue Line - {index + 1}",
+                text_content=line['text'],
                 file_path=file_path,
-                duration=audio_info.get('duration') if audio_info else None,
-                sample_rate=audio_info.get('sample_rate') if audio_info else None,
-                channels=audio_info.get('channels') if audio_info else None,
-                voice_type=voice_type,
-                language=language,
-                model_used=engine,
-                generation_params=task.parameters,
+                duration=result['duration'],
+                sample_rate=result['sample_rate'],
+                channels=result['channels'],
+                voice_type=line['voice_type'],
+                language=line['language'],
+                model_used=line['engine'],
+                generation_params=json.dumps({'batch_task_id': task_id, 'line_index': index}),
                 status='completed'
             )
             db.session.add(audio_content)
-            
-            # تحديث المهمة
-            task.status = 'completed'
-            task.result_path = file_path
-            task.progress = 100
-            db.session.commit()
-            
-            logger.info(f"TTS generation completed for task {task_id}")
-        else:
-            task.status = 'failed'
-            task.error_message = 'Failed to save generated audio'
-            db.session.commit()
-            
+            contents.append((index, audio_content))
+        
+        db.session.flush()
+        for index, audio_content in contents:
+            line_progress[index]['audio_content_id'] = audio_content.id
+        
+        failed = len(lines) - len(contents)
+        task.line_progress = json.dumps(line_progress)
+        task.status = 'completed' if contents else 'failed'
+        task.error_message = f"{failed} of {len(lines)} lines failed" if failed else None
+        task.progress = 100
+        db.session.commit()
+        
+        logger.info(f"Batch TTS completed for task {task_id}: {len(contents)}/{len(lines)} lines")
+        
     except Exception as e:
-        logger.error(f"Error in generate_tts_async: {str(e)}")
+        logger.error(f"Error in generate_tts_batch_async: {str(e)}")
+        db.session.rollback()
         task = AudioTask.query.get(task_id)
         if task:
             task.status = 'failed'
             task.error_message = str(e)
             db.session.commit()
 
+@audio_bp.route('/tts-cache', methods=['GET'])
+@cross_origin()
+def get_tts_cache_stats():
+    """الحصول على إحصائيات مخزن تحويل النص إلى كلام"""
+    return jsonify(tts_cache.get_stats())
+
+@audio_bp.route('/tts-engines', methods=['GET'])
+@cross_origin()
+def get_tts_engine_stats():
+    """الحصول على حالة مجمع محركات الكلام المحلية"""
+    return jsonify(audio_generator.tts_pool.get_stats())
+
 @audio_bp.route('/generate-music', methods=['POST'])
 @cross_origin()
 def generate_music():
@@ -191,6 +374,7 @@ def generate_music():
         duration = data.get('duration', 30)  # المدة بالثواني
         mood = data.get('mood', 'neutral')
         tempo = data.get('tempo', 120)
+        seed = data.get('seed')
         movie_id = data.get('movie_id')
         scene_id = data.get('scene_id')
         
@@ -202,7 +386,8 @@ def generate_music():
             parameters=json.dumps({
                 'duration': duration,
                 'mood': mood,
-                'tempo': tempo
+                'tempo': tempo,
+                'seed': seed
             }),
             status='processing'
         )
@@ -210,11 +395,7 @@ def generate_music():
         db.session.commit()
         
         # بدء توليد الموسيقى في خيط منفصل
-        thread = threading.Thread(
-            target=generate_music_async,
-            args=(task.id, duration, mood, tempo)
-        )
-        thread.start()
+        start_background(generate_music_async, task.id, duration, mood, tempo, seed)
         
         return jsonify({
             'success': True,
@@ -226,7 +407,7 @@ def generate_music():
         logger.error(f"Error in generate_music: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def generate_music_async(task_id, duration, mood, tempo):
+def generate_music_async(task_id, duration, mood, tempo, seed=None):
     """توليد الموسيقى بشكل غير متزامن"""
     try:
         task = AudioTask.query.get(task_id)
@@ -236,25 +417,18 @@ def generate_music_async(task_id, duration, mood, tempo):
         task.progress = 30
         db.session.commit()
         
-        # توليد الموسيقى
-        music_data, sample_rate = audio_generator.generate_background_music(
-            duration, mood, tempo
-        )
-        
-        if music_data is None:
-            task.status = 'failed'
-            task.error_message = 'Failed to generate music'
-            db.session.commit()
-            return
-        
-        task.progress = 80
-        db.session.commit()
-        
-        # حفظ الملف الصوتي
+        # توليد الموسيقى وكتابتها كتلة بكتلة مباشرة إلى الملف
         filename = f"music_{task_id}_{uuid.uuid4().hex[:8]}.wav"
         file_path = os.path.join(GENERATED_AUDIO_DIR, filename)
+        sample_rate = audio_generator.sample_rate
+        
+        frames = audio_generator.save_audio_stream(
+            audio_generator.stream_background_music(duration, mood, tempo, seed),
+            file_path,
+            sample_rate
+        )
         
-        if audio_generator.save_audio(music_data, file_path, sample_rate):
+        if frames is not None:
             # إنشاء سجل المحتوى الصوتي
             audio_content = AudioContent(
                 movie_id=task.movie_id,
@@ -263,7 +437,7 @@ def generate_music_async(task_id, duration, mood, tempo):
                 title=f"Generated Music - {mood.title()}",
                 description=f"Background music with {mood} mood, {tempo} BPM",
                 file_path=file_path,
-                duration=duration,
+                duration=frames / sample_rate,
                 sample_rate=sample_rate,
                 channels=1,
                 model_used='synthetic',
@@ -281,7 +455,7 @@ def generate_music_async(task_id, duration, mood, tempo):
             logger.info(f"Music generation completed for task {task_id}")
         else:
             task.status = 'failed'
-            task.error_message = 'Failed to save generated music'
+            task.error_message = 'Failed to generate music'
             db.session.commit()
             
     except Exception as e:
@@ -320,11 +494,7 @@ def generate_sound_effect():
         db.session.commit()
         
         # بدء توليد المؤثر الصوتي في خيط منفصل
-        thread = threading.Thread(
-            target=generate_sound_effect_async,
-            args=(task.id, effect_type, duration, params)
-        )
-        thread.start()
+        start_background(generate_sound_effect_async, task.id, effect_type, duration, params)
         
         return jsonify({
             'success': True,
@@ -346,25 +516,18 @@ def generate_sound_effect_async(task_id, effect_type, duration, params):
         task.progress = 30
         db.session.commit()
         
-        # توليد المؤثر الصوتي
-        effect_data, sample_rate = audio_generator.generate_sound_effect(
-            effect_type, duration, **params
-        )
-        
-        if effect_data is None:
-            task.status = 'failed'
-            task.error_message = 'Failed to generate sound effect'
-            db.session.commit()
-            return
-        
-        task.progress = 80
-        db.session.commit()
-        
-        # حفظ الملف الصوتي
+        # توليد المؤثر الصوتي وكتابته كتلة بكتلة مباشرة إلى الملف
         filename = f"effect_{effect_type}_{task_id}_{uuid.uuid4().hex[:8]}.wav"
         file_path = os.path.join(GENERATED_AUDIO_DIR, filename)
+        sample_rate = audio_generator.sample_rate
         
-        if audio_generator.save_audio(effect_data, file_path, sample_rate):
+        frames = audio_generator.save_audio_stream(
+            audio_generator.stream_sound_effect(effect_type, duration, params.get('seed'), params=params),
+            file_path,
+            sample_rate
+        )
+        
+        if frames is not None:
             # إنشاء سجل المحتوى الصوتي
             audio_content = AudioContent(
                 movie_id=task.movie_id,
@@ -373,7 +536,7 @@ def generate_sound_effect_async(task_id, effect_type, duration, params):
                 title=f"Sound Effect - {effect_type.title()}",
                 description=f"Generated {effect_type} sound effect",
                 file_path=file_path,
-                duration=duration,
+                duration=frames / sample_rate,
                 sample_rate=sample_rate,
                 channels=1,
                 model_used='synthetic',
@@ -391,7 +554,7 @@ def generate_sound_effect_async(task_id, effect_type, duration, params):
             logger.info(f"Sound effect generation completed for task {task_id}")
         else:
             task.status = 'failed'
-            task.error_message = 'Failed to save generated sound effect'
+            task.error_message = 'Failed to generate sound effect'
             db.session.commit()
             
     except Exception as e:
@@ -402,6 +565,19 @@ def generate_sound_effect_async(task_id, effect_type, duration, params):
             task.error_message = str(e)
             db.session.commit()
 
+@audio_bp.route('/sample-bank', methods=['GET'])
+@cross_origin()
+def get_sample_bank_stats():
+    """الحصول على إحصائيات بنك عينات المؤثرات"""
+    return jsonify(sample_bank.get_stats())
+
+@audio_bp.route('/sample-bank', methods=['DELETE'])
+@cross_origin()
+def clear_sample_bank():
+    """إفراغ بنك عينات المؤثرات"""
+    sample_bank.clear()
+    return jsonify({'success': True})
+
 @audio_bp.route('/mix-audio', methods=['POST'])
 @cross_origin()
 def mix_audio():
@@ -413,17 +589,42 @@ def mix_audio():
         movie_id = data.get('movie_id')
         scene_id = data.get('scene_id')
         
-        if not audio_ids:
+        # المسارات بالتفصيل: [{'audio_id', 'volume', 'start', 'envelope'}]
+        tracks = data.get('tracks')
+        if tracks is None:
+            tracks = [
+                {'audio_id': audio_id, 'volume': volumes[i] if i < len(volumes) else 1.0}
+                for i, audio_id in enumerate(audio_ids)
+            ]
+        
+        if not tracks:
             return jsonify({'success': False, 'error': 'Audio IDs are required'}), 400
         
+        # الإتقان: جهارة مستهدفة وحد للقمة الحقيقية، وخفض الموسيقى تحت الحوار
+        master = data.get('master', {})
+        ducking = data.get('ducking', True)
+        if ducking is True:
+            ducking = {}
+        elif not ducking:
+            ducking = None
+        
+        for track in tracks:
+            if not track.get('audio_id'):
+                return jsonify({'success': False, 'error': 'Each track needs an audio_id'}), 400
+            envelope = track.get('envelope') or []
+            if any(not isinstance(point, (list, tuple)) or len(point) != 2 for point in envelope):
+                return jsonify({'success': False, 'error': 'Envelope points must be [seconds, gain] pairs'}), 400
+        
         # إنشاء مهمة خلط
         task = AudioTask(
             task_type='mix',
             movie_id=movie_id,
             scene_id=scene_id,
             parameters=json.dumps({
-                'audio_ids': audio_ids,
-                'volumes': volumes
+                'audio_ids': [track['audio_id'] for track in tracks],
+                'tracks': tracks,
+                'master': master,
+                'ducking': ducking
             }),
             status='processing'
         )
@@ -431,11 +632,7 @@ def mix_audio():
         db.session.commit()
         
         # بدء خلط الصوت في خيط منفصل
-        thread = threading.Thread(
-            target=mix_audio_async,
-            args=(task.id, audio_ids, volumes)
-        )
-        thread.start()
+        start_background(mix_audio_async, task.id, tracks, master, ducking)
         
         return jsonify({
             'success': True,
@@ -447,7 +644,7 @@ def mix_audio():
         logger.error(f"Error in mix_audio: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def mix_audio_async(task_id, audio_ids, volumes):
+def mix_audio_async(task_id, tracks, master=None, ducking=None):
     """خلط الصوت بشكل غير متزامن"""
     try:
         task = AudioTask.query.get(task_id)
@@ -457,51 +654,61 @@ def mix_audio_async(task_id, audio_ids, volumes):
         task.progress = 20
         db.session.commit()
         
-        # تحميل الملفات الصوتية
-        audio_tracks = []
-        for audio_id in audio_ids:
-            audio_content = AudioContent.query.get(audio_id)
-            if audio_content and audio_content.file_path:
-                import librosa
-                audio_data, _ = librosa.load(audio_content.file_path, sr=audio_generator.sample_rate)
-                audio_tracks.append(audio_data)
-        
-        if not audio_tracks:
+        # المسارات تُقرأ من ملفاتها أثناء الخلط ولا تُحمل في الذاكرة
+        mix_tracks = []
+        for track in tracks:
+            audio_content = AudioContent.query.get(track['audio_id'])
+            if audio_content and audio_content.file_path and os.path.exists(audio_content.file_path):
+                # الكلام المولد يتحكم في خفض بقية المسارات
+                default_role = 'dialogue' if audio_content.content_type == 'voice' else audio_content.content_type
+                mix_tracks.append({
+                    'path': audio_content.file_path,
+                    'gain': track.get('volume', 1.0),
+                    'start': track.get('start', 0.0),
+                    'envelope': track.get('envelope'),
+                    'role': track.get('role') or default_role
+                })
+        
+        if not mix_tracks:
             task.status = 'failed'
             task.error_message = 'No valid audio tracks found'
             db.session.commit()
             return
         
-        task.progress = 60
+        task.progress = 40
         db.session.commit()
         
-        # خلط المسارات
-        mixed_audio = audio_generator.mix_audio(audio_tracks, volumes)
-        
-        if mixed_audio is None:
-            task.status = 'failed'
-            task.error_message = 'Failed to mix audio tracks'
-            db.session.commit()
-            return
-        
-        task.progress = 90
-        db.session.commit()
-        
-        # حفظ الملف المخلوط
+        # خلط المسارات وإتقانها وكتابة الناتج كتلة بكتلة
         filename = f"mixed_{task_id}_{uuid.uuid4().hex[:8]}.wav"
         file_path = os.path.join(GENERATED_AUDIO_DIR, filename)
+        sample_rate = audio_generator.sample_rate
+        master = master or {}
+        
+        mastering = audio_generator.master_mix(
+            mix_tracks,
+            file_path,
+            target_lufs=float(master.get('target_lufs', TARGET_LUFS)),
+            true_peak_db=float(master.get('true_peak_db', TRUE_PEAK_DB)),
+            ducking=ducking
+        )
         
-        if audio_generator.save_audio(mixed_audio, file_path):
+        if mastering is not None:
+            frames = mastering['frames']
+            loudness = mastering['input_loudness']
+            logger.info(
+                f"Mastered mix for task {task_id}: "
+                f"{loudness if loudness is None else round(loudness, 1)} LUFS, gain {mastering['gain_db']:+.1f} dB"
+            )
             # إنشاء سجل المحتوى الصوتي
             audio_content = AudioContent(
                 movie_id=task.movie_id,
                 scene_id=task.scene_id,
                 content_type='mixed',
                 title=f"Mixed Audio - {task_id}",
-                description=f"Mixed audio from {len(audio_tracks)} tracks",
+                description=f"Mixed audio from {len(mix_tracks)} tracks at {mastering['target_lufs']} LUFS",
                 file_path=file_path,
-                duration=len(mixed_audio) / audio_generator.sample_rate,
-                sample_rate=audio_generator.sample_rate,
+                duration=frames / sample_rate,
+                sample_rate=sample_rate,
                 channels=1,
                 model_used='mixer',
                 generation_params=task.parameters,
@@ -518,7 +725,7 @@ def mix_audio_async(task_id, audio_ids, volumes):
             logger.info(f"Audio mixing completed for task {task_id}")
         else:
             task.status = 'failed'
-            task.error_message = 'Failed to save mixed audio'
+            task.error_message = 'Failed to mix audio tracks'
             db.session.commit()
             
     except Exception as e:
@@ -529,6 +736,109 @@ def mix_audio_async(task_id, audio_ids, volumes):
             task.error_message = str(e)
             db.session.commit()
 
+@audio_bp.route('/apply-effects', methods=['POST'])
+@cross_origin()
+def apply_effects():
+    """تطبيق سلسلة مؤثرات على محتوى صوتي موجود"""
+    try:
+        data = request.json
+        audio_id = data.get('audio_id')
+        effects = data.get('effects', [])
+        
+        if not audio_id or not effects:
+            return jsonify({'success': False, 'error': 'audio_id and effects are required'}), 400
+        
+        unknown = [effect.get('type') for effect in effects if effect.get('type') not in EFFECT_TYPES]
+        if unknown:
+            return jsonify({'success': False, 'error': f'Unknown effect types: {unknown}'}), 400
+        
+        source = AudioContent.query.get(audio_id)
+        if not source or not source.file_path or not os.path.exists(source.file_path):
+            return jsonify({'success': False, 'error': 'Audio file not found'}), 404
+        
+        # إنشاء مهمة المؤثرات
+        task = AudioTask(
+            task_type='effects',
+            movie_id=source.movie_id,
+            scene_id=source.scene_id,
+            parameters=json.dumps({
+                'audio_id': audio_id,
+                'effects': effects
+            }),
+            status='processing'
+        )
+        db.session.add(task)
+        db.session.commit()
+        
+        start_background(apply_effects_async, task.id, source.id, effects)
+        
+        return jsonify({
+            'success': True,
+            'task_id': task.id,
+            'message': 'Effects processing started'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error in apply_effects: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def apply_effects_async(task_id, audio_id, effects):
+    """تطبيق المؤثرات كتلة بكتلة بشكل غير متزامن"""
+    try:
+        task = AudioTask.query.get(task_id)
+        source = AudioContent.query.get(audio_id)
+        if not task or not source:
+            return
+        
+        task.progress = 20
+        db.session.commit()
+        
+        filename = f"effects_{task_id}_{uuid.uuid4().hex[:8]}.wav"
+        file_path = os.path.join(GENERATED_AUDIO_DIR, filename)
+        
+        blocks, sample_rate, channels = audio_generator.stream_effects(source.file_path, effects)
+        frames = audio_generator.save_audio_stream(blocks, file_path, sample_rate, channels)
+        
+        if frames is not None:
+            audio_content = AudioContent(
+                movie_id=source.movie_id,
+                scene_id=source.scene_id,
+                content_type=source.content_type,
+                title=f"{source.title or 'Audio'} (effects)",
+                description=f"Effects: {', '.join(effect['type'] for effect in effects)}",
+                text_content=source.text_content,
+                file_path=file_path,
+                duration=frames / sample_rate,
+                sample_rate=sample_rate,
+                channels=channels,
+                voice_type=source.voice_type,
+                language=source.language,
+                model_used='effects_engine',
+                generation_params=task.parameters,
+                status='completed'
+            )
+            db.session.add(audio_content)
+            
+            task.status = 'completed'
+            task.result_path = file_path
+            task.progress = 100
+            db.session.commit()
+            
+            logger.info(f"Effects processing completed for task {task_id}")
+        else:
+            task.status = 'failed'
+            task.error_message = 'Failed to apply effects'
+            db.session.commit()
+            
+    except Exception as e:
+        logger.error(f"Error in apply_effects_async: {str(e)}")
+        db.session.rollback()
+        task = AudioTask.query.get(task_id)
+        if task:
+            task.status = 'failed'
+            task.error_message = str(e)
+            db.session.commit()
+
 @audio_bp.route('/tasks/<int:task_id>', methods=['GET'])
 @cross_origin()
 def get_audio_task_status(task_id):
@@ -0,0 +1,113 @@
+import os
+import json
+import shutil
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+import soundfile as sf
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AudioProbe:
+    """قراءة مدة الملف الصوتي ومعدل عيناته وقنواته من الترويسة فقط، مع ذاكرة صغيرة"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.environ.get('AUDIO_PROBE_CACHE_SIZE', 1024))
+        self.ffprobe = shutil.which(os.environ.get('FFPROBE_BINARY', 'ffprobe'))
+        # (المسار، وقت التعديل، الحجم) -> المعلومات؛ تعديل الملف يغير المفتاح
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def probe(self, file_path):
+        """معلومات الملف (duration, sample_rate, channels, samples, format) أو None"""
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            logger.error(f"Error probing audio: {str(e)}")
+            return None
+        key = (os.path.realpath(file_path), stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return dict(self.entries[key])
+            self.misses += 1
+
+        info = self._probe_header(file_path) or self._probe_ffprobe(file_path)
+        if info is None:
+            logger.error(f"Error probing audio: unsupported file {file_path}")
+            return None
+
+        with self.lock:
+            self.entries[key] = info
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return dict(info)
+
+    def _probe_header(self, file_path):
+        """قراءة ترويسة الصيغ التي تدعمها libsndfile (WAV وFLAC وOGG...)"""
+        try:
+            info = sf.info(file_path)
+        except Exception:
+            return None
+        if not info.samplerate:
+            return None
+        return {
+            'duration': info.frames / info.samplerate,
+            'sample_rate': info.samplerate,
+            'channels': info.channels,
+            'samples': info.frames,
+            'format': info.format.lower()
+        }
+
+    def _probe_ffprobe(self, file_path):
+        """الصيغ المضغوطة الأخرى عبر ffprobe دون فك الصوت"""
+        if not self.ffprobe:
+            return None
+        command = [
+            self.ffprobe, '-v', 'error', '-select_streams', 'a:0',
+            '-show_entries', 'stream=sample_rate,channels,duration:format=duration,format_name',
+            '-of', 'json', file_path
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=30)
+            if result.returncode != 0:
+                return None
+            data = json.loads(result.stdout)
+            stream = (data.get('streams') or [{}])[0]
+            container = data.get('format', {})
+            sample_rate = int(stream.get('sample_rate') or 0)
+            duration = float(stream.get('duration') or container.get('duration') or 0)
+        except (subprocess.SubprocessError, ValueError) as e:
+            logger.warning(f"ffprobe failed for {file_path}: {str(e)}")
+            return None
+        if not sample_rate:
+            return None
+        return {
+            'duration': duration,
+            'sample_rate': sample_rate,
+            'channels': int(stream.get('channels') or 1),
+            'samples': int(round(duration * sample_rate)),
+            'format': container.get('format_name', '').split(',')[0]
+        }
+
+    def get_stats(self):
+        """إحصائيات الذاكرة"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'ffprobe': bool(self.ffprobe)
+            }
+
+# إنشاء مثيل عام للاستخدام
+audio_probe = AudioProbe()
@@ -0,0 +1,86 @@
+import os
+import logging
+import numpy as np
+import soundfile as sf
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# حجم الكتلة بالعينات: الذاكرة المستخدمة تتناسب معه لا مع المدة
+BLOCK_SIZE = int(os.environ.get('AUDIO_STREAM_BLOCK', 65536))
+
+def rechunk(blocks, block_size=BLOCK_SIZE):
+    """إعادة تقطيع تدفق كتل بأطوال متفاوتة إلى كتل ثابتة الطول (الأخيرة قد تكون أقصر)"""
+    buffer = np.zeros(block_size, dtype=np.float32)
+    filled = 0
+
+    for block in blocks:
+        position = 0
+        while position < len(block):
+            count = min(block_size - filled, len(block) - position)
+            buffer[filled:filled + count] = block[position:position + count]
+            filled += count
+            position += count
+            if filled == block_size:
+                yield buffer.copy()
+                filled = 0
+
+    if filled:
+        yield buffer[:filled].copy()
+
+class LookaheadLimiter:
+    """تطبيع تدريجي بدل التطبيع بأقصى قيمة في الملف كله
+
+    الإشارة تتأخر كتلة واحدة، فيُعرف أعلى مستوى قادم قبل إخراج العينات،
+    ويُخفض الكسب تدريجياً عبر الكتلة الحالية حتى لا تتجاوز أي عينة الحد.
+    الكسب لا يرتفع أبداً، فالنتيجة تقارب التطبيع الكلي دون حمل الملف في الذاكرة.
+    """
+
+    def __init__(self, ceiling=0.8, max_gain=20.0):
+        self.ceiling = ceiling
+        self.max_gain = max_gain
+
+    def process(self, blocks):
+        """تمرير كتل الصوت عبر المحدد"""
+        gain = self.max_gain
+        pending = None
+
+        for block in blocks:
+            if pending is not None:
+                peak = max(np.max(np.abs(pending)), np.max(np.abs(block)) if len(block) else 0.0)
+                next_gain = min(gain, self._target(peak))
+                yield self._apply(pending, gain, next_gain)
+                gain = next_gain
+            else:
+                # الكتلة الأولى: الكسب الابتدائي من مستواها هي
+                gain = min(gain, self._target(np.max(np.abs(block)) if len(block) else 0.0))
+            pending = block
+
+        if pending is not None:
+            yield self._apply(pending, gain, gain)
+
+    def _target(self, peak):
+        """الكسب اللازم حتى لا تتجاوز القمة الحد"""
+        if peak <= 0:
+            return self.max_gain
+        return min(self.max_gain, self.ceiling / peak)
+
+    def _apply(self, block, start_gain, end_gain):
+        """تطبيق كسب ينتقل خطياً من قيمة إلى أخرى عبر الكتلة"""
+        if start_gain == end_gain:
+            return (block * start_gain).astype(np.float32, copy=False)
+        ramp = np.linspace(start_gain, end_gain, len(block), dtype=np.float32)
+        return block * ramp
+
+def write_stream(blocks, file_path, sample_rate, subtype='PCM_16', channels=1):
+    """كتابة تدفق الكتل مباشرة إلى ملف WAV، ويعيد عدد العينات المكتوبة"""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    frames = 0
+    with sf.SoundFile(file_path, 'w', samplerate=sample_rate, channels=channels, subtype=subtype) as output:
+        for block in blocks:
+            output.write(block)
+            frames += len(block)
+
+    logger.info(f"Streamed {frames} samples to: {file_path}")
+    return frames
@@ -0,0 +1,98 @@
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from flask import current_app
+from src.services.audio_generator import audio_generator
+from src.services.tts_cache import tts_cache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "المتحدث: النص" بالنقطتين اللاتينية أو العربية
+SPEAKER_PATTERN = re.compile(r'^\s*([^:：\n]{1,40}?)\s*[:：]\s*(.+)$')
+
+def parse_dialogue(dialogue):
+    """تقسيم حوار المشهد إلى سطور مع اسم المتحدث إن وُجد"""
+    lines = []
+    for raw in (dialogue or '').splitlines():
+        raw = raw.strip()
+        if not raw:
+            continue
+        match = SPEAKER_PATTERN.match(raw)
+        if match:
+            lines.append({'speaker': match.group(1).strip(), 'text': match.group(2).strip()})
+        else:
+            lines.append({'speaker': None, 'text': raw})
+    return lines
+
+class DialogueBatcher:
+    def __init__(self, max_workers=None, scenario_url=None):
+        self.max_workers = max_workers or int(os.environ.get('TTS_BATCH_WORKERS', 4))
+        self.scenario_url = (scenario_url or os.environ.get('SCENARIO_SERVICE_URL', 'http://localhost:5000')).rstrip('/')
+        # مجمع محدود مشترك بين كل الدفعات حتى لا تتضاعف الخيوط مع الطلبات
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tts-batch')
+
+    def fetch_scene_lines(self, movie_id, scene_id=None):
+        """جلب سطور الحوار من خدمة السيناريو لمشهد واحد أو للفيلم كله"""
+        response = requests.get(f"{self.scenario_url}/api/movies/{movie_id}/scenes", timeout=10)
+        response.raise_for_status()
+
+        lines = []
+        for scene in response.json():
+            if scene_id is not None and scene.get('id') != scene_id:
+                continue
+            for line in parse_dialogue(scene.get('dialogue')):
+                line['scene_id'] = scene.get('id')
+                lines.append(line)
+        return lines
+
+    def synthesize(self, lines, on_line=None):
+        """توليد السطور عبر المجمع، ويعيد النتائج بترتيب السطور
+
+        on_line(index, result) يُستدعى في الخيط المستدعي عند اكتمال كل سطر.
+        النتيجة قاموس بمعلومات الملف، أو None عند الفشل.
+        """
+        app = current_app._get_current_object()
+        futures = {
+            self.executor.submit(self._synthesize_line, app, line): index
+            for index, line in enumerate(lines)
+        }
+
+        results = [None] * len(lines)
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                logger.error(f"Error synthesizing line {index}: {str(e)}")
+            if on_line:
+                on_line(index, results[index])
+        return results
+
+    def _synthesize_line(self, app, line):
+        """توليد سطر واحد عبر مخزن السطور (يعمل في خيط من المجمع)"""
+        text = line['text']
+        engine = line['engine']
+        voice_type = line['voice_type']
+        language = line['language']
+
+        with app.app_context():
+            entry, cached = tts_cache.get_or_create(
+                text, engine, voice_type, language,
+                lambda file_path: audio_generator.synthesize_to_file(text, file_path, engine, voice_type, language)
+            )
+            if not entry:
+                return None
+            # قيم مستقلة عن جلسة قاعدة البيانات الخاصة بهذا الخيط
+            return {
+                'file_path': entry.file_path,
+                'duration': entry.duration,
+                'sample_rate': entry.sample_rate,
+                'channels': entry.channels,
+                'cached': cached
+            }
+
+# إنشاء مثيل عام للاستخدام
+dialogue_batcher = DialogueBatcher()
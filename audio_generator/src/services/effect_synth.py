@@ -0,0 +1,125 @@
+import numpy as np
+from src.services.sample_bank import sample_bank, PRIMITIVES
+
+# مؤثرات مكونة من أحداث قصيرة متكررة: الفاصل بين الأحداث بالثواني
+EVENT_INTERVALS = {
+    'footsteps': 0.5,
+    'door_knock': 0.2
+}
+
+# عدد طرقات الباب
+KNOCK_COUNT = 3
+
+# طول كل مقطع مأخوذ من حلقة الضوضاء، ومدة التداخل بين المقاطع المتتالية
+SEGMENT_SECONDS = 2.0
+CROSSFADE_SECONDS = 0.05
+
+class EffectSynthesizer:
+    def __init__(self, sample_rate=22050, bank=None):
+        self.sample_rate = sample_rate
+        self.bank = bank or sample_bank
+        self.segment_samples = int(SEGMENT_SECONDS * sample_rate)
+        self.crossfade_samples = int(CROSSFADE_SECONDS * sample_rate)
+        # تداخل بقدرة ثابتة حتى لا ينخفض مستوى الضوضاء عند الحدود
+        ramp = np.linspace(0, np.pi / 2, self.crossfade_samples, dtype=np.float32)
+        self.fade_in = np.sin(ramp)
+        self.fade_out = np.cos(ramp)
+
+    def render_blocks(self, effect_type, duration, block_size, seed=None, params=None):
+        """مولد كتل المؤثر (float32) دون تطبيع، بزمن مطلق متصل عبر الكتل
+
+        المؤثر يُركب من عينات البنك الجاهزة: كل مقطع أو حدث يختار نسخته
+        وإزاحته من البذرة ورقمه، فالنتيجة لا تعتمد على حجم الكتلة.
+        """
+        duration_samples = int(duration * self.sample_rate)
+        # بذرة ثابتة طوال المؤثر حتى لو لم تُحدد
+        if seed is None:
+            seed = int(np.random.default_rng().integers(2 ** 32))
+
+        for start in range(0, duration_samples, block_size):
+            count = min(block_size, duration_samples - start)
+            # الزمن بدقة float64 حتى لا يفقد الدقة في المؤثرات الطويلة
+            t = (start + np.arange(count)) / self.sample_rate
+
+            if effect_type in EVENT_INTERVALS:
+                block = self._render_events(effect_type, start, count, duration_samples, seed, params)
+            else:
+                block = self._render_loop(effect_type, start, count, seed, params)
+
+                if effect_type == 'wind':
+                    # إضافة تذبذب
+                    block *= 0.5 + 0.5 * np.sin(2 * np.pi * 0.5 * t)
+                elif effect_type == 'applause':
+                    # إضافة تذبذب للتصفيق
+                    block *= 0.7 + 0.3 * np.sin(2 * np.pi * 8 * t)
+
+            yield block.astype(np.float32, copy=False)
+
+    def _read_segment(self, effect_type, index, seed, params, first, count):
+        """قراءة count عينة من المقطع بدءاً من موضع نسبي لبدايته؛ نسخته وإزاحته مشتقتان من رقمه"""
+        rng = np.random.default_rng([seed, index])
+        variant = int(rng.integers(self.bank.variants))
+        loop = self.bank.primitive(effect_type, params, self.sample_rate, variant)
+        shift = int(rng.integers(len(loop)))
+        return np.take(loop, np.arange(shift + first, shift + first + count), mode='wrap')
+
+    def _render_loop(self, effect_type, start, count, seed, params):
+        """تركيب ضوضاء مستمرة من مقاطع حلقات البنك مع تداخل عند حدود المقاطع"""
+        block = np.zeros(count, dtype=np.float32)
+        end = start + count
+
+        for index in range(start // self.segment_samples, (end - 1) // self.segment_samples + 1):
+            segment_start = index * self.segment_samples
+            lo = max(start, segment_start)
+            hi = min(end, segment_start + self.segment_samples)
+            samples = self._read_segment(effect_type, index, seed, params, lo - segment_start, hi - lo)
+
+            # بداية المقطع تتداخل مع امتداد المقطع السابق
+            fade_end = min(hi, segment_start + self.crossfade_samples)
+            if index > 0 and lo < fade_end:
+                fade = slice(lo - segment_start, fade_end - segment_start)
+                previous = self._read_segment(
+                    effect_type, index - 1, seed, params,
+                    self.segment_samples + fade.start, fade.stop - fade.start
+                )
+                head = fade.stop - fade.start
+                samples[:head] = samples[:head] * self.fade_in[fade] + previous * self.fade_out[fade]
+
+            block[lo - start:hi - start] = samples
+
+        return block
+
+    def _render_events(self, effect_type, start, count, duration_samples, seed, params):
+        """رسم الأحداث التي تتقاطع مع الكتلة [start, start + count)"""
+        interval_samples = int(EVENT_INTERVALS[effect_type] * self.sample_rate)
+        event_samples = int(PRIMITIVES[effect_type]['seconds'] * self.sample_rate)
+
+        block = np.zeros(count, dtype=np.float32)
+        end = start + count
+
+        event_count = -(-duration_samples // interval_samples)
+        if effect_type == 'door_knock':
+            event_count = min(event_count, KNOCK_COUNT)
+
+        first = max(0, (start - event_samples) // interval_samples)
+        last = min(event_count, end // interval_samples + 1)
+
+        for index in range(first, last):
+            event_start = index * interval_samples
+            # الحدث الذي لا يكتمل قبل نهاية المؤثر يُحذف كما في التوليد الكامل
+            if event_start + event_samples >= duration_samples:
+                continue
+            if event_start >= end or event_start + event_samples <= start:
+                continue
+
+            # نسخة الحدث وشدته مشتقتان من رقمه حتى يتطابق عبر حدود الكتل
+            rng = np.random.default_rng([seed, index])
+            variant = int(rng.integers(self.bank.variants))
+            gain = float(rng.uniform(0.85, 1.0))
+            event = self.bank.primitive(effect_type, params, self.sample_rate, variant)
+
+            lo = max(start, event_start)
+            hi = min(end, event_start + event_samples)
+            block[lo - start:hi - start] += gain * event[lo - event_start:hi - event_start]
+
+        return block
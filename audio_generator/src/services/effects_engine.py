@@ -0,0 +1,222 @@
+import logging
+from functools import lru_cache
+import numpy as np
+from scipy import fft, signal
+from src.services.audio_stream import BLOCK_SIZE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# مراحل الكسب التي تُدمج في مرحلة واحدة عند تتاليها
+FUSABLE_EFFECTS = ('gain', 'fade_in', 'fade_out')
+EFFECT_TYPES = FUSABLE_EFFECTS + ('reverb', 'echo')
+
+# أطول استجابة نبضية مسموحة بالثواني
+MAX_DECAY_TIME = 10.0
+
+@lru_cache(maxsize=32)
+def impulse_response(decay_time, predelay, damping, sample_rate, channel):
+    """استجابة نبضية صناعية لغرفة: ضوضاء متناقصة أسياً مع تخميد للترددات العالية
+
+    لكل قناة بذرة مختلفة حتى يكون الصدى المجسم غير مترابط بين القناتين.
+    """
+    rng = np.random.default_rng([int(decay_time * 1000), int(predelay * 1000), channel])
+    predelay_samples = int(predelay * sample_rate)
+    # RT60: زمن انخفاض المستوى 60 ديسيبل
+    length = int(decay_time * sample_rate)
+    t = np.arange(length) / sample_rate
+    tail = rng.standard_normal(length) * np.power(10.0, -3.0 * t / decay_time)
+
+    if damping > 0:
+        cutoff = max(0.05, 1.0 - damping)
+        if cutoff < 1.0:
+            tail = signal.sosfilt(signal.butter(2, cutoff, 'low', output='sos'), tail)
+
+    response = np.zeros(predelay_samples + length, dtype=np.float32)
+    response[predelay_samples:] = tail / np.sqrt(np.sum(tail ** 2))
+    response.setflags(write=False)
+    return response
+
+@lru_cache(maxsize=32)
+def impulse_spectrum(decay_time, predelay, damping, sample_rate, channel, nfft):
+    """طيف الاستجابة النبضية بطول FFT معين، يُحسب مرة واحدة لكل إعداد"""
+    spectrum = fft.rfft(impulse_response(decay_time, predelay, damping, sample_rate, channel), nfft)
+    spectrum.setflags(write=False)
+    return spectrum
+
+class GainStage:
+    """مراحل كسب وظهور واختفاء متتالية مدموجة في ضرب واحد لكل كتلة"""
+
+    def __init__(self, effects, sample_rate, total_samples):
+        self.total_samples = total_samples
+        self.gain = 1.0
+        self.fade_ins = []
+        self.fade_outs = []
+        self.position = 0
+
+        for effect_type, params in effects:
+            if effect_type == 'gain':
+                if 'db' in params:
+                    self.gain *= 10 ** (float(params['db']) / 20)
+                else:
+                    self.gain *= float(params.get('gain', 1.0))
+            else:
+                samples = min(int(float(params.get('duration', 1.0)) * sample_rate), total_samples)
+                if samples > 0:
+                    (self.fade_ins if effect_type == 'fade_in' else self.fade_outs).append(samples)
+
+    def process(self, block):
+        start = self.position
+        end = start + len(block)
+        self.position = end
+
+        fade_in = [n for n in self.fade_ins if start < n]
+        fade_out = [n for n in self.fade_outs if end > self.total_samples - n]
+        if not fade_in and not fade_out:
+            return block * np.float32(self.gain)
+
+        # منحنى واحد يجمع كل المنحنيات التي تتقاطع مع الكتلة
+        positions = np.arange(start, end, dtype=np.float32)
+        envelope = np.full(len(block), self.gain, dtype=np.float32)
+        for n in fade_in:
+            envelope *= np.clip(positions / max(n - 1, 1), 0.0, 1.0)
+        for n in fade_out:
+            envelope *= np.clip((self.total_samples - 1 - positions) / max(n - 1, 1), 0.0, 1.0)
+        return block * envelope[:, None]
+
+class ConvolutionReverb:
+    """صدى غرفة بالالتفاف عبر FFT، بطريقة الجمع المتداخل كتلة بكتلة"""
+
+    def __init__(self, params, sample_rate, channels):
+        # المعاملات القديمة: delay تأخير الانعكاس الأول وdecay مستوى الصدى
+        if 'delay' in params and 'predelay' not in params:
+            params = dict(params, predelay=params['delay'])
+        if 'decay' in params and 'wet' not in params:
+            params = dict(params, wet=params['decay'])
+        self.decay_time = min(max(float(params.get('decay_time', 1.2)), 0.05), MAX_DECAY_TIME)
+        self.predelay = max(float(params.get('predelay', 0.02)), 0.0)
+        self.damping = float(params.get('damping', 0.5))
+        self.wet = float(params.get('wet', 0.3))
+        self.dry = float(params.get('dry', 1.0))
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.response_length = len(impulse_response(
+            self.decay_time, self.predelay, self.damping, sample_rate, 0
+        ))
+        # ذيل الالتفاف الذي يُضاف إلى الكتل التالية
+        self.tail = np.zeros((self.response_length - 1, channels), dtype=np.float32)
+        self.nfft = 0
+        self.spectra = None
+
+    def _prepare(self, block_length):
+        """اختيار طول FFT يكفي لأطول كتلة وجلب أطياف الاستجابة المخزنة"""
+        self.nfft = fft.next_fast_len(block_length + self.response_length - 1, real=True)
+        self.spectra = np.stack([
+            impulse_spectrum(self.decay_time, self.predelay, self.damping, self.sample_rate, channel, self.nfft)
+            for channel in range(self.channels)
+        ], axis=1)
+
+    def process(self, block):
+        count = len(block)
+        if count + self.response_length - 1 > self.nfft:
+            self._prepare(count)
+
+        convolved = fft.irfft(fft.rfft(block, self.nfft, axis=0) * self.spectra, self.nfft, axis=0)
+        convolved = convolved[:count + self.response_length - 1].astype(np.float32)
+
+        # إضافة ذيل الكتل السابقة ثم الاحتفاظ بما يتجاوز هذه الكتلة
+        convolved[:len(self.tail)] += self.tail
+        self.tail = convolved[count:].copy()
+
+        return block * np.float32(self.dry) + convolved[:count] * np.float32(self.wet)
+
+class FeedbackEcho:
+    """صدى متعدد النقرات مع تغذية راجعة: مرشح IIR يُحسب مقطعاً بطول التأخير في كل خطوة
+
+    wet[n] = Σ gain_i · x[n - delay_i] + feedback · wet[n - delay_max]
+    """
+
+    def __init__(self, params, sample_rate, channels):
+        delay = float(params.get('delay', 0.3))
+        decay = float(params.get('decay', 0.5))
+        taps = params.get('taps') or [[delay, decay]]
+        self.taps = [(max(1, int(float(seconds) * sample_rate)), float(gain)) for seconds, gain in taps]
+        self.feedback = float(params.get('feedback', decay if not params.get('taps') else 0.0))
+        self.wet = float(params.get('wet', 1.0))
+        self.loop = max(tap_delay for tap_delay, _ in self.taps)
+        # تاريخ الدخل والصدى بطول أطول تأخير
+        self.input_history = np.zeros((self.loop, channels), dtype=np.float32)
+        self.wet_history = np.zeros((self.loop, channels), dtype=np.float32)
+
+    def process(self, block):
+        count = len(block)
+        extended = np.concatenate([self.input_history, block])
+
+        # الجزء غير الراجع: مجموع النسخ المؤخرة من الدخل
+        wet = np.zeros((self.loop + count, block.shape[1]), dtype=np.float32)
+        for tap_delay, gain in self.taps:
+            wet[self.loop:] += gain * extended[self.loop - tap_delay:self.loop - tap_delay + count]
+
+        # الجزء الراجع: كل مقطع بطول الحلقة يعتمد فقط على مقاطع سابقة
+        wet[:self.loop] = self.wet_history
+        if self.feedback:
+            for start in range(self.loop, self.loop + count, self.loop):
+                end = min(start + self.loop, self.loop + count)
+                wet[start:end] += self.feedback * wet[start - self.loop:end - self.loop]
+
+        self.input_history = extended[-self.loop:]
+        self.wet_history = wet[-self.loop:]
+        return block + wet[self.loop:] * np.float32(self.wet)
+
+def compile_effects(effects, sample_rate, total_samples, channels=1):
+    """تحويل قائمة المؤثرات إلى مراحل، مع دمج مراحل الكسب المتتالية"""
+    stages = []
+    pending = []
+
+    for effect in effects:
+        effect_type = effect.get('type')
+        params = effect.get('params', {})
+
+        if effect_type in FUSABLE_EFFECTS:
+            pending.append((effect_type, params))
+            continue
+
+        if pending:
+            stages.append(GainStage(pending, sample_rate, total_samples))
+            pending = []
+
+        if effect_type == 'reverb':
+            stages.append(ConvolutionReverb(params, sample_rate, channels))
+        elif effect_type == 'echo':
+            stages.append(FeedbackEcho(params, sample_rate, channels))
+        else:
+            # المسار عبر API يرفض الأنواع غير المعروفة مسبقاً؛ هنا تُتجاوز حتى تُطبق البقية
+            logger.warning(f"Skipping unknown effect type: {effect_type}")
+
+    if pending:
+        stages.append(GainStage(pending, sample_rate, total_samples))
+    return stages
+
+class EffectsChain:
+    def __init__(self, effects, sample_rate, total_samples, channels=1):
+        self.channels = channels
+        self.stages = compile_effects(effects, sample_rate, total_samples, channels)
+
+    def process(self, blocks):
+        """تمرير كتل (عينات) أو (عينات، قنوات) عبر المراحل بالترتيب، بنفس أطوالها"""
+        for block in blocks:
+            mono = block.ndim == 1
+            block = np.asarray(block, dtype=np.float32).reshape(len(block), -1)
+            for stage in self.stages:
+                block = stage.process(block)
+            yield block[:, 0] if mono else block
+
+    def apply(self, audio, block_size=BLOCK_SIZE):
+        """تطبيق السلسلة على مصفوفة كاملة كتلة بكتلة، في مخزن ناتج واحد"""
+        output = np.empty(audio.shape, dtype=np.float32)
+        blocks = (audio[start:start + block_size] for start in range(0, len(audio), block_size))
+        position = 0
+        for block in self.process(blocks):
+            output[position:position + len(block)] = block
+            position += len(block)
+        return output
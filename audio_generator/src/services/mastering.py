@@ -0,0 +1,227 @@
+import os
+import math
+import logging
+import numpy as np
+import soundfile as sf
+from scipy import signal
+from scipy.ndimage import minimum_filter1d
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# إعدادات الإتقان الافتراضية
+TARGET_LUFS = float(os.environ.get('MASTER_TARGET_LUFS', -16.0))
+TRUE_PEAK_DB = float(os.environ.get('MASTER_TRUE_PEAK_DB', -1.0))
+
+# بوابات ITU-R BS.1770: كتل 400ms بتداخل 75%
+GATE_BLOCK_SECONDS = 0.4
+GATE_STEP_SECONDS = 0.1
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# مرحلتا مرشح K: رف عالٍ ثم تمرير عالٍ (معاملات BS.1770 لأي معدل عينات)
+SHELF_GAIN_DB = 3.999843853973347
+SHELF_FREQUENCY = 1681.974450955533
+SHELF_Q = 0.7071752369554196
+HIGHPASS_FREQUENCY = 38.13547087602444
+HIGHPASS_Q = 0.5003270373238773
+
+# ضعف أخذ العينات لتقدير القمة الحقيقية بين العينات
+TRUE_PEAK_OVERSAMPLE = 4
+TRUE_PEAK_CONTEXT = 12
+
+def k_weighting(sample_rate):
+    """معاملات مرشح K بصيغة SOS"""
+    K = math.tan(math.pi * SHELF_FREQUENCY / sample_rate)
+    Vh = 10 ** (SHELF_GAIN_DB / 20)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1.0 + K / SHELF_Q + K * K
+    shelf = [
+        (Vh + Vb * K / SHELF_Q + K * K) / a0,
+        2.0 * (K * K - Vh) / a0,
+        (Vh - Vb * K / SHELF_Q + K * K) / a0,
+        1.0,
+        2.0 * (K * K - 1.0) / a0,
+        (1.0 - K / SHELF_Q + K * K) / a0
+    ]
+
+    K = math.tan(math.pi * HIGHPASS_FREQUENCY / sample_rate)
+    a0 = 1.0 + K / HIGHPASS_Q + K * K
+    highpass = [1.0, -2.0, 1.0, 1.0, 2.0 * (K * K - 1.0) / a0, (1.0 - K / HIGHPASS_Q + K * K) / a0]
+
+    return np.array([shelf, highpass])
+
+def as_frames(block):
+    """كتلة (عينات) أو (عينات، قنوات) كمصفوفة ثنائية الأبعاد float32"""
+    block = np.asarray(block, dtype=np.float32)
+    return block.reshape(len(block), -1)
+
+class LoudnessMeter:
+    """قياس الجهارة المتكاملة (LUFS) بتمرير واحد على الكتل دون حفظ الإشارة"""
+
+    def __init__(self, sample_rate, channels=1):
+        self.sos = k_weighting(sample_rate)
+        self.zi = np.zeros((self.sos.shape[0], 2, channels))
+        self.step = int(GATE_STEP_SECONDS * sample_rate)
+        self.steps_per_block = int(round(GATE_BLOCK_SECONDS / GATE_STEP_SECONDS))
+        # مجموع مربعات الجزء غير المكتمل من خطوة 100ms
+        self.partial = np.zeros(channels)
+        self.partial_count = 0
+        # طاقة كل خطوة 100ms لكل قناة (بضعة كيلوبايتات لكل ساعة)
+        self.step_energy = []
+
+    def process(self, block):
+        """تمرير كتلة عبر المقياس، وتعيدها كما هي حتى يمكن وضعه داخل سلسلة"""
+        frames = as_frames(block)
+        weighted, self.zi = signal.sosfilt(self.sos, frames, axis=0, zi=self.zi)
+        squared = weighted ** 2
+
+        position = 0
+        while position < len(squared):
+            take = min(self.step - self.partial_count, len(squared) - position)
+            self.partial += squared[position:position + take].sum(axis=0)
+            self.partial_count += take
+            position += take
+            if self.partial_count == self.step:
+                self.step_energy.append(self.partial / self.step)
+                self.partial = np.zeros_like(self.partial)
+                self.partial_count = 0
+        return block
+
+    def integrated_loudness(self):
+        """الجهارة المتكاملة بعد البوابتين المطلقة والنسبية، أو None للصمت"""
+        if len(self.step_energy) < self.steps_per_block:
+            return None
+
+        steps = np.array(self.step_energy)
+        # متوسط كل كتلة 400ms من أربع خطوات متتالية
+        windows = np.lib.stride_tricks.sliding_window_view(steps, self.steps_per_block, axis=0)
+        block_energy = windows.mean(axis=-1).sum(axis=1)
+
+        with np.errstate(divide='ignore'):
+            block_loudness = -0.691 + 10 * np.log10(block_energy)
+
+        gated = block_energy[block_loudness > ABSOLUTE_GATE_LUFS]
+        if not len(gated):
+            return None
+        relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+
+        gated = block_energy[(block_loudness > ABSOLUTE_GATE_LUFS) & (block_loudness > relative_gate)]
+        return float(-0.691 + 10 * np.log10(gated.mean()))
+
+class TruePeakLimiter:
+    """محدد بقمة حقيقية (مقدرة بضعف العينات 4 مرات) مع نظر مسبق وارتخاء خطي
+
+    الكسب عند كل عينة هو متوسط متحرك لأدنى كسب مطلوب في نافذة النظر المسبق،
+    فلا يتجاوز الكسب المطلوب عند أي قمة، ثم يرتفع بعدها بمعدل الارتخاء فقط.
+    """
+
+    def __init__(self, sample_rate, ceiling_db=TRUE_PEAK_DB, lookahead=0.005, release=0.1):
+        self.ceiling = 10 ** (ceiling_db / 20)
+        self.lookahead = max(1, int(lookahead * sample_rate))
+        self.release_step = 1.0 / max(1, int(release * sample_rate))
+
+    def process(self, blocks):
+        """تمرير كتل عبر المحدد؛ الكتل الخارجة قد تختلف أطوالها لكن مجموعها نفسه"""
+        history = None
+        pending = None
+        minimum_history = None
+        gain = 1.0
+
+        for block in blocks:
+            frames = as_frames(block)
+            if pending is None:
+                channels = frames.shape[1]
+                history = np.zeros((TRUE_PEAK_CONTEXT, channels), dtype=np.float32)
+                pending = np.zeros((0, channels), dtype=np.float32)
+
+            pending = np.concatenate([pending, frames])
+            count = len(pending) - self.lookahead - TRUE_PEAK_CONTEXT
+            if count <= 0:
+                continue
+
+            output, gain, minimum_history = self._limit(history, pending, count, gain, minimum_history)
+            history = np.concatenate([history, pending[:count]])[-TRUE_PEAK_CONTEXT:]
+            pending = pending[count:]
+            yield output
+
+        if pending is not None and len(pending):
+            # ما بقي في النظر المسبق يُخرج مع صمت بعده
+            silence = np.zeros((self.lookahead + TRUE_PEAK_CONTEXT, pending.shape[1]), dtype=np.float32)
+            padded = np.concatenate([pending, silence])
+            output, _, _ = self._limit(history, padded, len(pending), gain, minimum_history)
+            yield output
+
+    def _required_gain(self, history, frames):
+        """الكسب اللازم لكل عينة حتى لا تتجاوز القمة الحقيقية الحد"""
+        window = np.concatenate([history, frames])
+        oversampled = signal.resample_poly(window, TRUE_PEAK_OVERSAMPLE, 1, axis=0)
+        peaks = np.abs(oversampled).reshape(len(window), TRUE_PEAK_OVERSAMPLE, -1).max(axis=(1, 2))
+        peaks = np.maximum(peaks, np.abs(window).max(axis=1))[len(history):]
+        return np.minimum(1.0, self.ceiling / np.maximum(peaks, 1e-9)).astype(np.float32)
+
+    def _limit(self, history, frames, count, gain, minimum_history):
+        """حساب كسب أول count عينة وتطبيقه"""
+        required = self._required_gain(history, frames)
+
+        # أدنى كسب مطلوب في النافذة [n, n + lookahead]
+        size = self.lookahead + 1
+        minimum = minimum_filter1d(required, size, mode='nearest')[size // 2:size // 2 + count]
+
+        # قبل أول عينة يُفترض أدنى كسب النافذة الأولى حتى لا تمر قمة في البداية دون تحديد
+        if minimum_history is None:
+            minimum_history = np.full(self.lookahead, minimum[0], dtype=np.float32)
+
+        # متوسط متحرك بطول النافذة لتنعيم الهبوط
+        extended = np.concatenate([minimum_history, minimum])
+        cumulative = np.concatenate([[0.0], np.cumsum(extended, dtype=np.float64)])
+        smoothed = (cumulative[size:] - cumulative[:-size]) / size
+
+        # ارتفاع خطي محدود: g[n] = min(smoothed[n], g[n-1] + step)
+        sequence = np.concatenate([[gain], smoothed])
+        ramp = self.release_step * np.arange(len(sequence))
+        limited = (np.minimum.accumulate(sequence - ramp) + ramp)[1:].astype(np.float32)
+
+        return frames[:count] * limited[:, None], float(limited[-1]), extended[-self.lookahead:]
+
+class Ducker:
+    """خفض الموسيقى تحت الحوار: مستوى الحوار يتحكم في كسب المسار الآخر"""
+
+    def __init__(self, sample_rate, depth_db=10.0, threshold_db=-40.0, attack=0.05, release=0.5, window=0.05):
+        self.duck_gain = 10 ** (-abs(depth_db) / 20)
+        self.threshold = 10 ** (threshold_db / 10)
+        # مستوى الحوار بمرشح أحادي القطب على مربع الإشارة
+        self.level_coefficient = math.exp(-1.0 / max(1.0, window * sample_rate))
+        self.attack_coefficient = math.exp(-1.0 / max(1.0, attack * sample_rate))
+        self.release_step = (1.0 - self.duck_gain) / max(1, int(release * sample_rate))
+        self.level_state = np.zeros(1)
+        self.attack_state = None
+        self.gain = 1.0
+
+    def process(self, block, key):
+        """تطبيق الخفض على كتلة بحسب كتلة الحوار المقابلة"""
+        frames = as_frames(block)
+        key_power = as_frames(key).astype(np.float64) ** 2
+        level, self.level_state = signal.lfilter(
+            [1 - self.level_coefficient], [1, -self.level_coefficient],
+            key_power.mean(axis=1), zi=self.level_state
+        )
+        target = np.where(level > self.threshold, self.duck_gain, 1.0)
+
+        # الهبوط فوري والعودة خطية بطيئة
+        sequence = np.concatenate([[self.gain], target])
+        ramp = self.release_step * np.arange(len(sequence))
+        released = (np.minimum.accumulate(sequence - ramp) + ramp)[1:]
+        self.gain = float(released[-1])
+
+        # تنعيم الهبوط بزمن الهجوم
+        if self.attack_state is None:
+            self.attack_state = np.array([released[0] * self.attack_coefficient])
+        gain, self.attack_state = signal.lfilter(
+            [1 - self.attack_coefficient], [1, -self.attack_coefficient], released, zi=self.attack_state
+        )
+        return (frames * gain[:, None].astype(np.float32)).reshape(np.shape(block))
+
+def read_blocks(file_path, block_size):
+    """قراءة ملف كتلة بكتلة (عينات، قنوات)"""
+    return sf.blocks(file_path, blocksize=block_size, dtype='float32', always_2d=True)
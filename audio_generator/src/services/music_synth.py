@@ -0,0 +1,102 @@
+import numpy as np
+from scipy import signal
+
+# النغمات حسب المزاج
+MOOD_SCALES = {
+    'happy': [261.63, 293.66, 329.63, 349.23, 392.00, 440.00, 493.88],  # C major
+    'sad': [220.00, 246.94, 261.63, 293.66, 329.63, 349.23, 392.00],    # A minor
+    'dramatic': [146.83, 164.81, 174.61, 196.00, 220.00, 246.94, 261.63], # D minor
+    'peaceful': [174.61, 196.00, 220.00, 233.08, 261.63, 293.66, 329.63], # F major
+    'action': [146.83, 164.81, 185.00, 196.00, 220.00, 246.94, 277.18],   # D minor pentatonic
+    'neutral': [261.63, 293.66, 329.63, 349.23, 392.00, 440.00, 493.88]   # C major
+}
+
+# حجم جدول الموجة (قوة للعدد 2 حتى يكون الفهرس أعلى بتات الطور)
+WAVETABLE_BITS = 12
+WAVETABLE_SIZE = 1 << WAVETABLE_BITS
+
+# عدد النبضات التي تُولد في عملية مصفوفية واحدة
+BEATS_PER_BLOCK = 256
+
+NOTE_AMPLITUDE = 0.3
+PEAK_LEVEL = 0.7
+
+class MusicSynthesizer:
+    def __init__(self, sample_rate=22050):
+        self.sample_rate = sample_rate
+        # دورة جيب واحدة تُقرأ بدلاً من حساب sin لكل عينة
+        self.wavetable = np.sin(
+            2 * np.pi * np.arange(WAVETABLE_SIZE) / WAVETABLE_SIZE
+        ).astype(np.float32) * NOTE_AMPLITUDE
+        # مرشح تمرير منخفض للحصول على صوت أكثر نعومة، بصيغة أقسام من الدرجة الثانية
+        self.lowpass = signal.butter(4, 0.3, 'low', output='sos').astype(np.float32)
+        self.envelopes = {}
+
+    def envelope(self, beat_samples):
+        """غلاف النغمة (ظهور واختفاء 10%) محسوب مرة واحدة لكل طول نبضة"""
+        if beat_samples not in self.envelopes:
+            envelope = np.ones(beat_samples, dtype=np.float32)
+            fade_samples = int(0.1 * beat_samples)
+            if fade_samples > 0:
+                envelope[:fade_samples] = np.linspace(0, 1, fade_samples, dtype=np.float32)
+                envelope[-fade_samples:] = np.linspace(1, 0, fade_samples, dtype=np.float32)
+            self.envelopes[beat_samples] = envelope
+        return self.envelopes[beat_samples]
+
+    def render_blocks(self, duration_seconds, mood='neutral', tempo=120, seed=None, block_size=None):
+        """مولد كتل صوتية مرشحة (float32) بالترتيب، دون تطبيع
+
+        block_size يحد عدد العينات المولدة في كل خطوة (نبضة واحدة على الأقل)
+        """
+        duration_samples = int(duration_seconds * self.sample_rate)
+        beat_samples = int(60.0 / tempo * self.sample_rate)
+        if beat_samples <= 0 or duration_samples <= 0:
+            return
+
+        scale = np.asarray(MOOD_SCALES.get(mood, MOOD_SCALES['neutral']))
+        rng = np.random.default_rng(seed)
+
+        # النبضات الكاملة فقط، والباقي في النهاية صمت
+        beat_count = duration_samples // beat_samples
+        frequencies = rng.choice(scale, size=beat_count)
+
+        # مراكم طور بنقطة ثابتة 32 بت: الالتفاف الطبيعي للأعداد الصحيحة هو دورة الموجة
+        increments = np.round(frequencies * (2 ** 32 / self.sample_rate)).astype(np.uint32)
+        shift = np.uint32(32 - WAVETABLE_BITS)
+
+        envelope = self.envelope(beat_samples)
+        sample_index = np.arange(beat_samples, dtype=np.uint32)
+        zi = np.zeros((self.lowpass.shape[0], 2), dtype=np.float32)
+
+        beats_per_block = max(1, block_size // beat_samples) if block_size else BEATS_PER_BLOCK
+
+        for first in range(0, beat_count, beats_per_block):
+            # الطور لكل (نغمة، عينة)؛ كل نغمة تبدأ من طور صفري
+            phases = np.multiply.outer(increments[first:first + beats_per_block], sample_index)
+            notes = self.wavetable[phases >> shift]
+            notes *= envelope
+
+            block, zi = signal.sosfilt(self.lowpass, notes.ravel(), zi=zi)
+            yield block.astype(np.float32, copy=False)
+
+        # ذيل الصمت يمر عبر المرشح أيضاً حتى تكتمل استجابته
+        tail_samples = duration_samples - beat_count * beat_samples
+        step = block_size or tail_samples
+        for position in range(0, tail_samples, max(1, step)):
+            count = min(step, tail_samples - position)
+            tail, zi = signal.sosfilt(self.lowpass, np.zeros(count, dtype=np.float32), zi=zi)
+            yield tail.astype(np.float32, copy=False)
+
+    def render(self, duration_seconds, mood='neutral', tempo=120, seed=None):
+        """توليد المقطوعة كاملة في مخزن float32 واحد ثم تطبيعها"""
+        music = np.zeros(int(duration_seconds * self.sample_rate), dtype=np.float32)
+
+        position = 0
+        for block in self.render_blocks(duration_seconds, mood, tempo, seed):
+            music[position:position + len(block)] = block
+            position += len(block)
+
+        peak = np.max(np.abs(music)) if len(music) else 0.0
+        if peak > 0:
+            music *= PEAK_LEVEL / peak
+        return music
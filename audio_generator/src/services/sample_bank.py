@@ -0,0 +1,200 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+import numpy as np
+from scipy import signal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# يتغير عند تغيير طريقة توليد العينات حتى تُهمل الملفات القديمة
+BANK_VERSION = 1
+
+# طول حلقات الضوضاء المولدة مسبقاً بالثواني
+LOOP_SECONDS = 8.0
+
+# العينات الأساسية لكل مؤثر
+PRIMITIVES = {
+    'rain': {'kind': 'noise', 'amplitude': 0.3, 'std': 0.1, 'filter': (4, 0.7, 'high')},
+    'wind': {'kind': 'noise', 'amplitude': 0.4, 'std': 0.1, 'filter': (4, 0.2, 'low')},
+    'applause': {'kind': 'noise', 'amplitude': 0.6, 'std': 0.2, 'filter': None},
+    'white_noise': {'kind': 'noise', 'amplitude': 0.2, 'std': 0.1, 'filter': None},
+    'footsteps': {'kind': 'event', 'seconds': 0.1, 'decay': 20},
+    'door_knock': {'kind': 'event', 'seconds': 0.1, 'decay': 30, 'frequency': 200}
+}
+
+@lru_cache(maxsize=64)
+def get_filter(order, cutoff, btype):
+    """معاملات مرشح Butterworth بصيغة SOS، تُصمم مرة واحدة لكل إعداد"""
+    return signal.butter(order, cutoff, btype, output='sos').astype(np.float32)
+
+class SampleBank:
+    def __init__(self, bank_dir=None, max_bytes=None, variants=None):
+        self.bank_dir = bank_dir or os.environ.get(
+            'SAMPLE_BANK_DIR',
+            os.path.join(os.path.dirname(__file__), '..', 'cache', 'sample_bank')
+        )
+        self.max_bytes = max_bytes or int(os.environ.get('SAMPLE_BANK_MAX_MB', 256)) * 1024 * 1024
+        self.variants = variants or int(os.environ.get('SAMPLE_BANK_VARIANTS', 4))
+        # ملفات مفتوحة بالذاكرة في هذه العملية (الصفحات نفسها مشتركة بين العمليات)
+        self.mapped = OrderedDict()
+        self.max_mapped = 64
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.bank_dir, exist_ok=True)
+
+    def resolve(self, effect_type, params=None):
+        """تعريف العينة الأساسية بعد دمج معاملات الطلب"""
+        primitive = dict(PRIMITIVES.get(effect_type, PRIMITIVES['white_noise']))
+        params = params or {}
+
+        if primitive.get('filter') and params.get('cutoff') is not None:
+            order, _, btype = primitive['filter']
+            primitive['filter'] = (order, float(params['cutoff']), btype)
+        for name in ('decay', 'frequency'):
+            if name in primitive and params.get(name) is not None:
+                primitive[name] = float(params[name])
+
+        return primitive
+
+    def make_key(self, primitive, sample_rate, variant):
+        """مفتاح العينة: تعريفها بعد دمج المعاملات ومعدل العينات والنسخة"""
+        payload = {
+            'version': BANK_VERSION,
+            'primitive': primitive,
+            'sample_rate': sample_rate,
+            'variant': variant
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+    def entry_path(self, key):
+        """مسار ملف العينة"""
+        return os.path.join(self.bank_dir, f"{key}.npy")
+
+    def primitive(self, effect_type, params, sample_rate, variant):
+        """العينة الأساسية كمصفوفة مربوطة بالذاكرة للقراءة فقط، وتُولد عند أول طلب"""
+        primitive = self.resolve(effect_type, params)
+        key = self.make_key(primitive, sample_rate, variant)
+
+        with self.lock:
+            if key in self.mapped:
+                self.mapped.move_to_end(key)
+                self.hits += 1
+                return self.mapped[key]
+
+        path = self.entry_path(key)
+        if os.path.exists(path):
+            with self.lock:
+                self.hits += 1
+        else:
+            with self.lock:
+                self.misses += 1
+            samples = self.render_primitive(primitive, sample_rate, variant)
+            # نشر ذري حتى لا تقرأ عملية أخرى ملفاً ناقصاً، وملف مؤقت لكل خيط حتى لا يتسابق كاتبان عليه
+            partial_path = os.path.join(
+                self.bank_dir, f".{key}.{os.getpid()}.{threading.get_ident()}.partial.npy"
+            )
+            np.save(partial_path, samples)
+            os.replace(partial_path, path)
+            self.evict(keep=path)
+
+        try:
+            os.utime(path, None)
+            mapped = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            # حُذف بالإخلاء من عملية أخرى: يُولد من جديد
+            return self.primitive(effect_type, params, sample_rate, variant)
+
+        with self.lock:
+            self.mapped[key] = mapped
+            while len(self.mapped) > self.max_mapped:
+                self.mapped.popitem(last=False)
+        return mapped
+
+    def render_primitive(self, primitive, sample_rate, variant):
+        """توليد عينة أساسية واحدة (float32)"""
+        rng = np.random.default_rng([BANK_VERSION, variant, sample_rate])
+
+        if primitive['kind'] == 'noise':
+            count = int(LOOP_SECONDS * sample_rate)
+            noise = primitive['amplitude'] * rng.normal(0, primitive['std'], count).astype(np.float32)
+            if primitive.get('filter'):
+                sos = get_filter(*primitive['filter'])
+                # تسخين المرشح بنصف ثانية حتى لا تبدأ الحلقة بعابر الاستجابة
+                warmup = primitive['amplitude'] * rng.normal(0, primitive['std'], sample_rate // 2).astype(np.float32)
+                _, zi = signal.sosfilt(sos, warmup, zi=np.zeros((sos.shape[0], 2), dtype=np.float32))
+                noise, _ = signal.sosfilt(sos, noise, zi=zi)
+            return noise.astype(np.float32)
+
+        # حدث قصير (خطوة أو طرقة)
+        count = int(primitive['seconds'] * sample_rate)
+        t = np.arange(count, dtype=np.float32) / sample_rate
+        envelope = np.exp(-t * primitive['decay'])
+        if 'frequency' in primitive:
+            return (0.8 * np.sin(2 * np.pi * primitive['frequency'] * t) * envelope).astype(np.float32)
+        return (0.5 * rng.normal(0, 0.1, count) * envelope).astype(np.float32)
+
+    def _entries(self):
+        """ملفات البنك مع وقت آخر استخدام والحجم"""
+        entries = []
+        for name in os.listdir(self.bank_dir):
+            if name.startswith('.') or not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.bank_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self, keep=None):
+        """حذف الأقدم استخداماً حتى يعود الحجم تحت الحد"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                # العمليات التي ربطت الملف تحتفظ بنسختها حتى تغلقه
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """إفراغ البنك"""
+        with self.lock:
+            self.mapped.clear()
+        for _, _, path in self._entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self):
+        """إحصائيات البنك"""
+        entries = self._entries()
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(entries),
+                'size_bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                'variants': self.variants,
+                'mapped': len(self.mapped),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+# إنشاء مثيل عام للاستخدام
+sample_bank = SampleBank()
@@ -0,0 +1,252 @@
+import os
+import math
+import struct
+import logging
+from fractions import Fraction
+import numpy as np
+import soundfile as sf
+from scipy import signal
+from src.services.audio_stream import BLOCK_SIZE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# صيغ WAV التي يمكن ربطها بالذاكرة مباشرة: (رمز الصيغة، عدد البتات) -> (النوع، معامل التحويل)
+MAPPABLE_FORMATS = {
+    (1, 16): ('<i2', 1.0 / 32768),
+    (1, 32): ('<i4', 1.0 / 2147483648),
+    (3, 32): ('<f4', 1.0),
+    (3, 64): ('<f8', 1.0)
+}
+
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# نصف طول مرشح resample_poly بالنسبة لأكبر المعاملين
+RESAMPLE_HALF_LENGTH = 10
+
+def wav_layout(file_path):
+    """قراءة ترويسة WAV فقط، ويعيد موضع البيانات وصيغتها أو None إذا تعذر الربط بالذاكرة"""
+    try:
+        with open(file_path, 'rb') as f:
+            riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+            if riff != b'RIFF' or wave != b'WAVE':
+                return None
+
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                chunk_id, chunk_size = struct.unpack('<4sI', header)
+
+                if chunk_id == b'fmt ':
+                    body = f.read(chunk_size)
+                    format_tag, channels, sample_rate = struct.unpack('<HHI', body[:8])
+                    bits = struct.unpack('<H', body[14:16])[0]
+                    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                        format_tag = struct.unpack('<H', body[24:26])[0]
+                    fmt = (format_tag, channels, sample_rate, bits)
+                elif chunk_id == b'data':
+                    if fmt is None or (fmt[0], fmt[3]) not in MAPPABLE_FORMATS:
+                        return None
+                    format_tag, channels, sample_rate, bits = fmt
+                    dtype, scale = MAPPABLE_FORMATS[(format_tag, bits)]
+                    frame_bytes = channels * bits // 8
+                    offset = f.tell()
+                    # ملفات البث تكتب 0xFFFFFFFF أو حجماً أكبر من الملف، فالعدد لا يتجاوز ما هو موجود فعلاً
+                    available = (os.fstat(f.fileno()).st_size - offset) // frame_bytes
+                    return {
+                        'offset': offset,
+                        'frames': min(chunk_size // frame_bytes, available),
+                        'channels': channels,
+                        'sample_rate': sample_rate,
+                        'dtype': dtype,
+                        'scale': scale
+                    }
+                else:
+                    f.seek(chunk_size, 1)
+
+                # المقاطع بأطوال فردية تُكمل ببايت
+                if chunk_size % 2:
+                    f.seek(1, 1)
+    except (OSError, struct.error):
+        return None
+
+class TrackSource:
+    """قراءة مقاطع من ملف صوتي كعينات أحادية float32، بالربط بالذاكرة حين يمكن"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        layout = wav_layout(file_path)
+        self.data = None
+
+        if layout and layout['frames'] > 0:
+            try:
+                self.data = np.memmap(
+                    file_path, dtype=layout['dtype'], mode='r', offset=layout['offset'],
+                    shape=(layout['frames'], layout['channels'])
+                )
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not memory-map {file_path}, decoding instead: {str(e)}")
+
+        if self.data is not None:
+            self.file = None
+            self.scale = layout['scale']
+            self.frames = layout['frames']
+            self.sample_rate = layout['sample_rate']
+        else:
+            # الصيغ الأخرى تُفك كتلة بكتلة
+            self.file = sf.SoundFile(file_path)
+            self.frames = self.file.frames
+            self.sample_rate = self.file.samplerate
+
+    @property
+    def memory_mapped(self):
+        return self.data is not None
+
+    def read(self, start, count):
+        """قراءة count عينة بدءاً من start، مع صمت خارج حدود الملف"""
+        output = np.zeros(count, dtype=np.float32)
+        lo = max(0, start)
+        hi = min(self.frames, start + count)
+        if lo >= hi:
+            return output
+
+        if self.data is not None:
+            samples = self.data[lo:hi]
+            samples = samples.mean(axis=1, dtype=np.float32) if samples.shape[1] > 1 else samples[:, 0]
+            output[lo - start:hi - start] = samples * np.float32(self.scale)
+        else:
+            self.file.seek(lo)
+            samples = self.file.read(hi - lo, dtype='float32', always_2d=True)
+            output[lo - start:lo - start + len(samples)] = samples.mean(axis=1)
+        return output
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.data = None
+
+class StreamingResampler:
+    """تغيير معدل العينات على دفعات بنفس نتيجة resample_poly على الإشارة كاملة
+
+    كل دفعة تُقرأ مع سياق من الجانبين أطول من نصف المرشح، ثم يُحتفظ بوسطها فقط.
+    """
+
+    def __init__(self, source, sample_rate, block_size=BLOCK_SIZE):
+        self.source = source
+        self.sample_rate = sample_rate
+        ratio = Fraction(sample_rate, source.sample_rate)
+        self.up, self.down = ratio.numerator, ratio.denominator
+
+        # سياق بمضاعفات down حتى تبدأ مخرجات كل دفعة عند عينة صحيحة
+        half_width = math.ceil(RESAMPLE_HALF_LENGTH * max(self.up, self.down) / self.up) + 1
+        self.context = -(-half_width // self.down) * self.down
+        steps = max(1, block_size // self.up)
+        self.chunk_in = steps * self.down
+        self.chunk_out = steps * self.up
+
+        self.frames = -(-source.frames * self.up // self.down)
+        self.cached_index = None
+        self.cached_chunk = None
+
+    def _chunk(self, index):
+        """مخرجات الدفعة رقم index (آخر دفعة محفوظة لأن القراءة متتابعة)"""
+        if index != self.cached_index:
+            start = index * self.chunk_in - self.context
+            samples = self.source.read(start, self.chunk_in + 2 * self.context)
+            resampled = signal.resample_poly(samples, self.up, self.down).astype(np.float32)
+            skip = self.context * self.up // self.down
+            self.cached_chunk = resampled[skip:skip + self.chunk_out]
+            self.cached_index = index
+        return self.cached_chunk
+
+    def read(self, start, count):
+        """قراءة count عينة بالمعدل الجديد بدءاً من start"""
+        output = np.zeros(count, dtype=np.float32)
+        lo = max(0, start)
+        hi = min(self.frames, start + count)
+
+        position = lo
+        while position < hi:
+            index = position // self.chunk_out
+            chunk = self._chunk(index)
+            offset = position - index * self.chunk_out
+            take = min(hi - position, self.chunk_out - offset)
+            output[position - start:position - start + take] = chunk[offset:offset + take]
+            position += take
+        return output
+
+    def close(self):
+        self.source.close()
+
+class StreamMixer:
+    def __init__(self, sample_rate=22050, block_size=BLOCK_SIZE):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+
+    def open_track(self, track):
+        """تجهيز مسار للقراءة: {'path', 'start' بالثواني, 'gain', 'envelope': [[ثانية، كسب], ...]}"""
+        source = TrackSource(track['path'])
+        reader = source
+        if source.sample_rate != self.sample_rate:
+            # تغيير المعدل فقط عند اختلافه
+            reader = StreamingResampler(source, self.sample_rate, self.block_size)
+
+        start = int(round(float(track.get('start', 0.0)) * self.sample_rate))
+        envelope = sorted(track.get('envelope') or [])
+
+        return {
+            'reader': reader,
+            'start': max(0, start),
+            'end': max(0, start) + reader.frames,
+            'gain': float(track.get('gain', 1.0)),
+            # أزمنة الغلاف نسبية لبداية المسار
+            'envelope_times': np.array([float(point[0]) for point in envelope]),
+            'envelope_gains': np.array([float(point[1]) for point in envelope], dtype=np.float32)
+        }
+
+    def mix_blocks(self, tracks):
+        """مولد كتل الخلط (float32) دون تطبيع؛ الذاكرة لا تعتمد على طول المسارات"""
+        for (block,) in self.mix_groups([tracks]):
+            yield block
+
+    def mix_groups(self, groups):
+        """خلط عدة مجموعات من المسارات بالتوازي، ويعيد لكل موضع كتلة لكل مجموعة بنفس الطول"""
+        opened = []
+        try:
+            for tracks in groups:
+                opened.append([self.open_track(track) for track in tracks])
+            ends = [track['end'] for group in opened for track in group]
+            if not ends:
+                return
+
+            total = max(ends)
+            for block_start in range(0, total, self.block_size):
+                count = min(self.block_size, total - block_start)
+                yield tuple(self._mix_block(group, block_start, count) for group in opened)
+        finally:
+            for group in opened:
+                for track in group:
+                    track['reader'].close()
+
+    def _mix_block(self, opened, block_start, count):
+        """جمع مساهمات المسارات في الكتلة [block_start, block_start + count)"""
+        block = np.zeros(count, dtype=np.float32)
+
+        for track in opened:
+            lo = max(block_start, track['start'])
+            hi = min(block_start + count, track['end'])
+            if lo >= hi:
+                continue
+
+            samples = track['reader'].read(lo - track['start'], hi - lo)
+            if len(track['envelope_times']):
+                t = (np.arange(lo, hi) - track['start']) / self.sample_rate
+                gain = np.interp(t, track['envelope_times'], track['envelope_gains']).astype(np.float32)
+                samples *= gain * np.float32(track['gain'])
+            else:
+                samples *= np.float32(track['gain'])
+            block[lo - block_start:hi - block_start] += samples
+
+        return block
@@ -0,0 +1,187 @@
+import os
+import re
+import shutil
+import hashlib
+import logging
+import threading
+import unicodedata
+from datetime import datetime
+from src.models.audio_content import TTSCacheEntry, db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# التطويل العربي لا يغير النطق
+TATWEEL = 'ـ'
+
+# أقصى مدة لانتظار توليد مماثل جارٍ قبل التوليد المستقل
+INFLIGHT_TIMEOUT = 120
+
+class TTSCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get(
+            'TTS_CACHE_DIR',
+            os.path.join(os.path.dirname(__file__), '..', 'tts_cache')
+        )
+        self.max_bytes = max_bytes or int(os.environ.get('TTS_CACHE_MAX_MB', 512)) * 1024 * 1024
+        self.inflight = {}  # مفتاح -> حدث يُطلق عند انتهاء التوليد
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def normalize_text(self, text):
+        """توحيد النص: صيغة يونيكود موحدة، بلا تطويل، ومسافات مفردة"""
+        text = unicodedata.normalize('NFKC', text or '')
+        text = text.replace(TATWEEL, '')
+        return re.sub(r'\s+', ' ', text).strip()
+
+    def make_key(self, text, engine, voice_type, language):
+        """مفتاح السطر: النص الموحد مع المحرك ونوع الصوت واللغة"""
+        payload = '\x1f'.join([self.normalize_text(text), engine or '', voice_type or '', language or ''])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def lookup(self, cache_key):
+        """البحث عن سطر مخزن، ويعيد السجل أو None"""
+        entry = TTSCacheEntry.query.filter_by(cache_key=cache_key).first()
+        if entry and not os.path.exists(entry.file_path):
+            db.session.delete(entry)
+            db.session.commit()
+            return None
+        return entry
+
+    def get_or_create(self, text, engine, voice_type, language, synthesize):
+        """إعادة سطر مخزن أو توليده مرة واحدة فقط حتى مع الطلبات المتزامنة
+
+        synthesize(file_path) يكتب ملف WAV ويعيد معلوماته (duration, sample_rate, channels) أو None.
+        يعيد (السجل، هل كان مخزناً) أو (None، False) عند الفشل.
+        """
+        cache_key = self.make_key(text, engine, voice_type, language)
+        waited = False
+
+        while True:
+            entry = self.lookup(cache_key)
+            if entry:
+                with self.lock:
+                    self.hits += 1
+                    if waited:
+                        self.deduplicated += 1
+                self._touch(entry)
+                return entry, True
+
+            with self.lock:
+                event = self.inflight.get(cache_key)
+                if event is None:
+                    # هذا الطلب يتولى التوليد والباقي ينتظره
+                    event = threading.Event()
+                    self.inflight[cache_key] = event
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                event.wait(INFLIGHT_TIMEOUT)
+                # انتهاء الانتظار أو فشل التوليد يعيد المحاولة من البداية
+                db.session.expire_all()
+                waited = True
+                continue
+
+            try:
+                with self.lock:
+                    self.misses += 1
+                return self._synthesize(cache_key, text, engine, voice_type, language, synthesize), False
+            finally:
+                with self.lock:
+                    self.inflight.pop(cache_key, None)
+                event.set()
+
+    def _synthesize(self, cache_key, text, engine, voice_type, language, synthesize):
+        """توليد السطر ونشره في المخزن"""
+        file_path = os.path.join(self.cache_dir, f"{cache_key}.wav")
+        partial_path = os.path.join(self.cache_dir, f".{cache_key}.{os.getpid()}.partial.wav")
+
+        info = synthesize(partial_path)
+        if not info or not os.path.exists(partial_path):
+            if os.path.exists(partial_path):
+                os.unlink(partial_path)
+            return None
+        os.replace(partial_path, file_path)
+
+        try:
+            entry = TTSCacheEntry(
+                cache_key=cache_key,
+                text_content=self.normalize_text(text),
+                engine=engine,
+                voice_type=voice_type,
+                language=language,
+                file_path=file_path,
+                file_size=os.path.getsize(file_path),
+                duration=info.get('duration'),
+                sample_rate=info.get('sample_rate'),
+                channels=info.get('channels')
+            )
+            db.session.add(entry)
+            db.session.commit()
+        except Exception as e:
+            # سجل أضافته عملية أخرى لنفس المفتاح
+            db.session.rollback()
+            logger.warning(f"Could not index TTS cache entry: {str(e)}")
+            entry = self.lookup(cache_key)
+
+        self.evict(keep=cache_key)
+        return entry
+
+    def _touch(self, entry):
+        """تحديث بيانات الاستخدام لسياسة LRU"""
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_used_at = datetime.utcnow()
+        db.session.commit()
+
+    def evict(self, keep=None):
+        """حذف الأقل استخداماً حتى يعود الحجم تحت الحد"""
+        total = db.session.query(db.func.coalesce(db.func.sum(TTSCacheEntry.file_size), 0)).scalar()
+        if total <= self.max_bytes:
+            return
+
+        for entry in TTSCacheEntry.query.order_by(TTSCacheEntry.last_used_at).all():
+            if total <= self.max_bytes:
+                break
+            if entry.cache_key == keep:
+                continue
+            total -= entry.file_size or 0
+            if os.path.exists(entry.file_path):
+                os.unlink(entry.file_path)
+            db.session.delete(entry)
+
+        db.session.commit()
+
+    def get_stats(self):
+        """إحصائيات المخزن"""
+        with self.lock:
+            hits, misses, deduplicated = self.hits, self.misses, self.deduplicated
+            inflight = len(self.inflight)
+        lookups = hits + misses
+
+        return {
+            'entries': TTSCacheEntry.query.count(),
+            'size_bytes': db.session.query(
+                db.func.coalesce(db.func.sum(TTSCacheEntry.file_size), 0)
+            ).scalar(),
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'deduplicated': deduplicated,
+            'inflight': inflight,
+            'hit_ratio': round(hits / lookups, 3) if lookups else 0.0
+        }
+
+def copy_file(source_path, destination_path):
+    """نسخ ملف بربط صلب إن أمكن"""
+    try:
+        os.link(source_path, destination_path)
+    except OSError:
+        shutil.copyfile(source_path, destination_path)
+
+# إنشاء مثيل عام للاستخدام
+tts_cache = TTSCache()
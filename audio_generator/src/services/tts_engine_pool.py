@@ -0,0 +1,241 @@
+import os
+import queue
+import atexit
+import logging
+import tempfile
+import threading
+import multiprocessing
+import numpy as np
+import soundfile as sf
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# خصائص الكلام الافتراضية لكل محرك
+DEFAULT_RATE = 150
+DEFAULT_VOLUME = 0.9
+
+# العمليات تُنشأ من جديد (spawn) لأن العملية الأم متعددة الخيوط
+START_METHOD = 'spawn'
+
+def default_engine_factory():
+    """إنشاء محرك pyttsx3 محلي (يعمل دون اتصال)"""
+    import pyttsx3
+    return pyttsx3.init()
+
+def select_voice(voices, voice_type, default_voice_id):
+    """معرف الصوت المطابق لنوع الصوت المطلوب، وإلا الصوت الافتراضي"""
+    if voices and voice_type and voice_type != 'default':
+        for voice in voices:
+            if voice_type.lower() in voice.name.lower():
+                return voice.id
+    return default_voice_id
+
+def _engine_worker(conn, engine_factory, rate, volume):
+    """حلقة عملية المحرك: تهيئة واحدة ثم خدمة الطلبات حتى إغلاق الأنبوب"""
+    try:
+        engine = (engine_factory or default_engine_factory)()
+        voices = engine.getProperty('voices') or []
+
+        # الصوت الافتراضي: صوت عربي إن وجد وإلا أول صوت متاح
+        default_voice_id = None
+        for voice in voices:
+            if 'ar' in voice.id.lower() or 'arabic' in voice.name.lower():
+                default_voice_id = voice.id
+                break
+        if default_voice_id is None and voices:
+            default_voice_id = voices[0].id
+
+        engine.setProperty('rate', rate)
+        engine.setProperty('volume', volume)
+
+        # ملف عمل واحد لكل عملية في الذاكرة المشتركة إن توفرت، يُعاد استخدامه لكل سطر
+        scratch_dir = tempfile.mkdtemp(prefix='tts-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        scratch_path = os.path.join(scratch_dir, 'line.wav')
+    except Exception as e:
+        conn.send(('error', str(e)))
+        conn.close()
+        return
+
+    conn.send(('ready', len(voices)))
+    current_voice_id = None
+
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+
+            text, voice_type = request
+            try:
+                # الصوت حالة خاصة بهذه العملية فلا يتأثر بها أي طلب آخر
+                voice_id = select_voice(voices, voice_type, default_voice_id)
+                if voice_id and voice_id != current_voice_id:
+                    engine.setProperty('voice', voice_id)
+                    current_voice_id = voice_id
+
+                engine.save_to_file(text, scratch_path)
+                engine.runAndWait()
+
+                samples, sample_rate = sf.read(scratch_path, dtype='float32')
+                if samples.ndim > 1:
+                    samples = samples.mean(axis=1).astype(np.float32)
+                conn.send(('ok', samples, sample_rate))
+            except Exception as e:
+                conn.send(('error', str(e)))
+    finally:
+        if os.path.exists(scratch_path):
+            os.unlink(scratch_path)
+        os.rmdir(scratch_dir)
+        conn.close()
+
+class TTSEnginePool:
+    def __init__(self, size=None, timeout=None, rate=DEFAULT_RATE, volume=DEFAULT_VOLUME, engine_factory=None):
+        self.size = size or int(os.environ.get('TTS_POOL_SIZE', 2))
+        self.timeout = timeout or float(os.environ.get('TTS_POOL_TIMEOUT', 60))
+        self.rate = rate
+        self.volume = volume
+        # يجب أن تكون دالة على مستوى وحدة حتى تُنقل إلى العملية الجديدة
+        self.engine_factory = engine_factory
+        self.context = multiprocessing.get_context(START_METHOD)
+        self.idle = queue.Queue()
+        self.workers = []
+        self.started = False
+        self.available = True
+        self.requests = 0
+        self.failures = 0
+        self.restarts = 0
+        self.lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def start(self):
+        """تشغيل عمليات المحركات (مرة واحدة عند أول طلب)"""
+        with self.lock:
+            if self.started:
+                return self.available
+            self.started = True
+
+            for _ in range(self.size):
+                worker = self._spawn()
+                if worker is None:
+                    break
+                self.workers.append(worker)
+                self.idle.put(worker)
+
+            self.available = bool(self.workers)
+            if self.available:
+                logger.info(f"TTS engine pool started with {len(self.workers)} engines")
+            return self.available
+
+    def _spawn(self):
+        """تشغيل عملية محرك وانتظار اكتمال تهيئتها، ويعيد (العملية، الأنبوب) أو None"""
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_engine_worker,
+            args=(child_conn, self.engine_factory, self.rate, self.volume),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+
+        try:
+            if not parent_conn.poll(self.timeout):
+                raise TimeoutError('engine initialization timed out')
+            status, detail = parent_conn.recv()
+            if status != 'ready':
+                raise RuntimeError(detail)
+        except Exception as e:
+            logger.error(f"Error initializing TTS engine: {str(e)}")
+            process.terminate()
+            parent_conn.close()
+            return None
+
+        return process, parent_conn
+
+    def synthesize(self, text, voice_type='default'):
+        """تحويل نص إلى عينات float32 عبر محرك متاح، ويعيد (العينات، معدل العينات) أو None"""
+        if not self.start():
+            return None
+
+        try:
+            worker = self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            logger.error("No TTS engine became available")
+            return None
+        process, conn = worker
+        with self.lock:
+            self.requests += 1
+
+        try:
+            conn.send((text, voice_type))
+            if not conn.poll(self.timeout):
+                raise TimeoutError('engine did not respond')
+            response = conn.recv()
+        except Exception as e:
+            # المحرك معطل: استبداله حتى لا يبقى المجمع أصغر
+            logger.error(f"TTS engine failed, restarting it: {str(e)}")
+            with self.lock:
+                self.failures += 1
+            worker = self._replace(worker)
+            if worker:
+                self.idle.put(worker)
+            return None
+
+        self.idle.put(worker)
+
+        if response[0] != 'ok':
+            logger.error(f"Error in TTS engine: {response[1]}")
+            with self.lock:
+                self.failures += 1
+            return None
+        return response[1], response[2]
+
+    def _replace(self, worker):
+        """إيقاف عملية محرك وتشغيل بديل لها"""
+        process, conn = worker
+        process.terminate()
+        process.join(1)
+        conn.close()
+
+        replacement = self._spawn()
+        with self.lock:
+            self.workers.remove(worker)
+            if replacement:
+                self.workers.append(replacement)
+                self.restarts += 1
+            self.available = bool(self.workers)
+        return replacement
+
+    def shutdown(self):
+        """إيقاف كل عمليات المحركات"""
+        with self.lock:
+            workers, self.workers = self.workers, []
+            self.started = False
+        self.idle = queue.Queue()
+
+        for process, conn in workers:
+            try:
+                conn.send(None)
+            except Exception:
+                pass
+            process.join(2)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+
+    def get_stats(self):
+        """إحصائيات المجمع"""
+        with self.lock:
+            return {
+                'size': self.size,
+                'started': self.started,
+                'available': self.available,
+                'engines': len(self.workers),
+                'idle': self.idle.qsize(),
+                'requests': self.requests,
+                'failures': self.failures,
+                'restarts': self.restarts
+            }
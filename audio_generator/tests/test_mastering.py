@@ -0,0 +1,75 @@
+import numpy as np
+from src.services.mastering import LoudnessMeter, TruePeakLimiter, Ducker
+
+SAMPLE_RATE = 48000
+
+def sine(frequency, seconds, amplitude=1.0, sample_rate=SAMPLE_RATE):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+def blocks_of(audio, size):
+    return [audio[start:start + size] for start in range(0, len(audio), size)]
+
+def limit(audio, block_size=4096, **kwargs):
+    limiter = TruePeakLimiter(SAMPLE_RATE, **kwargs)
+    return np.concatenate(list(limiter.process(blocks_of(audio, block_size)))).reshape(len(audio), -1)
+
+def test_loudness_of_full_scale_sine():
+    # BS.1770: جيب 997Hz بسعة كاملة على قناة واحدة = -3.01 LKFS
+    meter = LoudnessMeter(SAMPLE_RATE)
+    for block in blocks_of(sine(997, 5.0), 4800):
+        meter.process(block)
+    assert abs(meter.integrated_loudness() - (-3.01)) < 0.1
+
+def test_loudness_is_independent_of_block_size():
+    audio = sine(440, 3.0, 0.3)
+    results = []
+    for size in (100, 4096, len(audio)):
+        meter = LoudnessMeter(SAMPLE_RATE)
+        for block in blocks_of(audio, size):
+            meter.process(block)
+        results.append(meter.integrated_loudness())
+    assert max(results) - min(results) < 1e-6
+
+def test_loudness_of_silence_is_none():
+    meter = LoudnessMeter(SAMPLE_RATE)
+    meter.process(np.zeros(SAMPLE_RATE, dtype=np.float32))
+    assert meter.integrated_loudness() is None
+
+def test_limiter_keeps_length_and_ceiling():
+    audio = sine(1000, 2.0, 4.0)
+    output = limit(audio, block_size=1000)
+    ceiling = 10 ** (-1.0 / 20)
+    assert len(output) == len(audio)
+    assert np.abs(output).max() <= ceiling * 1.001
+
+def test_limiter_limits_transient_at_start():
+    # طرقة في أول 1ms بكسب +14dB يجب ألا تتجاوز الحد قبل امتلاء نافذة النظر المسبق
+    audio = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    knock = int(0.001 * SAMPLE_RATE)
+    audio[knock:knock + 48] = 10 ** (14 / 20) * 0.2 * np.hanning(48)
+    ceiling = 10 ** (-1.0 / 20)
+    assert np.abs(limit(audio)).max() <= ceiling * 1.001
+    assert np.abs(limit(audio[:knock + 48], block_size=16)).max() <= ceiling * 1.001
+
+def test_limiter_passes_quiet_audio_unchanged():
+    audio = sine(440, 1.0, 0.25)
+    assert np.allclose(limit(audio)[:, 0], audio, atol=1e-6)
+
+def test_ducker_lowers_music_under_dialogue_and_recovers():
+    ducker = Ducker(SAMPLE_RATE, depth_db=10.0, release=0.5)
+    music = np.ones(SAMPLE_RATE * 3, dtype=np.float32)
+    dialogue = np.zeros_like(music)
+    dialogue[SAMPLE_RATE // 2:SAMPLE_RATE] = sine(300, 0.5, 0.5)
+
+    output = np.concatenate([
+        ducker.process(music_block, key_block)
+        for music_block, key_block in zip(blocks_of(music, 1024), blocks_of(dialogue, 1024))
+    ])
+
+    assert len(output) == len(music)
+    assert np.allclose(output[:SAMPLE_RATE // 4], 1.0)
+    # أثناء الحوار ينخفض الكسب إلى -10dB تقريباً
+    assert abs(output[int(SAMPLE_RATE * 0.9)] - 10 ** (-10 / 20)) < 0.02
+    # ثم يعود بعد زمن الارتخاء
+    assert output[-1] > 0.99
@@ -0,0 +1,64 @@
+import os
+import threading
+import numpy as np
+from src.services.sample_bank import SampleBank
+
+SAMPLE_RATE = 8000
+
+def test_sample_bank_renders_once_and_maps_read_only(tmp_path):
+    bank = SampleBank(str(tmp_path), max_bytes=10 ** 7, variants=2)
+    first = bank.primitive('rain', {}, SAMPLE_RATE, 0)
+    again = bank.primitive('rain', {}, SAMPLE_RATE, 0)
+
+    assert again is first
+    assert not first.flags.writeable
+    assert bank.get_stats()['misses'] == 1
+
+    # بنك جديد على المجلد نفسه يقرأ الملف دون توليد
+    reopened = SampleBank(str(tmp_path), max_bytes=10 ** 7)
+    assert np.array_equal(reopened.primitive('rain', {}, SAMPLE_RATE, 0), first)
+    assert reopened.get_stats()['misses'] == 0
+
+def test_sample_bank_params_change_the_key(tmp_path):
+    bank = SampleBank(str(tmp_path), max_bytes=10 ** 7)
+    bank.primitive('door_knock', {}, SAMPLE_RATE, 0)
+    bank.primitive('door_knock', {'frequency': 400}, SAMPLE_RATE, 0)
+    assert bank.get_stats()['entries'] == 2
+
+def test_sample_bank_evicts_least_recently_used(tmp_path):
+    bank = SampleBank(str(tmp_path), max_bytes=10 ** 7)
+    paths = []
+    for variant in range(3):
+        bank.primitive('footsteps', {}, SAMPLE_RATE, variant)
+        key = bank.make_key(bank.resolve('footsteps'), SAMPLE_RATE, variant)
+        paths.append(bank.entry_path(key))
+        os.utime(paths[-1], (variant, variant))
+
+    bank.max_bytes = os.path.getsize(paths[0]) * 2
+    bank.evict()
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+
+def test_sample_bank_concurrent_misses_share_one_file(tmp_path):
+    for trial in range(10):
+        bank = SampleBank(str(tmp_path / str(trial)), max_bytes=10 ** 7)
+        barrier = threading.Barrier(4)
+        results, errors = [], []
+
+        def request():
+            barrier.wait()
+            try:
+                results.append(bank.primitive('rain', {}, SAMPLE_RATE, 0))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        assert errors == []
+        assert all(np.array_equal(result, results[0]) for result in results)
+        assert sorted(os.listdir(bank.bank_dir)) == [os.path.basename(
+            bank.entry_path(bank.make_key(bank.resolve('rain'), SAMPLE_RATE, 0))
+        )]
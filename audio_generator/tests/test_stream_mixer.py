@@ -0,0 +1,49 @@
+import struct
+import numpy as np
+import soundfile as sf
+from scipy import signal
+from src.services.stream_mixer import wav_layout, TrackSource, StreamingResampler
+
+def write_wav(path, audio, sample_rate, subtype='PCM_16'):
+    sf.write(path, audio, sample_rate, subtype=subtype)
+    return str(path)
+
+def test_track_source_maps_pcm_wav(tmp_path):
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, 8000).astype(np.float32)
+    source = TrackSource(write_wav(tmp_path / 'a.wav', audio, 16000, 'FLOAT'))
+    assert source.memory_mapped
+    assert np.array_equal(source.read(0, 8000), audio)
+    # صمت خارج حدود الملف
+    assert np.array_equal(source.read(-10, 10), np.zeros(10, dtype=np.float32))
+    assert np.array_equal(source.read(7990, 20)[10:], np.zeros(10, dtype=np.float32))
+
+def test_streaming_wav_size_is_clamped(tmp_path):
+    # ملفات البث تكتب 0xFFFFFFFF حجماً لمقطع البيانات
+    audio = (np.arange(1000) % 200 - 100).astype(np.int16)
+    path = write_wav(tmp_path / 'stream.wav', audio, 8000)
+    with open(path, 'r+b') as f:
+        data = f.read()
+        f.seek(data.index(b'data') + 4)
+        f.write(struct.pack('<I', 0xFFFFFFFF))
+
+    assert wav_layout(path)['frames'] == 1000
+    source = TrackSource(path)
+    assert source.frames == 1000
+    assert np.allclose(source.read(0, 1000), audio / 32768.0)
+
+def test_streaming_resampler_matches_resample_poly(tmp_path):
+    rng = np.random.default_rng(1)
+    audio = rng.uniform(-0.5, 0.5, 44100 * 2 + 123).astype(np.float32)
+    source = TrackSource(write_wav(tmp_path / 'b.wav', audio, 44100, 'FLOAT'))
+    resampler = StreamingResampler(source, 22050, block_size=1000)
+
+    expected = signal.resample_poly(audio, 1, 2)
+    assert resampler.frames == len(expected)
+
+    # قراءات بأطوال غير متساوية عبر حدود الدفعات
+    output, position = [], 0
+    for count in (1, 999, 1500, 7, 40000):
+        output.append(resampler.read(position, count))
+        position += count
+    output.append(resampler.read(position, resampler.frames - position))
+    assert np.allclose(np.concatenate(output), expected, atol=1e-5)
@@ -0,0 +1,80 @@
+import threading
+import pytest
+from flask import Flask
+from src.models.audio_content import db
+from src.services.tts_cache import TTSCache
+
+SAMPLE_RATE = 8000
+
+@pytest.fixture
+def tts_app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'cache.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+def fake_synthesize(calls):
+    def synthesize(file_path):
+        calls.append(file_path)
+        with open(file_path, 'wb') as f:
+            f.write(b'\0' * 100)
+        return {'duration': 1.0, 'sample_rate': SAMPLE_RATE, 'channels': 1}
+    return synthesize
+
+def test_tts_cache_normalizes_text(tts_app, tmp_path):
+    cache = TTSCache(str(tmp_path / 'tts'), max_bytes=10 ** 6)
+    calls = []
+    entry, cached = cache.get_or_create('مرحـبا   بك', 'gtts', 'default', 'ar', fake_synthesize(calls))
+    assert not cached
+    again, cached = cache.get_or_create(' مرحبا بك', 'gtts', 'default', 'ar', fake_synthesize(calls))
+    assert cached and again.cache_key == entry.cache_key
+    assert len(calls) == 1
+
+    # محرك آخر سطر آخر
+    cache.get_or_create('مرحبا بك', 'pyttsx3', 'default', 'ar', fake_synthesize(calls))
+    assert len(calls) == 2
+
+def test_tts_cache_evicts_by_last_use(tts_app, tmp_path):
+    cache = TTSCache(str(tmp_path / 'tts'), max_bytes=250)
+    calls = []
+    first, _ = cache.get_or_create('one', 'gtts', 'default', 'en', fake_synthesize(calls))
+    cache.get_or_create('two', 'gtts', 'default', 'en', fake_synthesize(calls))
+    cache.get_or_create('one', 'gtts', 'default', 'en', fake_synthesize(calls))
+    cache.get_or_create('three', 'gtts', 'default', 'en', fake_synthesize(calls))
+
+    stats = cache.get_stats()
+    assert stats['entries'] == 2 and stats['size_bytes'] <= 250
+    assert cache.lookup(first.cache_key) is not None
+    assert cache.lookup(cache.make_key('two', 'gtts', 'default', 'en')) is None
+
+def test_tts_cache_deduplicates_concurrent_requests(tts_app, tmp_path):
+    cache = TTSCache(str(tmp_path / 'tts'), max_bytes=10 ** 6)
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_synthesize(file_path):
+        started.set()
+        release.wait(5)
+        return fake_synthesize(calls)(file_path)
+
+    results = []
+
+    def request():
+        with tts_app.app_context():
+            entry, _ = cache.get_or_create('line', 'gtts', 'default', 'en', slow_synthesize)
+            results.append(entry.cache_key)
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(calls) == 1
+    assert len(set(results)) == 1 and len(results) == 3
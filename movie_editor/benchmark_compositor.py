@@ -0,0 +1,89 @@
+"""قياس سرعة تركيب الإطارات على خطوط زمنية صناعية: محرك الطبقات مقابل concatenate_videoclips"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+from moviepy.editor import ImageClip, CompositeVideoClip, concatenate_videoclips
+from src.services.compositor import compose_layers
+
+def build_timeline(item_count, size, seed=0):
+    """ثلاث طبقات: خلفيات معتمة بملء الإطار، صور جزئية شفافة، وعناصر صغيرة بقناع"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    layers = [[], [], []]
+
+    for index in range(item_count):
+        layer = index % 3
+        # كل طبقة متتابعة تقريباً مع تداخل بسيط بين عناصرها
+        start = (index // 3) * 2.0 + rng.uniform(0, 0.5)
+        duration = rng.uniform(2.0, 3.0)
+
+        if layer == 0:
+            image = np.full((height, width, 3), rng.integers(0, 255, 3), dtype=np.uint8)
+            clip = ImageClip(image)
+        elif layer == 1:
+            image = rng.integers(0, 255, (height // 2, width // 2, 3), dtype=np.uint8)
+            clip = ImageClip(image).set_position((int(rng.integers(0, width // 2)), int(rng.integers(0, height // 2))))
+            clip = clip.set_opacity(0.8)
+        else:
+            image = np.full((height // 8, width // 4, 3), 255, dtype=np.uint8)
+            clip = ImageClip(image).set_position(('center', 'bottom')).add_mask()
+
+        layers[layer].append(clip.set_start(start).set_duration(duration))
+
+    return layers
+
+def frame_times(duration, frames):
+    """لحظات موزعة بالتساوي على مدة الخط الزمني"""
+    return np.linspace(0, duration, frames, endpoint=False)
+
+def measure(clip, times):
+    """إطارات في الثانية لاستدعاء get_frame على اللحظات المعطاة"""
+    clip.get_frame(times[0])
+    started = time.perf_counter()
+    for t in times:
+        clip.get_frame(t)
+    return len(times) / (time.perf_counter() - started)
+
+def baseline(layers, size):
+    """المسار القديم: دمج كل طبقة بالتتابع ثم تركيب الطبقات"""
+    layer_clips = [
+        concatenate_videoclips(sorted(clips, key=lambda clip: clip.start), method='compose')
+        for clips in layers if clips
+    ]
+    return CompositeVideoClip(layer_clips, size=size)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=48)
+    parser.add_argument('--skip-baseline', action='store_true')
+    args = parser.parse_args()
+
+    size = (args.width, args.height)
+    print(f"{args.width}x{args.height}, {args.frames} frames per timeline")
+    print(f"{'items':>8} {'compositor fps':>16} {'baseline fps':>14} {'speedup':>9}")
+
+    for item_count in args.items:
+        layers = build_timeline(item_count, size)
+        engine = compose_layers(layers, size)
+        times = frame_times(engine.duration, args.frames)
+        engine_fps = measure(engine, times)
+
+        if args.skip_baseline:
+            print(f"{item_count:>8} {engine_fps:>16.1f} {'-':>14} {'-':>9}")
+            continue
+
+        # المسار القديم يتجاهل أوقات البداية، فالمقارنة على نفس عدد الإطارات فقط
+        old = baseline(layers, size)
+        baseline_fps = measure(old, frame_times(old.duration, args.frames))
+        print(f"{item_count:>8} {engine_fps:>16.1f} {baseline_fps:>14.1f} {engine_fps / baseline_fps:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
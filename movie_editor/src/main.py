@@ -7,7 +7,8 @@ from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.editor import editor_bp
+from src.routes.editor import editor_bp, GENERATED_MOVIES_DIR
+from src.services.render_queue import render_queue
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -25,9 +26,15 @@ db.init_app(app)
 
 # إضافة نماذج المونتاج إلى قاعدة البيانات
 from src.models.movie_project import MovieProject, Timeline, RenderTask, AssetLibrary
+from src.models.movie_project import db as project_db
+project_db.init_app(app)
 
 with app.app_context():
     db.create_all()
+    project_db.create_all()
+
+# تشغيل مجدول التصدير (طابور دائم على جدول RenderTask)
+render_queue.start(app, GENERATED_MOVIES_DIR)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -18,6 +18,7 @@ class MovieProject(db.Model):
     duration = db.Column(db.Float, nullable=True)  # المدة بالثواني
     resolution = db.Column(db.String(20), default='1920x1080')
     frame_rate = db.Column(db.Integer, default=24)
+    timeline_revision = db.Column(db.Integer, default=0)  # يزداد مع كل تعديل على الخط الزمني
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -37,6 +38,7 @@ class MovieProject(db.Model):
             'duration': self.duration,
             'resolution': self.resolution,
             'frame_rate': self.frame_rate,
+            'timeline_revision': self.timeline_revision,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -83,10 +85,13 @@ class RenderTask(db.Model):
     output_format = db.Column(db.String(20), default='mp4')
     quality = db.Column(db.String(20), default='high')  # low, medium, high, ultra
     status = db.Column(db.String(50), default='queued')  # queued, processing, completed, failed
+    priority = db.Column(db.Integer, default=2)  # 0 معاينة، 1 مشهد، 2 فيلم كامل
     progress = db.Column(db.Integer, default=0)  # 0-100
     output_path = db.Column(db.String(500), nullable=True)
     error_message = db.Column(db.Text, nullable=True)
     render_settings = db.Column(db.Text, nullable=True)  # JSON string
+    segment_progress = db.Column(db.Text, nullable=True)  # JSON: حالة كل مقطع في التصدير المتوازي
+    render_stats = db.Column(db.Text, nullable=True)  # JSON: إحصائيات التصدير (إصابات المخزن...)
     estimated_duration = db.Column(db.Integer, nullable=True)  # بالثواني
     actual_duration = db.Column(db.Integer, nullable=True)  # بالثواني
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -101,10 +106,13 @@ class RenderTask(db.Model):
             'output_format': self.output_format,
             'quality': self.quality,
             'status': self.status,
+            'priority': self.priority,
             'progress': self.progress,
             'output_path': self.output_path,
             'error_message': self.error_message,
             'render_settings': self.render_settings,
+            'segment_progress': self.segment_progress,
+            'render_stats': self.render_stats,
             'estimated_duration': self.estimated_duration,
             'actual_duration': self.actual_duration,
             'created_at': self.created_at.isoformat() if self.created_at else None,
@@ -121,7 +129,7 @@ class AssetLibrary(db.Model):
     file_size = db.Column(db.Integer, nullable=True)  # بالبايت
     duration = db.Column(db.Float, nullable=True)  # للفيديو والصوت
     dimensions = db.Column(db.String(20), nullable=True)  # للصور والفيديو
-    metadata = db.Column(db.Text, nullable=True)  # JSON string
+    asset_metadata = db.Column('metadata', db.Text, nullable=True)  # JSON string
     tags = db.Column(db.String(500), nullable=True)  # مفصولة بفواصل
     is_generated = db.Column(db.Boolean, default=True)  # مولد أم مرفوع
     source_service = db.Column(db.String(100), nullable=True)  # scenario, visual, audio
@@ -138,7 +146,7 @@ class AssetLibrary(db.Model):
             'file_size': self.file_size,
             'duration': self.duration,
             'dimensions': self.dimensions,
-            'metadata': self.metadata,
+            'metadata': self.asset_metadata,
             'tags': self.tags,
             'is_generated': self.is_generated,
             'source_service': self.source_service,
@@ -2,11 +2,18 @@ from flask import Blueprint, jsonify, request, send_file
 from flask_cors import cross_origin
 from src.models.movie_project import MovieProject, Timeline, RenderTask, AssetLibrary, db
 from src.services.movie_editor import movie_editor
+from src.services.render_queue import render_queue, RENDER_PRIORITIES, QueueFullError
+from src.services.render_cache import render_cache
+from src.services.preview_engine import preview_engine
+from src.services.frame_renderer import frame_renderer, FRAME_FORMATS
+from src.services.media_probe import media_probe
+from src.services.asset_resolver import asset_resolver
+from src.services.timeline_index import timeline_indexes
 import json
 import os
 import uuid
+from io import BytesIO
 from datetime import datetime
-import threading
 import logging
 import requests
 
@@ -23,6 +30,25 @@ os.makedirs(GENERATED_MOVIES_DIR, exist_ok=True)
 ASSETS_DIR = os.path.join(os.path.dirname(__file__), '..', 'assets')
 os.makedirs(ASSETS_DIR, exist_ok=True)
 
+def bump_timeline_revision(project_id):
+    """زيادة رقم مراجعة الخط الزمني لإبطال الإطارات المخزنة، ويعيد المراجعة الجديدة"""
+    project = MovieProject.query.get(project_id)
+    if project:
+        project.timeline_revision = (project.timeline_revision or 0) + 1
+        return project.timeline_revision
+    return None
+
+def get_timeline_index(project_id, project=None):
+    """فهرس الخط الزمني للمشروع عند مراجعته الحالية"""
+    project = project or MovieProject.query.get(project_id)
+    revision = (project.timeline_revision or 0) if project else 0
+    return timeline_indexes.get(project_id, revision)
+
+def update_timeline_index(project_id, revision, upsert=None, remove=None):
+    """تطبيق تعديل عنصر على الفهرس المحفوظ بعد حفظه في قاعدة البيانات"""
+    if revision is not None:
+        timeline_indexes.apply(project_id, revision, upsert=upsert, remove=remove)
+
 @editor_bp.route('/projects', methods=['GET'])
 @cross_origin()
 def get_projects():
@@ -77,9 +103,18 @@ def update_project(project_id):
 @editor_bp.route('/projects/<int:project_id>/timeline', methods=['GET'])
 @cross_origin()
 def get_timeline(project_id):
-    """الحصول على الخط الزمني للمشروع"""
-    timeline_items = Timeline.query.filter_by(movie_id=project_id).order_by(Timeline.start_time).all()
-    return jsonify([item.to_dict() for item in timeline_items])
+    """الحصول على الخط الزمني للمشروع (كاملاً، أو عند لحظة t، أو في نافذة start/end، أو لطبقة)"""
+    index = get_timeline_index(project_id)
+    layer = request.args.get('layer', type=int)
+    t = request.args.get('t', type=float)
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    
+    if t is not None:
+        return jsonify(index.at(t, layer))
+    if start is not None or end is not None:
+        return jsonify(index.between(start or 0.0, end if end is not None else float('inf'), layer))
+    return jsonify(index.all(layer))
 
 @editor_bp.route('/projects/<int:project_id>/timeline', methods=['POST'])
 @cross_origin()
@@ -103,8 +138,10 @@ def add_timeline_item(project_id):
     )
     
     db.session.add(timeline_item)
+    revision = bump_timeline_revision(project_id)
     db.session.commit()
     
+    update_timeline_index(project_id, revision, upsert=timeline_item.to_dict())
     return jsonify(timeline_item.to_dict()), 201
 
 @editor_bp.route('/timeline/<int:item_id>', methods=['PUT'])
@@ -121,7 +158,10 @@ def update_timeline_item(item_id):
             else:
                 setattr(item, key, value)
     
+    revision = bump_timeline_revision(item.movie_id)
     db.session.commit()
+    
+    update_timeline_index(item.movie_id, revision, upsert=item.to_dict())
     return jsonify(item.to_dict())
 
 @editor_bp.route('/timeline/<int:item_id>', methods=['DELETE'])
@@ -129,9 +169,12 @@ def update_timeline_item(item_id):
 def delete_timeline_item(item_id):
     """حذف عنصر من الخط الزمني"""
     item = Timeline.query.get_or_404(item_id)
+    movie_id = item.movie_id
     db.session.delete(item)
+    revision = bump_timeline_revision(movie_id)
     db.session.commit()
     
+    update_timeline_index(movie_id, revision, remove=item_id)
     return jsonify({'success': True})
 
 @editor_bp.route('/projects/<int:project_id>/assets', methods=['GET'])
@@ -202,7 +245,7 @@ def sync_visual_assets(project_id):
                             description=item.get('description'),
                             file_path=item['file_path'],
                             dimensions=f"{item.get('width', 512)}x{item.get('height', 512)}",
-                            metadata=json.dumps(item),
+                            asset_metadata=json.dumps(item),
                             tags=item.get('style', ''),
                             is_generated=True,
                             source_service='visual'
@@ -236,14 +279,16 @@ def sync_audio_assets(project_id):
                     ).first()
                     
                     if not existing_asset:
+                        # المدة الفعلية من ترويسة الملف، وإلا ما أعلنته خدمة الصوت
+                        duration = media_probe.duration(item['file_path']) or item.get('duration')
                         asset = AssetLibrary(
                             movie_id=project_id,
                             asset_type='audio',
                             name=item.get('title', f"صوت مولد {item['id']}"),
                             description=item.get('description'),
                             file_path=item['file_path'],
-                            duration=item.get('duration'),
-                            metadata=json.dumps(item),
+                            duration=duration,
+                            asset_metadata=json.dumps(item),
                             tags=item.get('content_type', ''),
                             is_generated=True,
                             source_service='audio'
@@ -283,7 +328,7 @@ def sync_scenario_assets(project_id):
                         name='السيناريو الرئيسي',
                         description='السيناريو المولد للفيلم',
                         file_path='',  # النص مخزن في metadata
-                        metadata=json.dumps({
+                        asset_metadata=json.dumps({
                             'content': movie_data['scenario'],
                             'type': 'scenario'
                         }),
@@ -311,138 +356,85 @@ def render_movie(project_id):
         quality = data.get('quality', 'high')
         scene_id = data.get('scene_id')  # إذا كان المطلوب تصدير مشهد واحد فقط
         
-        # إنشاء مهمة تصدير
+        task_type = data.get('task_type')
+        if task_type not in RENDER_PRIORITIES:
+            task_type = 'scene' if scene_id else 'full_movie'
+        
+        # إنشاء مهمة تصدير في الطابور
         render_task = RenderTask(
             movie_id=project_id,
-            task_type='scene' if scene_id else 'full_movie',
+            task_type=task_type,
             scene_id=scene_id,
             output_format=output_format,
             quality=quality,
-            render_settings=json.dumps(data),
-            status='processing'
+            priority=RENDER_PRIORITIES[task_type],
+            render_settings=json.dumps(data)
         )
-        db.session.add(render_task)
-        db.session.commit()
         
-        # بدء التصدير في خيط منفصل
-        thread = threading.Thread(
-            target=render_movie_async,
-            args=(render_task.id, project_id, scene_id, output_format, quality)
-        )
-        thread.start()
+        try:
+            queue_position = render_queue.enqueue(render_task)
+        except QueueFullError as e:
+            response = jsonify({
+                'success': False,
+                'error': 'طابور التصدير ممتلئ، حاول لاحقاً',
+                'queued': e.queued,
+                'queue_limit': e.limit
+            })
+            response.headers['Retry-After'] = str(int(render_queue.poll_interval * 5))
+            return response, 429
         
         return jsonify({
             'success': True,
             'task_id': render_task.id,
-            'message': 'بدأ تصدير الفيلم'
-        })
+            'queue_position': queue_position,
+            'message': 'تمت إضافة الفيلم إلى طابور التصدير'
+        }), 202
         
     except Exception as e:
         logger.error(f"Error starting movie render: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def render_movie_async(task_id, project_id, scene_id, output_format, quality):
-    """تصدير الفيلم بشكل غير متزامن"""
-    try:
-        task = RenderTask.query.get(task_id)
-        if not task:
-            return
-        
-        task.progress = 10
-        db.session.commit()
-        
-        # الحصول على بيانات الخط الزمني
-        query = Timeline.query.filter_by(movie_id=project_id)
-        if scene_id:
-            query = query.filter_by(scene_id=scene_id)
-        
-        timeline_items = query.order_by(Timeline.start_time).all()
-        timeline_data = [item.to_dict() for item in timeline_items]
-        
-        if not timeline_data:
-            task.status = 'failed'
-            task.error_message = 'لا توجد عناصر في الخط الزمني'
-            db.session.commit()
-            return
-        
-        task.progress = 30
-        db.session.commit()
-        
-        # إنشاء اسم الملف
-        project = MovieProject.query.get(project_id)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{project.title}_{timestamp}.{output_format}"
-        output_path = os.path.join(GENERATED_MOVIES_DIR, filename)
-        
-        # إعدادات التصدير
-        settings = {
-            'resolution': tuple(map(int, project.resolution.split('x'))),
-            'fps': project.frame_rate,
-            'quality': quality
-        }
-        
-        task.progress = 50
-        db.session.commit()
-        
-        # تصدير الفيلم
-        success = movie_editor.create_movie_from_timeline(
-            timeline_data, 
-            output_path, 
-            settings
-        )
-        
-        if success:
-            # الحصول على معلومات الفيديو
-            movie_info = movie_editor.get_movie_info(output_path)
-            
-            # تحديث المشروع
-            project.output_path = output_path
-            if movie_info:
-                project.duration = movie_info.get('duration')
-            
-            # تحديث المهمة
-            task.status = 'completed'
-            task.output_path = output_path
-            task.progress = 100
-            
-            db.session.commit()
-            
-            logger.info(f"Movie render completed for project {project_id}")
-        else:
-            task.status = 'failed'
-            task.error_message = 'فشل في تصدير الفيلم'
-            db.session.commit()
-            
-    except Exception as e:
-        logger.error(f"Error in render_movie_async: {str(e)}")
-        task = RenderTask.query.get(task_id)
-        if task:
-            task.status = 'failed'
-            task.error_message = str(e)
-            db.session.commit()
-
 @editor_bp.route('/projects/<int:project_id>/preview', methods=['POST'])
 @cross_origin()
 def create_preview(project_id):
-    """إنشاء معاينة سريعة للفيلم"""
+    """إنشاء معاينة سريعة لنافذة زمنية من الفيلم"""
     try:
-        data = request.json
-        duration = data.get('duration', 10)  # مدة المعاينة بالثواني
+        data = request.json or {}
+        start = float(data.get('start', 0))
+        end = float(data.get('end', start + data.get('duration', 10)))  # نهاية المعاينة بالثواني
+        
+        if end <= start:
+            return jsonify({'success': False, 'error': 'نافذة المعاينة غير صالحة'}), 400
         
-        # الحصول على بيانات الخط الزمني
-        timeline_items = Timeline.query.filter_by(movie_id=project_id).order_by(Timeline.start_time).all()
-        timeline_data = [item.to_dict() for item in timeline_items]
+        project = MovieProject.query.get_or_404(project_id)
+        
+        # العناصر المتقاطعة مع نافذة المعاينة فقط
+        timeline_data = get_timeline_index(project_id, project).between(start, end)
         
         if not timeline_data:
             return jsonify({'success': False, 'error': 'لا توجد عناصر في الخط الزمني'}), 400
         
-        # إنشاء المعاينة
-        preview_path = movie_editor.create_preview(timeline_data, duration)
+        asset_paths = []
+        asset_resolver.resolve_timeline(project_id, timeline_data, held=asset_paths)
+        
+        # إنشاء المعاينة، أو إعادة ملفها إذا طُلبت نفس النافذة دون تعديل
+        try:
+            preview_path = preview_engine.render_preview(
+                timeline_data,
+                start,
+                end,
+                tuple(map(int, project.resolution.split('x')))
+            )
+        finally:
+            asset_resolver.release(asset_paths)
         
         if preview_path:
             return jsonify({
                 'success': True,
                 'preview_path': preview_path,
+                'preview_url': f"/api/previews/{os.path.basename(preview_path)}",
+                'start': start,
+                'end': end,
                 'message': 'تم إنشاء المعاينة بنجاح'
             })
         else:
@@ -452,6 +444,55 @@ def create_preview(project_id):
         logger.error(f"Error creating preview: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@editor_bp.route('/projects/<int:project_id>/frame', methods=['GET'])
+@cross_origin()
+def get_frame(project_id):
+    """الحصول على الإطار المركب عند لحظة محددة (للتنقل السريع في الخط الزمني)"""
+    try:
+        t = request.args.get('t', 0.0, type=float)
+        width = request.args.get('width', type=int)
+        image_format = request.args.get('format', 'jpeg').lower()
+        
+        if image_format not in FRAME_FORMATS:
+            return jsonify({'success': False, 'error': 'صيغة الصورة غير مدعومة'}), 400
+        
+        project = MovieProject.query.get_or_404(project_id)
+        
+        # العناصر الظاهرة عند حد الإطار المطلوب فقط
+        fps = project.frame_rate or 24
+        t = frame_renderer.frame_time(t, fps)
+        timeline_items = get_timeline_index(project_id, project).at(t)
+        
+        # الأصول المفهرسة لا تحتاج استعلاماً إضافياً أثناء التنقل
+        asset_paths = []
+        timeline_data = asset_resolver.resolve_timeline(project_id, timeline_items, held=asset_paths)
+        
+        try:
+            frame = frame_renderer.render_frame(
+                project_id,
+                project.timeline_revision or 0,
+                timeline_data,
+                t,
+                tuple(map(int, project.resolution.split('x'))),
+                fps,
+                width,
+                image_format
+            )
+        finally:
+            asset_resolver.release(asset_paths)
+        
+        return send_file(BytesIO(frame), mimetype=FRAME_FORMATS[image_format])
+        
+    except Exception as e:
+        logger.error(f"Error rendering frame: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@editor_bp.route('/frame-cache', methods=['GET'])
+@cross_origin()
+def get_frame_cache_status():
+    """الحصول على إحصائيات ذاكرة الإطارات"""
+    return jsonify(frame_renderer.get_stats())
+
 @editor_bp.route('/render-tasks', methods=['GET'])
 @cross_origin()
 def get_render_tasks():
@@ -470,7 +511,40 @@ def get_render_tasks():
 def get_render_task_status(task_id):
     """الحصول على حالة مهمة التصدير"""
     task = RenderTask.query.get_or_404(task_id)
-    return jsonify(task.to_dict())
+    task_data = task.to_dict()
+    task_data['queue_position'] = render_queue.queue_position(task)
+    return jsonify(task_data)
+
+@editor_bp.route('/render-queue', methods=['GET'])
+@cross_origin()
+def get_render_queue_status():
+    """الحصول على حالة طابور التصدير"""
+    return jsonify(render_queue.get_stats())
+
+@editor_bp.route('/render-cache', methods=['GET'])
+@cross_origin()
+def get_render_cache_status():
+    """الحصول على حالة مخزن مقاطع التصدير"""
+    return jsonify(render_cache.get_stats())
+
+@editor_bp.route('/render-cache', methods=['DELETE'])
+@cross_origin()
+def clear_render_cache():
+    """إفراغ مخزن مقاطع التصدير"""
+    render_cache.clear()
+    return jsonify({'success': True})
+
+@editor_bp.route('/timeline-index', methods=['GET'])
+@cross_origin()
+def get_timeline_index_status():
+    """الحصول على إحصائيات فهارس الخطوط الزمنية"""
+    return jsonify(timeline_indexes.get_stats())
+
+@editor_bp.route('/asset-store', methods=['GET'])
+@cross_origin()
+def get_asset_store_status():
+    """الحصول على حالة فهرس الأصول ومخزنها المحلي"""
+    return jsonify(asset_resolver.get_stats())
 
 @editor_bp.route('/files/<path:filename>')
 @cross_origin()
@@ -485,6 +559,19 @@ def serve_movie_file(filename):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@editor_bp.route('/previews/<filename>')
+@cross_origin()
+def serve_preview_file(filename):
+    """تقديم ملفات المعاينة من مجلدها (قد يكون خارج مجلد الأفلام عبر PREVIEW_OUTPUT_DIR)"""
+    try:
+        file_path = os.path.join(preview_engine.output_dir, os.path.basename(filename))
+        if os.path.exists(file_path):
+            return send_file(file_path)
+        else:
+            return jsonify({'error': 'File not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @editor_bp.route('/projects/<int:project_id>/auto-timeline', methods=['POST'])
 @cross_origin()
 def create_auto_timeline(project_id):
@@ -529,7 +616,7 @@ def create_auto_timeline(project_id):
         if audios:
             audio_start = 0
             for audio in audios:
-                duration = audio.duration or 10
+                duration = audio.duration or media_probe.duration(audio.file_path) or 10
                 timeline_item = Timeline(
                     movie_id=project_id,
                     scene_id=1,
@@ -542,6 +629,7 @@ def create_auto_timeline(project_id):
                 db.session.add(timeline_item)
                 audio_start += duration
         
+        bump_timeline_revision(project_id)
         db.session.commit()
         
         return jsonify({
@@ -0,0 +1,371 @@
+import os
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, Counter
+import requests
+from src.models.movie_project import AssetLibrary
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# عناوين الخدمات التي تقدم ملفاتها المولدة عبر /api/files/<اسم الملف>
+SERVICE_URLS = {
+    'visual': os.environ.get('VISUAL_SERVICE_URL', 'http://localhost:5001'),
+    'audio': os.environ.get('AUDIO_SERVICE_URL', 'http://localhost:5002')
+}
+
+# أنواع العناصر التي لها ملف أصل
+FILE_ELEMENT_TYPES = ('image', 'video', 'audio')
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+class AssetResolver:
+    """ربط عناصر الخط الزمني بملفات الأصول في مخزن محلي معنون بالمحتوى
+
+    الفهرس داخل العملية مفتاحه (الفيلم، نوع العنصر، رقم العنصر)، فتجهيز التصدير
+    يحتاج استعلاماً واحداً على الأكثر للعناصر غير المفهرسة مهما طال الخط الزمني.
+    """
+
+    def __init__(self, store_dir=None, max_bytes=None, max_entries=None, timeout=None):
+        self.store_dir = store_dir or os.environ.get(
+            'ASSET_STORE_DIR',
+            os.path.join(os.path.dirname(__file__), '..', 'asset_store')
+        )
+        self.max_bytes = max_bytes or int(os.environ.get('ASSET_STORE_MAX_MB', 10240)) * 1024 * 1024
+        self.max_entries = max_entries or int(os.environ.get('ASSET_INDEX_SIZE', 4096))
+        self.timeout = timeout or float(os.environ.get('ASSET_FETCH_TIMEOUT', 60))
+        self.blobs_dir = os.path.join(self.store_dir, 'blobs')
+        self.sources_dir = os.path.join(self.store_dir, 'sources')
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.sources_dir, exist_ok=True)
+
+        # (الفيلم، النوع، الرقم) -> {'path', 'source', 'signature'}
+        self.index = OrderedDict()
+        # وقت آخر استخدام لكل ملف في المخزن (وقت تعديل الملف يبقى وقت دخوله فقط)
+        self.last_used = {}
+        # ملفات يستخدمها تصدير جارٍ فلا تُحذف عند التنظيف
+        self.held = Counter()
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.fetched = 0
+        self.lock = threading.Lock()
+
+    def resolve_timeline(self, movie_id, timeline_data, held=None):
+        """وضع asset_path في كل عنصر ملف، مع استعلام واحد لكل العناصر غير المفهرسة
+
+        إذا أُعطيت قائمة held يُحجز فيها كل مسار تحت قفل التنظيف لحظة حله، فلا يحذفه
+        evict قبل أن يبدأ المستدعي باستخدامه. تُمرر القائمة بعدها إلى release.
+        """
+        missing = {}
+        for item in timeline_data:
+            if item.get('asset_path') or item.get('element_type') not in FILE_ELEMENT_TYPES:
+                continue
+            key = (movie_id, item['element_type'], item.get('element_id'))
+            if key in missing:
+                missing[key].append(item)
+                continue
+            path = self.lookup(key)
+            if path and (held is None or self._hold_path(path, held)):
+                item['asset_path'] = path
+            else:
+                missing.setdefault(key, []).append(item)
+
+        if not missing:
+            return timeline_data
+
+        element_ids = {element_id for _, _, element_id in missing}
+        with self.lock:
+            self.queries += 1
+        try:
+            assets = AssetLibrary.query.filter(
+                AssetLibrary.movie_id == movie_id,
+                AssetLibrary.id.in_(element_ids)
+            ).all()
+        except Exception:
+            # لا يبقى حجز لمستدعٍ لن يصل إلى release
+            if held:
+                self.release(held)
+                del held[:]
+            raise
+        assets_by_id = {asset.id: asset for asset in assets}
+
+        for key, items in missing.items():
+            asset = assets_by_id.get(key[2])
+            if asset is None:
+                logger.warning(f"Asset not found for timeline element {key}")
+                continue
+
+            path = self.materialize(asset)
+            if path and held is not None and not self._hold_path(path, held):
+                # حُذف بالتنظيف قبل حجزه: يُجلب مرة أخرى
+                path = self.materialize(asset)
+                if path and not self._hold_path(path, held):
+                    path = None
+            if not path:
+                continue
+            self._remember(key, path, asset.file_path)
+            for item in items:
+                item['asset_path'] = path
+
+        return timeline_data
+
+    def lookup(self, key):
+        """مسار الأصل المفهرس إذا كان ملف المخزن موجوداً والمصدر المحلي لم يتغير"""
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is not None:
+                self.index.move_to_end(key)
+
+        found = entry is not None and os.path.exists(entry['path']) and (
+            entry['signature'] is None or self._signature(entry['source']) == entry['signature']
+        )
+        with self.lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry['path'] if found else None
+
+    def lookup_item(self, item):
+        """مسار أصل عنصر من الفهرس فقط (دون قاعدة البيانات)"""
+        return self.lookup((item.get('movie_id'), item.get('element_type'), item.get('element_id')))
+
+    def materialize(self, asset):
+        """نسخة محلية من ملف الأصل في المخزن، تُجلب مرة واحدة لكل محتوى"""
+        try:
+            source = asset.file_path
+            if source and os.path.exists(source):
+                return self._ingest_local(source)
+
+            url = self._remote_url(asset)
+            if url:
+                return self._ingest_remote(url)
+
+            logger.warning(f"Asset file unavailable: {source}")
+            return None
+
+        except Exception as e:
+            logger.error(f"Error materializing asset {asset.id}: {str(e)}")
+            return None
+
+    def _remote_url(self, asset):
+        """عنوان الملف لدى الخدمة المصدر إذا لم يكن على هذا الجهاز"""
+        source = asset.file_path or ''
+        if source.startswith(('http://', 'https://')):
+            return source
+        base_url = SERVICE_URLS.get(asset.source_service)
+        if base_url and source:
+            return f"{base_url}/api/files/{os.path.basename(source)}"
+        return None
+
+    def _signature(self, source):
+        """توقيع الملف المحلي (وقت التعديل، الحجم) أو None للملفات البعيدة"""
+        try:
+            stat = os.stat(source)
+            return (stat.st_mtime_ns, stat.st_size)
+        except (OSError, TypeError):
+            return None
+
+    def _ingest_local(self, source):
+        """نسخ ملف محلي إلى المخزن؛ البصمة تُحسب مرة لكل نسخة من الملف
+
+        النسخ بدل الربط الصلب حتى لا تغير إعادة كتابة المصدر محتوى المخزن.
+        """
+        stat = os.stat(source)
+        source_id = f"{os.path.realpath(source)}:{stat.st_mtime_ns}:{stat.st_size}"
+        path = self._source_blob(source_id)
+        if path:
+            return path
+
+        digest = hashlib.sha256()
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+        extension = os.path.splitext(source)[1].lower()
+        blob_path = self.blob_path(digest.hexdigest(), extension)
+        if not os.path.exists(blob_path):
+            partial = self._partial_path(blob_path)
+            shutil.copyfile(source, partial)
+            os.replace(partial, blob_path)
+            self._touch(blob_path)
+            self.evict()
+
+        self._touch(blob_path)
+        self._record_source(source_id, blob_path)
+        return blob_path
+
+    def _ingest_remote(self, url):
+        """تنزيل ملف بعيد إلى المخزن مع حساب بصمته أثناء التنزيل"""
+        path = self._source_blob(url)
+        if path:
+            return path
+
+        extension = os.path.splitext(url.split('?')[0])[1].lower()
+        partial = self._partial_path(os.path.join(self.blobs_dir, 'download'))
+        digest = hashlib.sha256()
+        try:
+            with requests.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                with open(partial, 'wb') as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+
+            blob_path = self.blob_path(digest.hexdigest(), extension)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(partial, blob_path)
+        finally:
+            if os.path.exists(partial):
+                os.unlink(partial)
+
+        with self.lock:
+            self.fetched += 1
+        self._touch(blob_path)
+        self.evict()
+        self._record_source(url, blob_path)
+        return blob_path
+
+    def blob_path(self, digest, extension=''):
+        """مسار الملف في المخزن من بصمة محتواه (الامتداد يبقى لأجل ffmpeg وPIL)"""
+        return os.path.join(self.blobs_dir, digest[:2], f"{digest}{extension}")
+
+    def _partial_path(self, blob_path):
+        """مسار مؤقت في نفس المجلد للنشر الذري"""
+        directory, name = os.path.split(blob_path)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.partial")
+
+    def _source_reference(self, source_id):
+        """ملف يحفظ بصمة محتوى المصدر حتى لا يُعاد حسابها أو تنزيله بعد إعادة التشغيل"""
+        return os.path.join(self.sources_dir, hashlib.sha256(source_id.encode('utf-8')).hexdigest())
+
+    def _source_blob(self, source_id):
+        """مسار المحتوى المسجل لهذا المصدر إذا كان لا يزال في المخزن"""
+        try:
+            with open(self._source_reference(source_id), 'r') as f:
+                blob_path = self.blob_path(*f.read().split('\n', 1))
+        except (OSError, TypeError):
+            return None
+        if not os.path.exists(blob_path):
+            return None
+        self._touch(blob_path)
+        return blob_path
+
+    def _touch(self, blob_path):
+        """تحديث وقت الاستخدام لسياسة LRU في فهرس المخزن"""
+        with self.lock:
+            self.last_used[blob_path] = time.time()
+
+    def _record_source(self, source_id, blob_path):
+        """تسجيل بصمة محتوى المصدر"""
+        digest, extension = os.path.splitext(os.path.basename(blob_path))
+        reference = self._source_reference(source_id)
+        partial = self._partial_path(reference)
+        with open(partial, 'w') as f:
+            f.write(f"{digest}\n{extension}")
+        os.replace(partial, reference)
+
+    def _remember(self, key, path, source):
+        """إضافة مسار إلى الفهرس مع حد لعدد المدخلات"""
+        entry = {'path': path, 'source': source, 'signature': self._signature(source)}
+        with self.lock:
+            self.index[key] = entry
+            self.index.move_to_end(key)
+            while len(self.index) > self.max_entries:
+                self.index.popitem(last=False)
+
+    def _blobs(self):
+        """قائمة ملفات المخزن مع وقت آخر استخدام والحجم"""
+        entries = []
+        for directory in os.listdir(self.blobs_dir):
+            directory = os.path.join(self.blobs_dir, directory)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((self.last_used.get(path, stat.st_mtime), stat.st_size, path))
+        return entries
+
+    def _hold_path(self, path, held):
+        """حجز ملف موجود في المخزن تحت قفل التنظيف، ويعيد False إذا كان قد حُذف"""
+        if path in held:
+            return True
+        with self.lock:
+            if not os.path.exists(path):
+                return False
+            self.held[path] += 1
+        held.append(path)
+        return True
+
+    def release(self, paths):
+        """فك حجز ملفات بعد انتهاء التصدير"""
+        with self.lock:
+            self.held.subtract(paths)
+            for path in paths:
+                if self.held[path] <= 0:
+                    del self.held[path]
+
+    def evict(self):
+        """حذف الأقدم استخداماً حتى يعود حجم المخزن تحت الحد، عدا ملفات التصدير الجاري"""
+        entries = sorted(self._blobs())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            # الفحص والحذف تحت نفس القفل الذي يُؤخذ به الحجز
+            with self.lock:
+                if path in self.held:
+                    continue
+                try:
+                    os.unlink(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+                self.last_used.pop(path, None)
+
+    def invalidate(self, movie_id=None):
+        """إفراغ الفهرس (أو مدخلات فيلم واحد)؛ ملفات المخزن تبقى لأن مفتاحها المحتوى"""
+        with self.lock:
+            if movie_id is None:
+                self.index.clear()
+                return
+            for key in [key for key in self.index if key[0] == movie_id]:
+                del self.index[key]
+
+    def get_stats(self):
+        """إحصائيات الفهرس والمخزن"""
+        blobs = self._blobs()
+        with self.lock:
+            indexed = len(self.index)
+            held = len(self.held)
+            hits, misses = self.hits, self.misses
+            queries, fetched = self.queries, self.fetched
+        lookups = hits + misses
+        return {
+            'indexed': indexed,
+            'max_entries': self.max_entries,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 3) if lookups else 0.0,
+            'queries': queries,
+            'fetched': fetched,
+            'blobs': len(blobs),
+            'held': held,
+            'size_bytes': sum(size for _, size, _ in blobs),
+            'max_bytes': self.max_bytes
+        }
+
+# إنشاء مثيل عام للاستخدام
+asset_resolver = AssetResolver()
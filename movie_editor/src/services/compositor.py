@@ -0,0 +1,176 @@
+import logging
+import numpy as np
+from moviepy.editor import VideoClip, CompositeAudioClip
+from src.services.timeline_index import IntervalIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# المواضع النصية كما يفسرها moviepy
+POSITION_ALIASES = {
+    'center': ['center', 'center'],
+    'left': ['left', 'center'],
+    'right': ['right', 'center'],
+    'top': ['center', 'top'],
+    'bottom': ['center', 'bottom']
+}
+
+class LayerIndex:
+    """مقاطع طبقة واحدة مرتبة حسب البداية فوق فهرس فترات الخط الزمني"""
+
+    def __init__(self, clips):
+        self.clips = sorted(clips, key=lambda clip: clip.start)
+        self.intervals = IntervalIndex(
+            range(len(self.clips)),
+            [clip.start for clip in self.clips],
+            [clip.end for clip in self.clips]
+        )
+
+    def active(self, t):
+        """المقاطع الظاهرة عند t بترتيب البداية (الأحدث بدايةً في الأعلى)"""
+        return [self.clips[position] for position in self.intervals.stab(t).tolist()]
+
+    @property
+    def end(self):
+        return self.intervals.end
+
+class LayerCompositor:
+    """تركيب الطبقات إطاراً بإطار في مخازن NumPy محجوزة مسبقاً
+
+    كل مقطع يُرسم في موضعه الزمني (clip.start)، والمقاطع المغطاة بالكامل بمقطع
+    معتم فوقها لا يُفك إطارها أصلاً.
+    """
+
+    def __init__(self, layers, size, background=(0, 0, 0)):
+        self.width, self.height = size
+        self.indexes = [LayerIndex(clips) for clips in layers if clips]
+        self.background = np.array(background, dtype=np.uint8)
+        self.canvas = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.scratch = np.empty((self.height, self.width, 3), dtype=np.float32)
+        self.frames = 0
+        self.blits = 0
+        self.occluded = 0
+
+    @property
+    def duration(self):
+        return max((index.end for index in self.indexes), default=0.0)
+
+    def active_clips(self, t):
+        """المقاطع النشطة من الطبقة الأدنى إلى الأعلى"""
+        clips = []
+        for index in self.indexes:
+            clips.extend(index.active(t))
+        return clips
+
+    def make_frame(self, t):
+        """الإطار المركب عند t"""
+        return self.composite(self.active_clips(t), t)
+
+    def composite(self, clips, t):
+        """تركيب مقاطع معطاة (من الطبقة الأدنى إلى الأعلى) عند t في مخازن المحرك"""
+        self.frames += 1
+
+        # أعلى مقطع معتم يغطي الإطار كله يخفي كل ما تحته
+        first = 0
+        covered = False
+        placements = [None] * len(clips)
+        for position in range(len(clips) - 1, -1, -1):
+            placements[position] = self._placement(clips[position], t)
+            if self._covers(clips[position], placements[position]):
+                first = position
+                covered = True
+                break
+        self.occluded += first
+
+        canvas = self.canvas
+        if not covered:
+            canvas[:] = self.background
+
+        for position in range(first, len(clips)):
+            self._blit(clips[position], t, placements[position])
+
+        return canvas.copy()
+
+    def _placement(self, clip, t):
+        """موضع المقطع على الإطار بالبكسل عند t"""
+        width, height = clip.size
+        position = clip.pos(t - clip.start)
+        position = list(POSITION_ALIASES[position]) if isinstance(position, str) else list(position)
+
+        if getattr(clip, 'relative_pos', False):
+            position = [
+                value * size if not isinstance(value, str) else value
+                for value, size in zip(position, (self.width, self.height))
+            ]
+
+        if isinstance(position[0], str):
+            position[0] = {'left': 0, 'center': (self.width - width) / 2, 'right': self.width - width}[position[0]]
+        if isinstance(position[1], str):
+            position[1] = {'top': 0, 'center': (self.height - height) / 2, 'bottom': self.height - height}[position[1]]
+
+        return int(position[0]), int(position[1]), width, height
+
+    def _covers(self, clip, placement):
+        """المقطع معتم ويغطي الإطار كله"""
+        x, y, width, height = placement
+        return (
+            clip.mask is None
+            and x <= 0 and y <= 0
+            and x + width >= self.width and y + height >= self.height
+        )
+
+    def _blit(self, clip, t, placement):
+        """رسم إطار المقطع على اللوحة مع قناعه إن وجد"""
+        x, y, width, height = placement
+        # الجزء الظاهر من المقطع داخل حدود الإطار
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self.width), min(y + height, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        local_t = t - clip.start
+        frame = clip.get_frame(local_t)
+        if frame.ndim == 2:
+            frame = frame[:, :, None]
+        frame = frame[y0 - y:y1 - y, x0 - x:x1 - x, :3]
+        region = self.canvas[y0:y1, x0:x1]
+        self.blits += 1
+
+        if clip.mask is None:
+            region[:] = frame
+            return
+
+        mask = clip.mask.get_frame(local_t)[y0 - y:y1 - y, x0 - x:x1 - x]
+        # region + mask * (frame - region) داخل مخزن العمل دون تخصيص جديد
+        scratch = self.scratch[:y1 - y0, :x1 - x0]
+        np.subtract(frame, region, out=scratch, dtype=np.float32)
+        scratch *= mask[:, :, None]
+        scratch += region
+        np.copyto(region, scratch, casting='unsafe')
+
+    def audio(self):
+        """صوت مقاطع الفيديو في مواضعها، أو None"""
+        tracks = [
+            clip.audio.set_start(clip.start)
+            for index in self.indexes for clip in index.clips
+            if clip.audio is not None
+        ]
+        return CompositeAudioClip(tracks) if tracks else None
+
+    def get_stats(self):
+        """عدد الإطارات والرسومات والمقاطع المتجاوزة بالتغطية"""
+        return {
+            'frames': self.frames,
+            'blits': self.blits,
+            'occluded': self.occluded
+        }
+
+def compose_layers(layers, size, duration=None):
+    """مقطع فيديو واحد من قوائم مقاطع الطبقات (من الأدنى إلى الأعلى)"""
+    compositor = LayerCompositor(layers, size)
+    clip = VideoClip(compositor.make_frame, duration=duration or compositor.duration)
+    audio = compositor.audio()
+    if audio is not None:
+        clip = clip.set_audio(audio.set_duration(clip.duration))
+    clip.compositor = compositor
+    return clip
@@ -0,0 +1,377 @@
+import os
+import logging
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from PIL import Image
+from moviepy.editor import ImageClip, VideoClip
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+from src.services.movie_editor import movie_editor
+from src.services.compositor import LayerCompositor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# صيغ الصور المدعومة لإطار المعاينة
+FRAME_FORMATS = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp'
+}
+
+# أقصى عدد لقراء الفيديو المفتوحة بين الإطارات
+MAX_OPEN_READERS = 16
+
+# عدد المشاريع التي تبقى محركات تركيبها جاهزة
+MAX_TIMELINES = 8
+
+# محركات التركيب الخاملة لكل مراجعة (واحد لكل طلب متزامن)
+MAX_IDLE_COMPOSITORS = 4
+
+# تكلفة تقديرية لمقطع لا يحمل صورة مفكوكة (فيديو أو نص بلا مصفوفة كبيرة)
+CLIP_OVERHEAD_BYTES = 64 * 1024
+
+class LRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()  # key -> (value, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """جلب قيمة وتحديث ترتيب الاستخدام"""
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, size):
+        """تخزين قيمة ثم حذف الأقدم حتى يعود الحجم تحت الحد"""
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.total_bytes -= self.items.pop(key)[1]
+            self.items[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.items.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        """إفراغ الذاكرة المؤقتة"""
+        with self.lock:
+            self.items.clear()
+            self.total_bytes = 0
+
+    def get_stats(self):
+        """إحصائيات الإصابة والحجم"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.items),
+                'size_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+class VideoSource:
+    """ملف فيديو واحد: خصائصه وقارئ ffmpeg مفتوح له إن وجد"""
+
+    def __init__(self, path, reader):
+        self.path = path
+        self.fps = reader.fps
+        self.size = reader.size
+        self.duration = reader.duration
+        self.reader = reader
+        # قراء ffmpeg لا يتحملون القراءة المتزامنة
+        self.lock = threading.Lock()
+
+class FrameSources:
+    """مصادر إطارات التنقل: إطارات المصادر المفكوكة في LRU بالحجم، وقراء مفتوحة بعدد محدود
+
+    الإطارات مفتاحها (المسار، رقم الإطار) فالتنقل ذهاباً وإياباً لا يعيد الفك، وعند تجاوز
+    عدد القراء يُغلق الأقدم استخداماً وحده ويُعاد فتحه عند الحاجة.
+    """
+
+    def __init__(self, max_bytes, max_readers=MAX_OPEN_READERS):
+        # (المسار، رقم الإطار) -> مصفوفة الإطار، و(المسار، None) -> مقطع الصورة الأساسي
+        self.frames = LRUCache(max_bytes)
+        self.max_readers = max_readers
+        self.videos = {}  # المسار -> VideoSource
+        self.open_readers = OrderedDict()  # المسار -> VideoSource، الأحدث استخداماً في النهاية
+        self.requests = 0
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def image(self, path, duration):
+        """مقطع صورة بالمدة المطلوبة يشارك المصفوفة المفكوكة"""
+        key = (path, None)
+        base = self.frames.get(key)
+        if base is None:
+            base = ImageClip(path)
+            size = base.img.nbytes + (base.mask.img.nbytes if base.mask is not None else 0)
+            self.frames.put(key, base, size)
+        return base.set_duration(duration)
+
+    def video(self, path, start=None, end=None):
+        """مقطع فيديو يقرأ إطاراته عبر ذاكرة الإطارات المفكوكة (بنفس توقيت VideoFileClip)"""
+        source = self._source(path)
+        clip = VideoClip(duration=source.duration)
+        clip.make_frame = lambda t: self.frame(source, t)
+        clip.size = source.size
+        clip.fps = source.fps
+        return clip
+
+    def audio(self, path, start=None, end=None):
+        """الإطار المنفرد لا يحتاج الصوت"""
+        return None
+
+    def _source(self, path):
+        """خصائص الملف، ويُفتح قارئه أول مرة لقراءتها"""
+        with self.lock:
+            self.requests += 1
+            source = self.videos.get(path)
+        if source is not None:
+            return source
+
+        reader = FFMPEG_VideoReader(path)
+        with self.lock:
+            self.opened += 1
+            source = self.videos.get(path)
+            if source is None:
+                source = VideoSource(path, reader)
+                self.videos[path] = source
+                self.open_readers[path] = source
+                reader = None
+            surplus = self._surplus_readers()
+        if reader is not None:
+            reader.close()
+        self._close_readers(surplus)
+        return source
+
+    def frame(self, source, t):
+        """إطار المصدر عند t من الذاكرة، أو فكه وتخزينه"""
+        # نفس تقريب FFMPEG_VideoReader حتى يطابق الإطار المخزن ما يقرأه التصدير
+        key = (source.path, int(source.fps * t + 0.00001))
+        frame = self.frames.get(key)
+        if frame is None:
+            frame = self._decode(source, t)
+            self.frames.put(key, frame, frame.nbytes)
+        return frame
+
+    def _decode(self, source, t):
+        """قراءة إطار بقارئ الملف، مع إعادة فتحه إذا أُغلق بالإخلاء"""
+        while True:
+            reader = self._reader(source)
+            with source.lock:
+                if source.reader is reader:
+                    return reader.get_frame(t)
+
+    def _reader(self, source):
+        """قارئ الملف المفتوح، أو فتحه خارج القفل العام وإغلاق الأقدم عند تجاوز الحد"""
+        with self.lock:
+            if source.reader is not None:
+                self.open_readers.move_to_end(source.path)
+                return source.reader
+
+        reader = FFMPEG_VideoReader(source.path)
+        with self.lock:
+            self.opened += 1
+            if source.reader is None:
+                source.reader = reader
+                self.open_readers[source.path] = source
+                reader = None
+            current = source.reader
+            surplus = self._surplus_readers()
+        if reader is not None:
+            reader.close()
+        self._close_readers(surplus)
+        return current
+
+    def _surplus_readers(self):
+        """فصل القراء الأقدم استخداماً فوق الحد (يُستدعى مع القفل)"""
+        surplus = []
+        while len(self.open_readers) > self.max_readers:
+            _, source = self.open_readers.popitem(last=False)
+            surplus.append((source, source.reader))
+            source.reader = None
+        return surplus
+
+    def _close_readers(self, surplus):
+        """إغلاق قراء مفصولة بعد انتهاء أي قراءة جارية عليها"""
+        for source, reader in surplus:
+            with source.lock:
+                try:
+                    reader.close()
+                except Exception as e:
+                    logger.warning(f"Could not close source reader: {str(e)}")
+
+    def close(self):
+        """إغلاق كل القراء وإفراغ الإطارات المفكوكة"""
+        with self.lock:
+            surplus = [(source, source.reader) for source in self.open_readers.values()]
+            for source in self.open_readers.values():
+                source.reader = None
+            self.open_readers.clear()
+            self.videos.clear()
+        self._close_readers(surplus)
+        self.frames.clear()
+
+    def get_stats(self):
+        """إحصائيات الإطارات المفكوكة والقراء"""
+        with self.lock:
+            stats = {
+                'requests': self.requests,
+                'videos': len(self.videos),
+                'readers': len(self.open_readers),
+                'max_readers': self.max_readers,
+                'opened': self.opened
+            }
+        stats['frames'] = self.frames.get_stats()
+        return stats
+
+class FrameRenderer:
+    """إطار واحد من الخط الزمني بنفس مسار التصدير: مقاطع movie_editor ومحرك الطبقات
+
+    مقاطع العناصر ومحركات التركيب تبقى لكل مراجعة من الخط الزمني، وإطارات المصادر
+    المفكوكة مشتركة بين المراجعات. القفل العام يحمي القواميس فقط، فالفك والتركيب
+    يجريان للطلبات المتزامنة في نفس الوقت.
+    """
+
+    def __init__(self):
+        source_bytes = int(os.environ.get('FRAME_CACHE_SOURCE_MB', 256)) * 1024 * 1024
+        # إطارات المصادر المفكوكة وقراء الفيديو
+        self.sources = FrameSources(source_bytes)
+        # مقاطع العناصر الجاهزة (بعد التحويلات) لكل مراجعة
+        self.clips = LRUCache(source_bytes)
+        # الإطارات المركبة الجاهزة بعد الترميز
+        self.composited_frames = LRUCache(int(os.environ.get('FRAME_CACHE_COMPOSITE_MB', 64)) * 1024 * 1024)
+        # (الفيلم، المراجعة، الدقة) -> محركات تركيب خاملة بمخازنها المحجوزة
+        self.compositors = OrderedDict()
+        self.lock = threading.Lock()
+
+    def frame_size(self, project_resolution, width=None):
+        """أبعاد الإطار المطلوب ونسبة التحجيم من دقة المشروع"""
+        project_width, project_height = project_resolution
+        if not width or width >= project_width:
+            return (project_width, project_height), 1.0
+        ratio = width / project_width
+        return (int(width), max(1, int(round(project_height * ratio)))), ratio
+
+    def frame_time(self, t, fps=24):
+        """اللحظة عند حد الإطار حتى تتطابق الإطارات المخزنة مع المحسوبة"""
+        return int(round(t * fps)) / fps
+
+    def render_frame(self, movie_id, revision, timeline_data, t, project_resolution,
+                     fps=24, width=None, image_format='jpeg'):
+        """تركيب العناصر الظاهرة عند لحظة واحدة وإرجاع الصورة مرمزة
+
+        timeline_data هي العناصر النشطة عند frame_time(t) من فهرس الخط الزمني.
+        """
+        frame_index = int(round(t * fps))
+        size, _ = self.frame_size(project_resolution, width)
+        visual_items = [item for item in timeline_data if item.get('element_type') != 'audio']
+
+        # مسار الأصل في المخزن معنون بالمحتوى، فأي تغيير في ملف أصل يغير المفتاح
+        assets = tuple(sorted(item.get('asset_path') or '' for item in visual_items))
+        key = (movie_id, revision, frame_index, size, image_format, assets)
+
+        cached = self.composited_frames.get(key)
+        if cached is not None:
+            return cached
+
+        frame = self.composite(movie_id, revision, visual_items, frame_index / fps, project_resolution, fps)
+
+        image = Image.fromarray(frame)
+        if image.size != size:
+            image = image.resize(size, Image.BILINEAR)
+        buffer = BytesIO()
+        image.save(buffer, format=image_format.upper(), quality=85)
+        data = buffer.getvalue()
+
+        self.composited_frames.put(key, data, len(data))
+        return data
+
+    def composite(self, movie_id, revision, items, t, project_resolution, fps=24):
+        """الإطار المركب بدقة المشروع كما يخرج في التصدير"""
+        settings = {'resolution': project_resolution, 'fps': fps, 'quality': 'high'}
+
+        # نفس ترتيب التصدير: الطبقات تصاعدياً، وداخل الطبقة حسب البداية
+        layers = {}
+        for item in items:
+            layers.setdefault(item.get('layer', 1), []).append(item)
+        clips = []
+        for layer in sorted(layers):
+            layer_clips = [self.clip(movie_id, revision, item, settings) for item in layers[layer]]
+            clips.extend(sorted((clip for clip in layer_clips if clip is not None), key=lambda clip: clip.start))
+
+        compositor_key = (movie_id, revision, tuple(project_resolution))
+        compositor = self._acquire_compositor(compositor_key, project_resolution)
+        try:
+            return compositor.composite(clips, t)
+        finally:
+            self._release_compositor(compositor_key, compositor)
+
+    def clip(self, movie_id, revision, item, settings):
+        """مقطع العنصر للمراجعة الحالية، ويُنشأ مرة واحدة لكل عنصر وأصل"""
+        key = (movie_id, revision, item.get('id'), item.get('asset_path'))
+        clip = self.clips.get(key)
+        if clip is None:
+            clip = movie_editor.create_clip_from_item(item, settings, self.sources)
+            if clip is None:
+                return None
+            self.clips.put(key, clip, self._clip_bytes(clip))
+        return clip
+
+    def _clip_bytes(self, clip):
+        """الذاكرة التي يحجزها المقطع: صورته وقناعه المفكوكان إن وجدا"""
+        size = CLIP_OVERHEAD_BYTES
+        for part in (clip, clip.mask):
+            image = getattr(part, 'img', None)
+            if image is not None:
+                size += image.nbytes
+        return size
+
+    def _acquire_compositor(self, key, project_resolution):
+        """محرك تركيب خامل لهذه المراجعة، أو محرك جديد إذا كانت كلها مشغولة"""
+        with self.lock:
+            idle = self.compositors.get(key)
+            if idle is None:
+                # مراجعة جديدة تلغي محركات المراجعات السابقة لنفس الفيلم
+                for stale in [other for other in self.compositors if other[0] == key[0]]:
+                    del self.compositors[stale]
+                idle = self.compositors[key] = []
+                while len(self.compositors) > MAX_TIMELINES:
+                    self.compositors.popitem(last=False)
+            self.compositors.move_to_end(key)
+            if idle:
+                return idle.pop()
+        return LayerCompositor([], project_resolution)
+
+    def _release_compositor(self, key, compositor):
+        """إعادة المحرك لطلبات نفس المراجعة"""
+        with self.lock:
+            idle = self.compositors.get(key)
+            if idle is not None and len(idle) < MAX_IDLE_COMPOSITORS:
+                idle.append(compositor)
+
+    def get_stats(self):
+        """إحصائيات مصادر الإطارات والمقاطع وذاكرة الإطارات المركبة"""
+        with self.lock:
+            compositors = sum(len(idle) for idle in self.compositors.values())
+        return {
+            'sources': self.sources.get_stats(),
+            'clips': self.clips.get_stats(),
+            'compositors': compositors,
+            'composited_frames': self.composited_frames.get_stats()
+        }
+
+# إنشاء مثيل عام للاستخدام
+frame_renderer = FrameRenderer()
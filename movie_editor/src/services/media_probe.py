@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import wave
+import shutil
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from moviepy.config import get_setting
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# أنماط مخرجات ffmpeg -i عند غياب ffprobe
+DURATION_PATTERN = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+VIDEO_PATTERN = re.compile(r'Stream #.*?Video:.*?(\d{2,5})x(\d{2,5})(?:.*?([\d.]+) fps)?')
+AUDIO_PATTERN = re.compile(r'Stream #.*?Audio:.*?(\d+) Hz(?:,\s*([^,]+))?')
+
+CHANNEL_LAYOUTS = {'mono': 1, 'stereo': 2, '2.1': 3, 'quad': 4, '5.0': 5, '5.1': 6, '7.1': 8}
+
+class MediaProbe:
+    """قراءة مدة الملف وخصائصه من الترويسة دون فك ترميزه، مع ذاكرة صغيرة"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.environ.get('MEDIA_PROBE_CACHE_SIZE', 1024))
+        self.ffprobe = shutil.which(os.environ.get('FFPROBE_BINARY', 'ffprobe'))
+        # (المسار، وقت التعديل، الحجم) -> المعلومات؛ تعديل الملف يغير المفتاح
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def probe(self, file_path):
+        """معلومات الملف: duration دائماً، وsample_rate/channels للصوت وfps/size للفيديو، أو None"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        key = (os.path.realpath(file_path), stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return dict(self.entries[key])
+            self.misses += 1
+
+        try:
+            info = self._probe_wave(file_path)
+            if info is None:
+                info = self._probe_ffprobe(file_path) if self.ffprobe else self._probe_ffmpeg(file_path)
+        except Exception as e:
+            logger.error(f"Error probing media: {str(e)}")
+            info = None
+        if info is None:
+            return None
+
+        with self.lock:
+            self.entries[key] = info
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return dict(info)
+
+    def duration(self, file_path):
+        """مدة الملف بالثواني أو None"""
+        info = self.probe(file_path)
+        return info['duration'] if info else None
+
+    def _probe_wave(self, file_path):
+        """ملفات WAV بترميز PCM تُقرأ ترويستها مباشرة"""
+        if not file_path.lower().endswith('.wav'):
+            return None
+        try:
+            with wave.open(file_path, 'rb') as reader:
+                frames = reader.getnframes()
+                sample_rate = reader.getframerate()
+                channels = reader.getnchannels()
+        except (wave.Error, EOFError):
+            # صيغ WAV الأخرى (float مثلاً) تمر عبر ffmpeg
+            return None
+        return {
+            'duration': frames / sample_rate if sample_rate else 0.0,
+            'sample_rate': sample_rate,
+            'channels': channels,
+            'has_audio': True
+        }
+
+    def _probe_ffprobe(self, file_path):
+        """قراءة خصائص الملف عبر ffprobe"""
+        command = [
+            self.ffprobe, '-v', 'error',
+            '-show_entries', 'format=duration:stream=codec_type,sample_rate,channels,width,height,avg_frame_rate',
+            '-of', 'json', file_path
+        ]
+        result = subprocess.run(command, capture_output=True, text=True, timeout=30)
+        if result.returncode != 0:
+            return None
+        data = json.loads(result.stdout)
+
+        info = {'duration': float(data.get('format', {}).get('duration') or 0), 'has_audio': False}
+        for stream in data.get('streams', []):
+            if stream.get('codec_type') == 'video' and 'size' not in info:
+                info['size'] = [stream.get('width'), stream.get('height')]
+                numerator, _, denominator = (stream.get('avg_frame_rate') or '0/1').partition('/')
+                denominator = float(denominator or 1)
+                info['fps'] = float(numerator) / denominator if denominator else None
+            elif stream.get('codec_type') == 'audio' and not info['has_audio']:
+                info['has_audio'] = True
+                info['sample_rate'] = int(stream.get('sample_rate') or 0)
+                info['channels'] = int(stream.get('channels') or 1)
+        return info
+
+    def _probe_ffmpeg(self, file_path):
+        """قراءة خصائص الملف من مخرجات ffmpeg -i (الترويسة فقط)"""
+        command = [get_setting('FFMPEG_BINARY'), '-hide_banner', '-i', file_path]
+        result = subprocess.run(command, capture_output=True, text=True, timeout=30)
+        output = result.stderr
+
+        match = DURATION_PATTERN.search(output)
+        if not match:
+            return None
+        hours, minutes, seconds = match.groups()
+        info = {'duration': int(hours) * 3600 + int(minutes) * 60 + float(seconds), 'has_audio': False}
+
+        video = VIDEO_PATTERN.search(output)
+        if video:
+            info['size'] = [int(video.group(1)), int(video.group(2))]
+            info['fps'] = float(video.group(3)) if video.group(3) else None
+
+        audio = AUDIO_PATTERN.search(output)
+        if audio:
+            layout = (audio.group(2) or '').strip()
+            channels = re.match(r'(\d+) channels', layout)
+            info['has_audio'] = True
+            info['sample_rate'] = int(audio.group(1))
+            info['channels'] = int(channels.group(1)) if channels else CHANNEL_LAYOUTS.get(layout.split('(')[0], 1)
+        return info
+
+    def get_stats(self):
+        """إحصائيات الذاكرة"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+# إنشاء مثيل عام للاستخدام
+media_probe = MediaProbe()
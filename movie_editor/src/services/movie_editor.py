@@ -3,15 +3,41 @@ import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from moviepy.editor import *
+from moviepy.config import get_setting
 import json
 import logging
 import requests
 from datetime import datetime
 import tempfile
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.services.render_cache import render_cache
+from src.services.asset_resolver import asset_resolver
+from src.services.source_pool import SourcePool
+from src.services.compositor import compose_layers
+from src.services.timeline_index import IntervalIndex
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# أقصر مدة مسموحة للمقطع عند التقسيم المتوازي (بالثواني)
+MIN_SEGMENT_DURATION = 2.0
+
+def _silent_frame(t):
+    """إطار صوتي صامت ثنائي القناة"""
+    if isinstance(t, np.ndarray):
+        return np.zeros((len(t), 2))
+    return [0, 0]
+
+def _render_segment(job):
+    """تصدير مقطع واحد من الخط الزمني داخل عملية منفصلة"""
+    return movie_editor.create_movie_from_timeline(
+        job['timeline_data'],
+        job['output_path'],
+        job['settings']
+    )
+
 class MovieEditor:
     def __init__(self):
         self.temp_dir = tempfile.mkdtemp()
@@ -20,6 +46,8 @@ class MovieEditor:
         
     def create_movie_from_timeline(self, timeline_data, output_path, settings=None):
         """إنشاء فيلم من بيانات الخط الزمني"""
+        # كل ملف مصدر يُفتح مرة واحدة لهذا التصدير ويُغلق في نهايته
+        sources = SourcePool()
         try:
             if not settings:
                 settings = {
@@ -28,9 +56,13 @@ class MovieEditor:
                     'quality': 'high'
                 }
             
+            # العناصر الصوتية تذهب إلى مسار صوتي منفصل لا يدخل في تركيب الإطارات
+            audio_items = [item for item in timeline_data if item.get('element_type') == 'audio']
+            visual_items = [item for item in timeline_data if item.get('element_type') != 'audio']
+            
             # تجميع العناصر حسب الطبقات
             layers = {}
-            for item in timeline_data:
+            for item in visual_items:
                 layer = item.get('layer', 1)
                 if layer not in layers:
                     layers[layer] = []
@@ -39,13 +71,28 @@ class MovieEditor:
             # إنشاء مقاطع الفيديو لكل طبقة
             layer_clips = []
             for layer_num in sorted(layers.keys()):
-                layer_clip = self.create_layer_clip(layers[layer_num], settings)
-                if layer_clip:
-                    layer_clips.append(layer_clip)
+                clips = self.create_layer_clips(layers[layer_num], settings, sources)
+                if clips:
+                    layer_clips.append(clips)
+            
+            audio_bus = self.create_audio_bus(audio_items, sources)
             
             # دمج الطبقات
-            if layer_clips:
-                final_clip = CompositeVideoClip(layer_clips)
+            if layer_clips or audio_bus:
+                # المقاطع المتوازية تحتاج مدة ثابتة حتى لو كانت فارغة، والصوت بلا صورة يأخذ مدته
+                duration = settings.get('duration') or (None if layer_clips else audio_bus.duration)
+                final_clip = compose_layers(layer_clips, settings['resolution'], duration)
+                
+                # المسار الصوتي يُخلط مع صوت مقاطع الفيديو مرة واحدة
+                if audio_bus:
+                    tracks = [final_clip.audio, audio_bus] if final_clip.audio else [audio_bus]
+                    final_audio = CompositeAudioClip(tracks).set_duration(final_clip.duration)
+                    final_clip = final_clip.set_audio(final_audio)
+                
+                # مسار صوتي صامت حتى تتطابق تدفقات المقاطع عند الدمج
+                if settings.get('force_audio') and final_clip.audio is None:
+                    silence = AudioClip(_silent_frame, duration=final_clip.duration, fps=44100)
+                    final_clip = final_clip.set_audio(silence)
                 
                 # تطبيق الإعدادات النهائية
                 final_clip = final_clip.set_fps(settings['fps'])
@@ -63,20 +110,25 @@ class MovieEditor:
                 else:  # low
                     bitrate = '1000k'
                 
+                # ملف صوت مؤقت خاص بكل مخرج حتى لا تتصادم عمليات التصدير المتزامنة
+                temp_audio_name = os.path.splitext(os.path.basename(output_path))[0] + '_audio.m4a'
+                
                 final_clip.write_videofile(
                     output_path,
                     codec=codec,
                     audio_codec=audio_codec,
                     bitrate=bitrate,
-                    temp_audiofile=os.path.join(self.temp_dir, 'temp_audio.m4a'),
+                    preset=settings.get('preset', 'medium'),
+                    audio_fps=settings.get('audio_fps', 44100),
+                    threads=settings.get('threads'),
+                    temp_audiofile=os.path.join(self.temp_dir, temp_audio_name),
                     remove_temp=True
                 )
                 
-                # تنظيف الذاكرة
+                # تنظيف الذاكرة (قراء الملفات يغلقها مجمع المصادر)
                 final_clip.close()
-                for clip in layer_clips:
-                    clip.close()
                 
+                logger.info(f"Compositor: {final_clip.compositor.get_stats()}, source pool: {sources.get_stats()}")
                 return True
             else:
                 logger.error("No valid clips created")
@@ -85,32 +137,27 @@ class MovieEditor:
         except Exception as e:
             logger.error(f"Error creating movie: {str(e)}")
             return False
+        finally:
+            sources.close()
     
-    def create_layer_clip(self, layer_items, settings):
-        """إنشاء مقطع فيديو لطبقة واحدة"""
+    def create_layer_clips(self, layer_items, settings, sources):
+        """إنشاء مقاطع طبقة واحدة في مواضعها الزمنية، مرتبة حسب وقت البداية"""
         try:
             clips = []
             
             for item in layer_items:
-                clip = self.create_clip_from_item(item, settings)
+                clip = self.create_clip_from_item(item, settings, sources)
                 if clip:
                     clips.append(clip)
             
-            if clips:
-                # ترتيب المقاطع حسب وقت البداية
-                clips.sort(key=lambda x: x.start)
-                
-                # دمج المقاطع في الطبقة
-                layer_clip = concatenate_videoclips(clips, method="compose")
-                return layer_clip
-            
-            return None
+            clips.sort(key=lambda x: x.start)
+            return clips
             
         except Exception as e:
-            logger.error(f"Error creating layer clip: {str(e)}")
-            return None
+            logger.error(f"Error creating layer clips: {str(e)}")
+            return []
     
-    def create_clip_from_item(self, item, settings):
+    def create_clip_from_item(self, item, settings, sources):
         """إنشاء مقطع فيديو من عنصر واحد"""
         try:
             element_type = item.get('element_type')
@@ -119,11 +166,9 @@ class MovieEditor:
             duration = end_time - start_time
             
             if element_type == 'image':
-                return self.create_image_clip(item, duration, settings)
+                return self.create_image_clip(item, duration, settings, sources)
             elif element_type == 'video':
-                return self.create_video_clip(item, start_time, end_time, settings)
-            elif element_type == 'audio':
-                return self.create_audio_clip(item, start_time, end_time, settings)
+                return self.create_video_clip(item, start_time, end_time, settings, sources)
             elif element_type == 'text':
                 return self.create_text_clip(item, duration, settings)
             else:
@@ -134,7 +179,7 @@ class MovieEditor:
             logger.error(f"Error creating clip from item: {str(e)}")
             return None
     
-    def create_image_clip(self, item, duration, settings):
+    def create_image_clip(self, item, duration, settings, sources):
         """إنشاء مقطع فيديو من صورة"""
         try:
             # الحصول على مسار الصورة
@@ -142,8 +187,8 @@ class MovieEditor:
             if not image_path or not os.path.exists(image_path):
                 return None
             
-            # إنشاء مقطع الصورة
-            clip = ImageClip(image_path, duration=duration)
+            # إنشاء مقطع الصورة (الصورة تُفك مرة واحدة لكل العناصر)
+            clip = sources.image(image_path, duration)
             
             # تطبيق التحويلات
             clip = self.apply_transformations(clip, item, settings)
@@ -157,7 +202,7 @@ class MovieEditor:
             logger.error(f"Error creating image clip: {str(e)}")
             return None
     
-    def create_video_clip(self, item, start_time, end_time, settings):
+    def create_video_clip(self, item, start_time, end_time, settings, sources):
         """إنشاء مقطع فيديو من فيديو"""
         try:
             # الحصول على مسار الفيديو
@@ -165,13 +210,14 @@ class MovieEditor:
             if not video_path or not os.path.exists(video_path):
                 return None
             
-            # إنشاء مقطع الفيديو
-            clip = VideoFileClip(video_path)
+            # مقطع من قارئ مشترك مع العناصر الأخرى لنفس الملف
+            clip = sources.video(video_path, start_time, end_time)
             
-            # قص الفيديو حسب الوقت المطلوب
+            # قص الفيديو حسب الوقت المطلوب (مع إزاحة المصدر عند تقسيم العنصر)
             duration = end_time - start_time
-            if duration < clip.duration:
-                clip = clip.subclip(0, duration)
+            source_offset = item.get('source_offset', 0)
+            if source_offset or duration < clip.duration:
+                clip = clip.subclip(source_offset, min(source_offset + duration, clip.duration))
             
             # تطبيق التحويلات
             clip = self.apply_transformations(clip, item, settings)
@@ -185,33 +231,48 @@ class MovieEditor:
             logger.error(f"Error creating video clip: {str(e)}")
             return None
     
-    def create_audio_clip(self, item, start_time, end_time, settings):
-        """إنشاء مقطع صوتي"""
+    def create_audio_bus(self, audio_items, sources):
+        """خلط العناصر الصوتية في مسار واحد بإزاحاتها ومؤثراتها، أو None"""
+        try:
+            clips = []
+            for item in audio_items:
+                clip = self.create_audio_clip(item, item.get('start_time', 0), item.get('end_time', 5), sources)
+                if clip:
+                    clips.append(clip)
+            
+            if clips:
+                return CompositeAudioClip(clips)
+            
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error creating audio bus: {str(e)}")
+            return None
+    
+    def create_audio_clip(self, item, start_time, end_time, sources):
+        """إنشاء مقطع صوتي في موضعه من الخط الزمني"""
         try:
             # الحصول على مسار الصوت
             audio_path = self.get_asset_path(item)
             if not audio_path or not os.path.exists(audio_path):
                 return None
             
-            # إنشاء مقطع الصوت
-            audio_clip = AudioFileClip(audio_path)
+            # مقطع من قارئ مشترك مع العناصر الأخرى لنفس الملف
+            audio_clip = sources.audio(audio_path, start_time, end_time)
             
-            # قص الصوت حسب الوقت المطلوب
+            # قص الصوت حسب الوقت المطلوب (مع إزاحة المصدر عند تقسيم العنصر)
             duration = end_time - start_time
-            if duration < audio_clip.duration:
-                audio_clip = audio_clip.subclip(0, duration)
+            source_offset = item.get('source_offset', 0)
+            if source_offset or duration < audio_clip.duration:
+                audio_clip = audio_clip.subclip(source_offset, min(source_offset + duration, audio_clip.duration))
             
-            # إنشاء فيديو صامت بنفس المدة
-            video_clip = ColorClip(
-                size=settings['resolution'], 
-                color=(0, 0, 0), 
-                duration=duration
-            ).set_audio(audio_clip)
+            # تطبيق المؤثرات الصوتية
+            effects = item.get('effects')
+            if effects:
+                audio_clip = self.apply_audio_effects(audio_clip, effects)
             
             # تعيين وقت البداية
-            video_clip = video_clip.set_start(start_time)
-            
-            return video_clip
+            return audio_clip.set_start(start_time)
             
         except Exception as e:
             logger.error(f"Error creating audio clip: {str(e)}")
@@ -311,73 +372,335 @@ class MovieEditor:
             logger.error(f"Error applying effects: {str(e)}")
             return clip
     
+    def apply_audio_effects(self, clip, effects_json):
+        """تطبيق المؤثرات على مقطع صوتي"""
+        try:
+            if isinstance(effects_json, str):
+                effects = json.loads(effects_json)
+            else:
+                effects = effects_json
+            
+            for effect in effects:
+                effect_type = effect.get('type')
+                params = effect.get('params', {})
+                
+                if effect_type == 'fade_in':
+                    clip = clip.audio_fadein(params.get('duration', 1.0))
+                
+                elif effect_type == 'fade_out':
+                    clip = clip.audio_fadeout(params.get('duration', 1.0))
+                
+                elif effect_type == 'volume':
+                    clip = clip.volumex(params.get('factor', 1.0))
+            
+            return clip
+            
+        except Exception as e:
+            logger.error(f"Error applying audio effects: {str(e)}")
+            return clip
+    
     def get_asset_path(self, item):
         """الحصول على مسار الملف من العنصر"""
         try:
-            # هذه الدالة تحتاج للتكامل مع خدمات أخرى
-            # للحصول على مسارات الملفات الفعلية
-            element_id = item.get('element_id')
-            element_type = item.get('element_type')
+            # مسار محدد مسبقاً (مثل وكلاء المعاينة منخفضة الدقة)
+            if item.get('asset_path'):
+                return item['asset_path']
             
-            # مؤقتاً، نعيد مسار وهمي
-            return f"/path/to/{element_type}_{element_id}.jpg"
+            # المسارات توضع عند تجهيز التصدير عبر asset_resolver.resolve_timeline،
+            # وإلا يُبحث في الفهرس داخل العملية دون قاعدة البيانات
+            return asset_resolver.lookup_item(item)
             
         except Exception as e:
             logger.error(f"Error getting asset path: {str(e)}")
             return None
     
-    def create_preview(self, timeline_data, duration=10):
-        """إنشاء معاينة سريعة للفيلم"""
+    def plan_segments(self, timeline_data, segment_count, fps=24):
+        """تقسيم الخط الزمني إلى مقاطع زمنية، ويفضل القطع عند حدود المشاهد"""
+        total_duration = max((item.get('end_time', 0) for item in timeline_data), default=0)
+        if total_duration <= 0:
+            return []
+        
+        # لا نقسم إلى مقاطع أقصر من الحد الأدنى
+        max_segments = max(1, int(total_duration // MIN_SEGMENT_DURATION))
+        segment_count = max(1, min(int(segment_count or 1), max_segments))
+        if segment_count == 1:
+            return [(0.0, total_duration)]
+        
+        # بدايات المشاهد هي نقاط القطع المفضلة
+        scene_starts = {}
+        for item in timeline_data:
+            scene_id = item.get('scene_id')
+            start = item.get('start_time', 0)
+            if scene_id is not None and (scene_id not in scene_starts or start < scene_starts[scene_id]):
+                scene_starts[scene_id] = start
+        
+        candidates = sorted({
+            start for start in scene_starts.values()
+            if MIN_SEGMENT_DURATION <= start <= total_duration - MIN_SEGMENT_DURATION
+        })
+        
+        targets = [total_duration * k / segment_count for k in range(1, segment_count)]
+        if len(candidates) >= len(targets):
+            cuts = sorted({min(candidates, key=lambda t: abs(t - target)) for target in targets})
+        else:
+            cuts = targets
+        
+        # محاذاة نقاط القطع مع حدود الإطارات حتى لا تتكرر أو تسقط إطارات عند الدمج
+        cuts = sorted({round(cut * fps) / fps for cut in cuts})
+        bounds = [0.0] + [cut for cut in cuts if 0 < cut < total_duration] + [total_duration]
+        return list(zip(bounds[:-1], bounds[1:]))
+    
+    def slice_timeline(self, timeline_data, start, end):
+        """اقتطاع عناصر الخط الزمني الواقعة في نافذة زمنية وإزاحتها إلى الصفر"""
+        segment_items = []
+        
+        for item in timeline_data:
+            item_start = item.get('start_time', 0)
+            item_end = item.get('end_time', 0)
+            if item_end <= start or item_start >= end:
+                continue
+            
+            clipped = dict(item)
+            clipped['start_time'] = max(item_start, start) - start
+            clipped['end_time'] = min(item_end, end) - start
+            clipped['source_offset'] = item.get('source_offset', 0) + max(0, start - item_start)
+            
+            # مؤثرات البداية والنهاية تبقى فقط في الجزء الذي يحتوي الطرف الأصلي
+            effects = item.get('effects')
+            if effects:
+                if isinstance(effects, str):
+                    effects = json.loads(effects)
+                if item_start < start:
+                    effects = [e for e in effects if e.get('type') not in ('fade_in', 'crossfade')]
+                if item_end > end:
+                    effects = [e for e in effects if e.get('type') != 'fade_out']
+                clipped['effects'] = json.dumps(effects)
+            
+            segment_items.append(clipped)
+        
+        return segment_items
+    
+    def plan_scene_segments(self, timeline_data, fps=24):
+        """تقسيم الخط الزمني عند كل بداية مشهد (وحدة التخزين المؤقت للتصدير)"""
+        total_duration = max((item.get('end_time', 0) for item in timeline_data), default=0)
+        if total_duration <= 0:
+            return []
+        
+        # أبكر بداية لكل مشهد، محاذاة مع حدود الإطارات
+        scene_starts = {}
+        for item in timeline_data:
+            scene_id = item.get('scene_id')
+            if scene_id is not None:
+                start = round(item.get('start_time', 0) * fps) / fps
+                scene_starts[scene_id] = min(start, scene_starts.get(scene_id, start))
+        
+        cuts = {start for start in scene_starts.values() if 0 < start < total_duration}
+        
+        bounds = [0.0] + sorted(cuts) + [total_duration]
+        return list(zip(bounds[:-1], bounds[1:]))
+    
+    def asset_fingerprint(self, item):
+        """بصمة ملف الأصل حتى يُبطل المخزن عند تغير الملف نفسه"""
+        path = self.get_asset_path(item) if item.get('element_type') != 'text' else None
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            return f"{path}:{stat.st_size}:{int(stat.st_mtime)}"
+        return None
+    
+    def segment_worker_budget(self):
+        """حصة التصدير الواحد من الأنوية: كل عمال طابور التصدير قد يصدّرون في الوقت نفسه"""
+        render_workers = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+        return max(1, (os.cpu_count() or 1) // max(1, render_workers))
+    
+    def create_movie_segmented(self, timeline_data, output_path, settings=None, progress_callback=None, use_cache=False):
+        """تصدير الفيلم على مقاطع متوازية عبر أنوية المعالج ثم دمجها دون إعادة ترميز.
+        
+        مع use_cache تكون المقاطع هي المشاهد، ويُعاد استخدام المقاطع التي لم يتغير محتواها.
+        تعيد إحصائيات التصدير عند النجاح أو False عند الفشل.
+        """
         try:
-            # إنشاء معاينة قصيرة (أول 10 ثوانٍ)
-            preview_timeline = []
-            for item in timeline_data:
-                if item.get('start_time', 0) < duration:
-                    preview_item = item.copy()
-                    if preview_item.get('end_time', 0) > duration:
-                        preview_item['end_time'] = duration
-                    preview_timeline.append(preview_item)
-            
-            # إنشاء ملف معاينة مؤقت
-            preview_path = os.path.join(self.temp_dir, 'preview.mp4')
-            
-            settings = {
-                'resolution': (854, 480),  # دقة أقل للمعاينة
-                'fps': 24,
-                'quality': 'medium'
-            }
-            
-            success = self.create_movie_from_timeline(
-                preview_timeline, 
-                preview_path, 
-                settings
+            if not settings:
+                settings = {
+                    'resolution': self.default_resolution,
+                    'fps': self.default_fps,
+                    'quality': 'high'
+                }
+            
+            # الطلب أو RENDER_SEGMENT_WORKERS لا يتجاوزان حصة هذا التصدير من الأنوية
+            budget = self.segment_worker_budget()
+            workers = min(
+                settings.get('segment_workers') or int(os.environ.get('RENDER_SEGMENT_WORKERS', budget)),
+                budget
             )
             
-            if success:
-                return preview_path
+            if use_cache:
+                segments = self.plan_scene_segments(timeline_data, settings['fps'])
             else:
-                return None
+                segments = self.plan_segments(
+                    timeline_data,
+                    settings.get('segment_count') or workers,
+                    settings['fps']
+                )
+                if len(segments) <= 1:
+                    success = self.create_movie_from_timeline(timeline_data, output_path, settings)
+                    return {'segments': 1} if success else False
+            
+            if not segments:
+                logger.error("No valid clips created")
+                return False
+            
+            segment_dir = tempfile.mkdtemp(dir=self.temp_dir)
+            extension = os.path.splitext(output_path)[1] or '.mp4'
+            
+            # العناصر المتقاطعة مع كل مقطع من فهرس الفترات بدل المرور على الخط الزمني كله
+            intervals = IntervalIndex(
+                range(len(timeline_data)),
+                [item.get('start_time', 0) for item in timeline_data],
+                [item.get('end_time', 0) for item in timeline_data]
+            )
+            
+            jobs = []
+            for index, (start, end) in enumerate(segments):
+                segment_settings = dict(settings)
+                segment_settings.update({
+                    'duration': end - start,
+                    'force_audio': True,
+                    'threads': 1  # التوازي على مستوى العمليات وليس داخل المرمز
+                })
+                jobs.append({
+                    'timeline_data': self.slice_timeline(
+                        [timeline_data[position] for position in intervals.overlap(start, end).tolist()], start, end
+                    ),
+                    'output_path': os.path.join(segment_dir, f'segment_{index:04d}{extension}'),
+                    'settings': segment_settings,
+                    'cache_key': None
+                })
+            
+            report = [
+                {'index': index, 'start': start, 'end': end, 'status': 'pending'}
+                for index, (start, end) in enumerate(segments)
+            ]
+            
+            try:
+                # المقاطع غير المتغيرة تؤخذ من المخزن مباشرة
+                if use_cache:
+                    for index, job in enumerate(jobs):
+                        key_items = [
+                            dict(item, asset=self.asset_fingerprint(item)) for item in job['timeline_data']
+                        ]
+                        job['cache_key'] = render_cache.make_key(
+                            key_items, job['settings'], job['settings']['duration'], extension
+                        )
+                        if render_cache.fetch(job['cache_key'], job['output_path'], extension):
+                            report[index]['status'] = 'cached'
+                
+                pending = [index for index, r in enumerate(report) if r['status'] == 'pending']
+                done = len(jobs) - len(pending)
+                
+                if progress_callback and done:
+                    progress_callback(done, len(jobs), [dict(r) for r in report])
+                
+                if pending:
+                    with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+                        futures = {executor.submit(_render_segment, jobs[index]): index for index in pending}
+                        
+                        for future in as_completed(futures):
+                            index = futures[future]
+                            try:
+                                success = future.result()
+                            except Exception as e:
+                                logger.error(f"Segment {index} crashed: {str(e)}")
+                                success = False
+                            
+                            report[index]['status'] = 'completed' if success else 'failed'
+                            done += 1
+                            
+                            if success and jobs[index]['cache_key']:
+                                render_cache.store(jobs[index]['cache_key'], jobs[index]['output_path'], extension)
+                            
+                            if progress_callback:
+                                progress_callback(done, len(jobs), [dict(r) for r in report])
+                
+                if any(r['status'] == 'failed' for r in report):
+                    logger.error("One or more segments failed to render")
+                    return False
+                
+                if not self.concat_segments([job['output_path'] for job in jobs], output_path):
+                    return False
+                
+                cache_hits = len(jobs) - len(pending)
+                stats = {'segments': len(jobs)}
+                if use_cache:
+                    stats.update({
+                        'cache_hits': cache_hits,
+                        'cache_misses': len(pending),
+                        'cache_hit_ratio': round(cache_hits / len(jobs), 3)
+                    })
+                return stats
+                
+            finally:
+                shutil.rmtree(segment_dir, ignore_errors=True)
                 
         except Exception as e:
-            logger.error(f"Error creating preview: {str(e)}")
-            return None
+            logger.error(f"Error creating segmented movie: {str(e)}")
+            return False
     
-    def get_movie_info(self, video_path):
-        """الحصول على معلومات الفيديو"""
+    def concat_segments(self, segment_paths, output_path):
+        """دمج المقاطع بنسخ التدفقات مباشرة (بدون إعادة ترميز)"""
         try:
-            clip = VideoFileClip(video_path)
-            info = {
-                'duration': clip.duration,
-                'fps': clip.fps,
-                'size': clip.size,
-                'has_audio': clip.audio is not None
-            }
-            clip.close()
-            return info
+            list_path = os.path.join(
+                self.temp_dir,
+                os.path.splitext(os.path.basename(output_path))[0] + '_concat.txt'
+            )
+            
+            with open(list_path, 'w') as list_file:
+                for path in segment_paths:
+                    escaped = os.path.abspath(path).replace("'", "'\\''")
+                    list_file.write(f"file '{escaped}'\n")
+            
+            command = [
+                get_setting('FFMPEG_BINARY'), '-y', '-loglevel', 'error',
+                '-f', 'concat', '-safe', '0', '-i', list_path,
+                '-c', 'copy'
+            ]
+            if output_path.endswith('.mp4'):
+                command += ['-movflags', '+faststart']
+            command.append(output_path)
+            
+            try:
+                result = subprocess.run(command, capture_output=True, text=True)
+            finally:
+                os.unlink(list_path)
+            
+            if result.returncode != 0:
+                logger.error(f"ffmpeg concat failed: {result.stderr.strip()}")
+                return False
+            
+            return True
             
         except Exception as e:
-            logger.error(f"Error getting movie info: {str(e)}")
+            logger.error(f"Error concatenating segments: {str(e)}")
+            return False
+    
+    def create_preview(self, timeline_data, duration=10, start=0):
+        """إنشاء معاينة سريعة للفيلم عبر محرك المعاينة"""
+        from src.services.preview_engine import preview_engine
+        return preview_engine.render_preview(timeline_data, start, start + duration)
+    
+    def get_movie_info(self, video_path):
+        """الحصول على معلومات الفيديو من ترويسته دون فتح قارئ الإطارات"""
+        from src.services.media_probe import media_probe
+        info = media_probe.probe(video_path)
+        if info is None:
+            logger.error(f"Error getting movie info: could not probe {video_path}")
             return None
+        
+        return {
+            'duration': info['duration'],
+            'fps': info.get('fps'),
+            'size': info.get('size'),
+            'has_audio': info.get('has_audio', False)
+        }
     
     def extract_frames(self, video_path, times, output_dir):
         """استخراج إطارات من الفيديو"""
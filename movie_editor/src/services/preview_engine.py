@@ -0,0 +1,271 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import Counter
+from PIL import Image
+from moviepy.config import get_setting
+from src.services.movie_editor import movie_editor
+from src.services.render_cache import render_cache, PARTIAL_MAX_AGE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# امتدادات الصور التي يمكن تصغيرها مباشرة عبر PIL
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+class PreviewEngine:
+    def __init__(self, output_dir=None, proxy_dir=None, max_proxy_bytes=None):
+        base_dir = os.path.join(os.path.dirname(__file__), '..')
+        self.output_dir = output_dir or os.environ.get(
+            'PREVIEW_OUTPUT_DIR', os.path.join(base_dir, 'generated_movies', 'previews')
+        )
+        self.proxy_dir = proxy_dir or os.environ.get(
+            'PREVIEW_PROXY_DIR', os.path.join(base_dir, 'proxies')
+        )
+        self.max_proxy_bytes = max_proxy_bytes or int(os.environ.get('PREVIEW_PROXY_MAX_MB', 2048)) * 1024 * 1024
+        self.max_preview_bytes = int(os.environ.get('PREVIEW_OUTPUT_MAX_MB', 1024)) * 1024 * 1024
+        self.preview_height = int(os.environ.get('PREVIEW_HEIGHT', 480))
+        self.preview_fps = int(os.environ.get('PREVIEW_FPS', 12))
+        self.proxy_locks = {}
+        self.locks_guard = threading.Lock()
+        # وكلاء تستخدمهم معاينات جارية في هذه العملية فلا تُحذف عند التنظيف
+        self.held = Counter()
+        self.lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(self.proxy_dir, exist_ok=True)
+
+    def preview_resolution(self, project_resolution):
+        """دقة المعاينة مع الحفاظ على نسبة أبعاد المشروع"""
+        width, height = project_resolution
+        preview_height = min(self.preview_height, height)
+        ratio = preview_height / height
+        # المرمز يتطلب أبعاداً زوجية
+        preview_width = int(round(width * ratio / 2)) * 2
+        return (preview_width, int(preview_height // 2) * 2), ratio
+
+    def _proxy_lock(self, key):
+        """قفل لكل أصل حتى لا يُولد الوكيل مرتين في نفس الوقت"""
+        with self.locks_guard:
+            if key not in self.proxy_locks:
+                self.proxy_locks[key] = threading.Lock()
+            return self.proxy_locks[key]
+
+    def get_proxy(self, source_path, ratio, held=None):
+        """الحصول على نسخة منخفضة الدقة من الأصل (تُولد مرة واحدة لكل أصل ونسبة)
+
+        إذا أُعطيت قائمة held يُحجز فيها الوكيل تحت قفل التنظيف حتى تُمرر إلى release.
+        """
+        try:
+            if not source_path or not os.path.exists(source_path):
+                return None
+
+            extension = os.path.splitext(source_path)[1].lower()
+            is_image = extension in IMAGE_EXTENSIONS
+
+            stat = os.stat(source_path)
+            fingerprint = f"{os.path.abspath(source_path)}:{stat.st_size}:{int(stat.st_mtime)}:{ratio:.4f}"
+            key = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+            proxy_path = os.path.join(self.proxy_dir, key + ('.jpg' if is_image else '.mp4'))
+
+            if self._use(proxy_path, held):
+                return proxy_path
+
+            with self._proxy_lock(key):
+                if self._use(proxy_path, held):
+                    return proxy_path
+
+                partial_path = proxy_path + f".{os.getpid()}.partial" + os.path.splitext(proxy_path)[1]
+                if is_image:
+                    self._create_image_proxy(source_path, partial_path, ratio)
+                else:
+                    self._create_video_proxy(source_path, partial_path, ratio)
+                os.replace(partial_path, proxy_path)
+                self._use(proxy_path, held)
+
+            logger.info(f"Created preview proxy for {source_path}")
+            self.evict_proxies(keep=proxy_path)
+            return proxy_path
+
+        except Exception as e:
+            logger.error(f"Error creating preview proxy: {str(e)}")
+            return None
+
+    def _use(self, path, held=None):
+        """تحديث وقت استخدام ملف موجود لسياسة LRU وحجزه، ويعيد False إذا لم يكن موجوداً"""
+        with self.lock:
+            try:
+                os.utime(path, None)
+            except FileNotFoundError:
+                return False
+            if held is not None and path not in held:
+                self.held[path] += 1
+                held.append(path)
+        return True
+
+    def release(self, paths):
+        """فك حجز وكلاء بعد انتهاء المعاينة"""
+        with self.lock:
+            self.held.subtract(paths)
+            for path in paths:
+                if self.held[path] <= 0:
+                    del self.held[path]
+
+    def _files(self, directory):
+        """ملفات المجلد مع وقت آخر استخدام والحجم، دون الملفات المؤقتة"""
+        entries = []
+        for name in os.listdir(directory):
+            if '.partial' in name:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _proxies(self):
+        """قائمة الوكلاء مع وقت آخر استخدام والحجم"""
+        return self._files(self.proxy_dir)
+
+    def _evict(self, entries, max_bytes, keep=None):
+        """حذف الأقدم استخداماً حتى يعود الحجم تحت الحد، عدا المحجوز"""
+        entries = sorted(entries)
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            # الفحص والحذف تحت نفس القفل الذي يُؤخذ به الحجز
+            with self.lock:
+                if path in self.held:
+                    continue
+                try:
+                    os.unlink(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+
+    def evict_proxies(self, keep=None):
+        """حذف الوكلاء الأقدم استخداماً حتى يعود حجمها تحت الحد"""
+        self._evict(self._proxies(), self.max_proxy_bytes, keep)
+
+    def sweep_partials(self):
+        """حذف ملفات المعاينة المؤقتة التي تركتها عمليات انقطعت قبل النشر"""
+        cutoff = time.time() - PARTIAL_MAX_AGE
+        for directory in (self.output_dir, self.proxy_dir):
+            for name in os.listdir(directory):
+                if '.partial' not in name:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def evict_previews(self, keep=None):
+        """حذف ملفات المعاينة الأقدم استخداماً حتى يعود حجمها تحت الحد"""
+        self.sweep_partials()
+        self._evict(self._files(self.output_dir), self.max_preview_bytes, keep)
+
+    def _create_image_proxy(self, source_path, proxy_path, ratio):
+        """تصغير صورة إلى دقة المعاينة"""
+        with Image.open(source_path) as image:
+            size = (max(1, int(image.width * ratio)), max(1, int(image.height * ratio)))
+            image = image.convert('RGB').resize(size, Image.BILINEAR)
+            image.save(proxy_path, 'JPEG', quality=80)
+
+    def _create_video_proxy(self, source_path, proxy_path, ratio):
+        """تحويل فيديو إلى نسخة منخفضة الدقة سريعة القراءة"""
+        command = [
+            get_setting('FFMPEG_BINARY'), '-y', '-loglevel', 'error',
+            '-i', source_path,
+            '-vf', f"scale=trunc(iw*{ratio:.4f}/2)*2:trunc(ih*{ratio:.4f}/2)*2",
+            '-r', str(self.preview_fps),
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '30',
+            '-g', str(self.preview_fps),  # إطار مفتاحي كل ثانية لتسريع القفز داخل الملف
+            '-c:a', 'aac', '-b:a', '64k',
+            '-f', 'mp4', proxy_path
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip())
+
+    def build_preview_timeline(self, timeline_data, start, end, ratio, held=None):
+        """اقتطاع نافذة المعاينة واستبدال الأصول بوكلائها وتحجيم الإحداثيات"""
+        preview_items = []
+
+        for item in movie_editor.slice_timeline(timeline_data, start, end):
+            element_type = item.get('element_type')
+
+            if element_type in ('image', 'video'):
+                proxy_path = self.get_proxy(movie_editor.get_asset_path(item), ratio, held)
+                if not proxy_path:
+                    continue
+                item['asset_path'] = proxy_path
+            elif element_type == 'text':
+                item['font_size'] = max(1, int(item.get('font_size', 50) * ratio))
+
+            # الإحداثيات بوحدات بكسل المشروع، والوكلاء مصغرة بنفس النسبة
+            item['position_x'] = int(item.get('position_x', 0) * ratio)
+            item['position_y'] = int(item.get('position_y', 0) * ratio)
+            preview_items.append(item)
+
+        return preview_items
+
+    def render_preview(self, timeline_data, start=0, end=10, project_resolution=None):
+        """إنشاء معاينة سريعة لنافذة زمنية، وتعيد مسار ملفها
+
+        الملف مفتاحه محتوى النافذة (العناصر بعد الاقتطاع ووكلاؤها والإعدادات)، فطلب نفس النافذة
+        دون تعديل يعيد الملف الموجود، وملفات المعاينة القديمة تُحذف عند تجاوز حدها.
+        """
+        held = []
+        try:
+            if end <= start:
+                return None
+
+            project_resolution = project_resolution or movie_editor.default_resolution
+            resolution, ratio = self.preview_resolution(project_resolution)
+
+            preview_items = self.build_preview_timeline(timeline_data, start, end, ratio, held)
+
+            settings = {
+                'resolution': resolution,
+                'fps': self.preview_fps,
+                'quality': 'low',
+                'preset': 'ultrafast',
+                'audio_fps': 22050,
+                'duration': end - start
+            }
+
+            key = render_cache.make_key(preview_items, settings, end - start)
+            preview_path = os.path.join(self.output_dir, f"preview_{key[:32]}.mp4")
+            if self._use(preview_path):
+                return preview_path
+
+            partial_path = os.path.join(
+                self.output_dir, f".preview_{key[:32]}.{os.getpid()}.{threading.get_ident()}.partial.mp4"
+            )
+            if not movie_editor.create_movie_from_timeline(preview_items, partial_path, settings):
+                if os.path.exists(partial_path):
+                    os.unlink(partial_path)
+                return None
+            os.replace(partial_path, preview_path)
+
+            self.evict_previews(keep=preview_path)
+            return preview_path
+
+        except Exception as e:
+            logger.error(f"Error rendering preview: {str(e)}")
+            return None
+        finally:
+            self.release(held)
+
+# إنشاء مثيل عام للاستخدام
+preview_engine = PreviewEngine()
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# يتغير عند تغيير طريقة التصدير حتى تُهمل المقاطع القديمة
+CACHE_VERSION = 1
+
+# حقول العنصر التي لا تؤثر على الصورة الناتجة
+VOLATILE_FIELDS = ('id', 'movie_id', 'scene_id', 'created_at')
+
+# إعدادات التصدير التي تؤثر على ملف المقطع
+SETTINGS_FIELDS = ('resolution', 'fps', 'quality', 'preset')
+
+# الملفات المؤقتة الأقدم من هذا (بالثواني) بقايا عمليات توقفت أثناء الكتابة
+PARTIAL_MAX_AGE = 3600
+
+class RenderCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get(
+            'RENDER_CACHE_DIR',
+            os.path.join(os.path.dirname(__file__), '..', 'render_cache')
+        )
+        self.max_bytes = max_bytes or int(os.environ.get('RENDER_CACHE_MAX_MB', 2048)) * 1024 * 1024
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, segment_items, settings, duration, extension='.mp4'):
+        """مفتاح المحتوى لمقطع: بصمة عناصره وإعدادات التصدير"""
+        items = []
+        for item in segment_items:
+            normalized = {k: v for k, v in item.items() if k not in VOLATILE_FIELDS}
+            # المؤثرات قد تصل كنص JSON أو كقائمة
+            if isinstance(normalized.get('effects'), str):
+                normalized['effects'] = json.loads(normalized['effects'] or '[]')
+            items.append(normalized)
+
+        items.sort(key=lambda i: json.dumps(i, sort_keys=True, default=str))
+
+        payload = {
+            'version': CACHE_VERSION,
+            'items': items,
+            'settings': {k: settings.get(k) for k in SETTINGS_FIELDS},
+            'duration': round(duration, 6),
+            'extension': extension
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def entry_path(self, key, extension='.mp4'):
+        """مسار ملف المقطع المخزن"""
+        return os.path.join(self.cache_dir, f"{key}{extension}")
+
+    def partial_path(self, key, extension='.mp4'):
+        """مسار مؤقت للكتابة قبل النشر الذري في المخزن"""
+        return os.path.join(self.cache_dir, f".{key}.{os.getpid()}.partial{extension}")
+
+    def fetch(self, key, destination, extension='.mp4'):
+        """نسخ مقطع مخزن إلى مسار العمل (ربط صلب إن أمكن)، ويعيد True عند الإصابة"""
+        path = self.entry_path(key, extension)
+        try:
+            try:
+                os.link(path, destination)
+            except OSError:
+                shutil.copyfile(path, destination)
+            # تحديث وقت الاستخدام لسياسة LRU
+            os.utime(path, None)
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Render cache read failed for {key}: {str(e)}")
+            return False
+
+    def store(self, key, rendered_path, extension='.mp4'):
+        """نشر مقطع مُصدَّر في المخزن ثم تطبيق حد الحجم"""
+        try:
+            partial = self.partial_path(key, extension)
+            try:
+                os.link(rendered_path, partial)
+            except OSError:
+                shutil.copyfile(rendered_path, partial)
+            os.replace(partial, self.entry_path(key, extension))
+            self.evict()
+            return True
+        except Exception as e:
+            logger.warning(f"Render cache write failed for {key}: {str(e)}")
+            return False
+
+    def _entries(self):
+        """قائمة الملفات المخزنة مع الحجم ووقت آخر استخدام"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def sweep_partials(self):
+        """حذف الملفات المؤقتة التي تركتها عمليات انقطعت قبل النشر"""
+        cutoff = time.time() - PARTIAL_MAX_AGE
+        for name in os.listdir(self.cache_dir):
+            if not (name.startswith('.') and '.partial' in name):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        """حذف الأقدم استخداماً حتى يعود الحجم تحت الحد"""
+        self.sweep_partials()
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self):
+        """إحصائيات المخزن"""
+        entries = self._entries()
+        return {
+            'entries': len(entries),
+            'size_bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes
+        }
+
+    def clear(self):
+        """إفراغ المخزن"""
+        for _, _, path in self._entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+# إنشاء مثيل عام للاستخدام
+render_cache = RenderCache()
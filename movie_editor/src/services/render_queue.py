@@ -0,0 +1,414 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from sqlalchemy import and_, or_
+from src.models.movie_project import MovieProject, RenderTask, db
+from src.services.asset_resolver import asset_resolver
+from src.services.timeline_index import timeline_indexes
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# أولويات مسارات التصدير (الرقم الأصغر يُنفذ أولاً)
+RENDER_PRIORITIES = {
+    'preview': 0,
+    'scene': 1,
+    'full_movie': 2
+}
+
+# طابور التقدم داخل العملية العاملة (يُورث عند التهيئة)
+_progress_queue = None
+
+def _init_render_worker(progress_queue):
+    """تهيئة العملية العاملة"""
+    global _progress_queue
+    _progress_queue = progress_queue
+
+def report_progress(task_id, progress, **details):
+    """إرسال تقدم المهمة من العملية العاملة إلى المجدول"""
+    if _progress_queue is None or task_id is None:
+        return
+    try:
+        _progress_queue.put_nowait((task_id, progress, details))
+    except Exception as e:
+        logger.warning(f"Could not report render progress: {str(e)}")
+
+def run_render_job(job):
+    """تنفيذ مهمة التصدير داخل عملية عاملة"""
+    from src.services.movie_editor import movie_editor
+
+    started_at = time.time()
+    task_id = job['task_id']
+
+    stats = None
+
+    if job.get('preview_window'):
+        # مسار المعاينة: وكلاء منخفضة الدقة ومرمز فائق السرعة
+        from src.services.preview_engine import preview_engine
+
+        start, end = job['preview_window']
+        preview_path = preview_engine.render_preview(
+            job['timeline_data'], start, end, job['settings']['resolution']
+        )
+        return {
+            'success': preview_path is not None,
+            'output_path': preview_path,
+            'movie_info': None,
+            'stats': None,
+            'elapsed': time.time() - started_at
+        }
+
+    if job['settings'].get('segmented') or job['settings'].get('cache'):
+        def on_segment_done(done, total, segments):
+            report_progress(task_id, 10 + int(85 * done / total), segments=segments)
+
+        stats = movie_editor.create_movie_segmented(
+            job['timeline_data'],
+            job['output_path'],
+            job['settings'],
+            progress_callback=on_segment_done,
+            use_cache=bool(job['settings'].get('cache'))
+        )
+        success = bool(stats)
+    else:
+        report_progress(task_id, 50)
+        success = movie_editor.create_movie_from_timeline(
+            job['timeline_data'],
+            job['output_path'],
+            job['settings']
+        )
+
+    movie_info = movie_editor.get_movie_info(job['output_path']) if success else None
+
+    return {
+        'success': success,
+        'movie_info': movie_info,
+        'stats': stats or None,
+        'elapsed': time.time() - started_at
+    }
+
+class QueueFullError(Exception):
+    """طابور التصدير ممتلئ"""
+    def __init__(self, queued, limit):
+        super().__init__(f"Render queue is full ({queued}/{limit})")
+        self.queued = queued
+        self.limit = limit
+
+class RenderQueue:
+    def __init__(self, max_workers=None, max_queued=None, poll_interval=None):
+        self.max_workers = max_workers or int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+        self.max_queued = max_queued or int(os.environ.get('RENDER_QUEUE_LIMIT', 16))
+        self.poll_interval = poll_interval or float(os.environ.get('RENDER_QUEUE_POLL', 2.0))
+        # تقسيم التصدير الكامل على المشاهد اختياري: كل مشهد يصبح مقطعاً ودمجاً إضافياً
+        self.cache_enabled = os.environ.get('RENDER_CACHE_ENABLED', '0') == '1'
+        self.app = None
+        self.output_dir = None
+        self.executor = None
+        self.progress_queue = None
+        self.active = {}  # task_id -> Future
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.started = False
+
+    def start(self, app, output_dir):
+        """تشغيل مجدول التصدير ومجمع العمليات"""
+        # العمليات العاملة تعيد استيراد التطبيق، فلا نشغل المجدول داخلها
+        if self.started or multiprocessing.parent_process() is not None:
+            return
+
+        self.app = app
+        self.output_dir = output_dir
+
+        self.progress_queue = multiprocessing.get_context('spawn').Queue()
+        self.executor = self._create_executor()
+
+        with app.app_context():
+            self.recover_interrupted_tasks()
+
+        threading.Thread(target=self._dispatch_loop, name='render-dispatcher', daemon=True).start()
+        threading.Thread(target=self._progress_loop, name='render-progress', daemon=True).start()
+
+        self.started = True
+        logger.info(f"Render queue started with {self.max_workers} workers")
+
+    def _create_executor(self):
+        """مجمع عمليات جديد يشارك طابور التقدم نفسه"""
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_render_worker,
+            initargs=(self.progress_queue,)
+        )
+
+    def _replace_broken_executor(self, broken):
+        """استبدال المجمع إذا انهارت إحدى عملياته (مرة واحدة مهما تعدد المكتشفون)"""
+        with self.lock:
+            if self.executor is not broken:
+                return
+            self.executor = self._create_executor()
+        broken.shutdown(wait=False)
+        logger.warning("Render worker pool was broken and has been recreated")
+
+    def recover_interrupted_tasks(self):
+        """إعادة المهام المقطوعة إلى الطابور بعد إعادة التشغيل"""
+        interrupted = RenderTask.query.filter_by(status='processing').all()
+        for task in interrupted:
+            task.status = 'queued'
+            task.progress = 0
+        if interrupted:
+            db.session.commit()
+            logger.info(f"Re-queued {len(interrupted)} interrupted render tasks")
+
+    def enqueue(self, task):
+        """إضافة مهمة تصدير إلى الطابور مع التحقق من الضغط"""
+        queued = RenderTask.query.filter_by(status='queued').count()
+        if queued >= self.max_queued:
+            raise QueueFullError(queued, self.max_queued)
+
+        task.status = 'queued'
+        task.progress = 0
+        if task.priority is None:
+            task.priority = RENDER_PRIORITIES.get(task.task_type, RENDER_PRIORITIES['full_movie'])
+
+        db.session.add(task)
+        db.session.commit()
+
+        self.wakeup.set()
+        return self.queue_position(task)
+
+    def queue_position(self, task):
+        """موقع المهمة في الطابور (1 = التالية)، أو 0 إذا لم تعد في الانتظار"""
+        if task.status != 'queued':
+            return 0
+
+        ahead = RenderTask.query.filter(
+            RenderTask.status == 'queued',
+            or_(
+                RenderTask.priority < task.priority,
+                and_(RenderTask.priority == task.priority, RenderTask.id < task.id)
+            )
+        ).count()
+        return ahead + 1
+
+    def get_stats(self):
+        """إحصائيات الطابور والعمال"""
+        lanes = {}
+        for lane, priority in RENDER_PRIORITIES.items():
+            lanes[lane] = RenderTask.query.filter_by(status='queued', priority=priority).count()
+
+        with self.lock:
+            active = list(self.active.keys())
+
+        return {
+            'workers': self.max_workers,
+            'active_tasks': active,
+            'queued': sum(lanes.values()),
+            'queue_limit': self.max_queued,
+            'lanes': lanes
+        }
+
+    def _dispatch_loop(self):
+        """حلقة توزيع المهام المنتظرة على العمال"""
+        while True:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            try:
+                with self.app.app_context():
+                    self._dispatch_pending()
+            except Exception as e:
+                logger.error(f"Error dispatching render tasks: {str(e)}")
+
+    def _dispatch_pending(self):
+        """إرسال المهام ذات الأولوية الأعلى إلى العمال المتاحين"""
+        with self.lock:
+            free_slots = self.max_workers - len(self.active)
+        if free_slots <= 0:
+            return
+
+        tasks = RenderTask.query.filter_by(status='queued').order_by(
+            RenderTask.priority, RenderTask.id
+        ).limit(free_slots).all()
+
+        for task in tasks:
+            try:
+                job = self._prepare_job(task)
+            except Exception as e:
+                # مهمة لا يمكن تجهيزها تفشل وحدها ولا توقف رأس الطابور
+                logger.error(f"Error preparing render task {task.id}: {str(e)}")
+                db.session.rollback()
+                task.status = 'failed'
+                task.error_message = f'فشل في تجهيز المهمة: {str(e)}'
+                db.session.commit()
+                continue
+            if job is None:
+                continue
+
+            task.status = 'processing'
+            task.progress = 10
+            db.session.commit()
+
+            executor = self.executor
+            try:
+                future = executor.submit(run_render_job, job)
+            except BrokenProcessPool as e:
+                # المهمة تعود إلى الطابور وتُرسل إلى المجمع الجديد في الدورة التالية
+                logger.error(f"Render worker pool is broken: {str(e)}")
+                asset_resolver.release(job['asset_paths'])
+                task.status = 'queued'
+                task.progress = 0
+                db.session.commit()
+                self._replace_broken_executor(executor)
+                self.wakeup.set()
+                return
+            except Exception as e:
+                logger.error(f"Error submitting render task {task.id}: {str(e)}")
+                asset_resolver.release(job['asset_paths'])
+                task.status = 'failed'
+                task.error_message = str(e)
+                db.session.commit()
+                continue
+
+            with self.lock:
+                self.active[task.id] = future
+            future.add_done_callback(
+                lambda f, task_id=task.id, output_path=job['output_path'], asset_paths=job['asset_paths']:
+                    self._on_job_done(task_id, output_path, f, asset_paths)
+            )
+
+    def _prepare_job(self, task):
+        """تجهيز بيانات المهمة في العملية الرئيسية (قاعدة البيانات لا تغادرها)"""
+        project = MovieProject.query.get(task.movie_id)
+        revision = (project.timeline_revision or 0) if project else 0
+
+        timeline_data = timeline_indexes.get(task.movie_id, revision).all()
+        if task.scene_id:
+            timeline_data = [item for item in timeline_data if item.get('scene_id') == task.scene_id]
+
+        if not timeline_data or not project:
+            task.status = 'failed'
+            task.error_message = 'لا توجد عناصر في الخط الزمني'
+            db.session.commit()
+            return None
+
+        render_settings = json.loads(task.render_settings) if task.render_settings else {}
+
+        settings = {
+            'resolution': tuple(map(int, project.resolution.split('x'))),
+            'fps': project.frame_rate,
+            'quality': task.quality
+        }
+
+        # إعدادات التصدير المتوازي على مقاطع
+        for key in ('segmented', 'segment_count', 'segment_workers'):
+            if key in render_settings:
+                settings[key] = render_settings[key]
+
+        # إعادة استخدام المشاهد غير المتغيرة من مخزن التصدير
+        settings['cache'] = bool(render_settings.get('cache', self.cache_enabled))
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"{project.title}_{timestamp}_{task.id}.{task.output_format}"
+
+        job = {
+            'task_id': task.id,
+            'timeline_data': timeline_data,
+            'output_path': os.path.join(self.output_dir, filename),
+            'settings': settings
+        }
+
+        if task.task_type == 'preview':
+            # مسار المعاينة: نافذة زمنية عبر محرك المعاينة
+            start = float(render_settings.get('start', 0))
+            end = float(render_settings.get('end', start + render_settings.get('duration', 10)))
+            job['preview_window'] = (start, end)
+
+        # مسارات الأصول في المخزن المحلي باستعلام واحد مهما طال الخط الزمني، وملفاتها
+        # محجوزة (من لحظة حلها) حتى ينتهي العامل فلا يحذفها تنظيف المخزن
+        job['asset_paths'] = []
+        asset_resolver.resolve_timeline(task.movie_id, timeline_data, held=job['asset_paths'])
+
+        return job
+
+    def _on_job_done(self, task_id, output_path, future, asset_paths=()):
+        """تحديث المهمة والمشروع عند انتهاء العامل"""
+        with self.lock:
+            self.active.pop(task_id, None)
+        asset_resolver.release(asset_paths)
+
+        try:
+            with self.app.app_context():
+                task = RenderTask.query.get(task_id)
+                if not task:
+                    return
+
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Render worker crashed for task {task_id}: {str(e)}")
+                    result = {'success': False, 'error': str(e)}
+
+                if result.get('success'):
+                    output_path = result.get('output_path') or output_path
+                    project = MovieProject.query.get(task.movie_id)
+                    movie_info = result.get('movie_info')
+
+                    if project and task.task_type != 'preview':
+                        project.output_path = output_path
+                        if movie_info:
+                            project.duration = movie_info.get('duration')
+
+                    task.status = 'completed'
+                    task.output_path = output_path
+                    task.progress = 100
+                    task.actual_duration = int(result.get('elapsed', 0))
+                    if result.get('stats'):
+                        task.render_stats = json.dumps(result['stats'])
+                    logger.info(f"Movie render completed for project {task.movie_id}")
+                else:
+                    task.status = 'failed'
+                    task.error_message = result.get('error', 'فشل في تصدير الفيلم')
+
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"Error finishing render task {task_id}: {str(e)}")
+        finally:
+            self.wakeup.set()
+
+    def _progress_loop(self):
+        """نقل تقارير التقدم من العمال إلى قاعدة البيانات"""
+        while True:
+            try:
+                task_id, progress, details = self.progress_queue.get()
+            except (EOFError, OSError):
+                return
+
+            # دمج التقارير المتراكمة لنفس المهمة في كتابة واحدة
+            updates = {task_id: (progress, details)}
+            while True:
+                try:
+                    task_id, progress, details = self.progress_queue.get_nowait()
+                except queue.Empty:
+                    break
+                updates[task_id] = (progress, details)
+
+            try:
+                with self.app.app_context():
+                    for task_id, (progress, details) in updates.items():
+                        task = RenderTask.query.get(task_id)
+                        if task and task.status == 'processing':
+                            task.progress = progress
+                            if 'segments' in details:
+                                task.segment_progress = json.dumps(details['segments'])
+                    db.session.commit()
+            except Exception as e:
+                logger.error(f"Error saving render progress: {str(e)}")
+
+# إنشاء مثيل عام للاستخدام
+render_queue = RenderQueue()
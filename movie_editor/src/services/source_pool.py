@@ -0,0 +1,84 @@
+import logging
+from moviepy.editor import ImageClip, VideoFileClip, AudioFileClip
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class SharedReader:
+    """قارئ ملف مفتوح مع فترات الخط الزمني المحجوزة عليه"""
+
+    def __init__(self, clip):
+        self.clip = clip
+        self.intervals = []
+
+    def is_free(self, start, end):
+        """القارئ لا يُشارك بين عناصر تتداخل زمنياً حتى لا يقفز بينها ذهاباً وإياباً"""
+        return all(end <= busy_start or start >= busy_end for busy_start, busy_end in self.intervals)
+
+class SourcePool:
+    """مصادر تصدير واحد: كل ملف يُفتح مرة وتُشتق منه مقاطع العناصر
+
+    الصور تُفك مرة واحدة وتتشارك مصفوفتها، والفيديو والصوت يتشاركان قارئ ffmpeg
+    بين العناصر غير المتداخلة زمنياً، ويُغلق كل شيء عند close.
+    """
+
+    def __init__(self):
+        self.images = {}  # المسار -> مقطع صورة أساسي
+        self.readers = {}  # (النوع، المسار) -> [SharedReader]
+        self.requests = 0
+
+    def image(self, path, duration):
+        """مقطع صورة بالمدة المطلوبة يشارك المصفوفة المفكوكة"""
+        self.requests += 1
+        base = self.images.get(path)
+        if base is None:
+            base = ImageClip(path)
+            self.images[path] = base
+        return base.set_duration(duration)
+
+    def video(self, path, start, end):
+        """مقطع فيديو أساسي لقارئ مشترك غير محجوز في [start, end) من الخط الزمني"""
+        return self._lease('video', path, start, end, VideoFileClip)
+
+    def audio(self, path, start, end):
+        """مقطع صوت أساسي لقارئ مشترك غير محجوز في [start, end) من الخط الزمني"""
+        return self._lease('audio', path, start, end, AudioFileClip)
+
+    def _lease(self, kind, path, start, end, opener):
+        """حجز قارئ للفترة، أو فتح قارئ جديد إذا كانت كل القراء مشغولة فيها"""
+        self.requests += 1
+        readers = self.readers.setdefault((kind, path), [])
+        for reader in readers:
+            if reader.is_free(start, end):
+                break
+        else:
+            reader = SharedReader(opener(path))
+            readers.append(reader)
+        reader.intervals.append((start, end))
+        # المقطع الأساسي لا يُعدل؛ القص والتحويلات تعيد نسخاً تشارك القارئ
+        return reader.clip
+
+    def get_stats(self):
+        """عدد الملفات المفتوحة مقابل عدد العناصر"""
+        return {
+            'requests': self.requests,
+            'images': len(self.images),
+            'readers': sum(len(readers) for readers in self.readers.values())
+        }
+
+    def close(self):
+        """إغلاق كل القراء وتحرير الصور المفكوكة"""
+        for readers in self.readers.values():
+            for reader in readers:
+                try:
+                    reader.clip.close()
+                except Exception as e:
+                    logger.warning(f"Could not close source reader: {str(e)}")
+        self.readers.clear()
+        self.images.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,261 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from src.models.movie_project import Timeline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# حجم كتل الأوراق التي تُفحص دفعة واحدة بدل النزول في الشجرة
+LEAF_BLOCK = 32
+
+class IntervalIndex:
+    """فترات [start, end) بمفاتيح صحيحة في مصفوفات مرتبة حسب البداية
+
+    فوقها شجرة مقاطع ضمنية (مصفوفة واحدة) لأقصى نهاية في كل عقدة، فالبحث لا ينزل
+    إلا في الفروع التي فيها فترة تمتد بعد اللحظة المطلوبة: O(log n + k).
+    """
+
+    def __init__(self, keys=(), starts=(), ends=()):
+        keys = np.asarray(keys, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        # الترتيب بالبداية ثم بالمفتاح حتى تكون النتائج ثابتة
+        order = np.lexsort((keys, starts))
+        self.keys = keys[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self._build()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _build(self):
+        """بناء شجرة أقصى النهايات من الأوراق إلى الجذر، مستوى كامل في كل خطوة"""
+        size = 1
+        while size < len(self.ends):
+            size <<= 1
+        tree = np.full(2 * size, -np.inf)
+        tree[size:size + len(self.ends)] = self.ends
+
+        level = size
+        while level > 1:
+            tree[level // 2:level] = np.maximum(tree[level:2 * level:2], tree[level + 1:2 * level:2])
+            level //= 2
+
+        self.size = size
+        self.tree = tree
+
+    @property
+    def end(self):
+        """أبعد نهاية بين كل الفترات"""
+        return float(self.tree[1]) if len(self) else 0.0
+
+    def insert(self, key, start, end):
+        """إضافة فترة في موضعها من الترتيب"""
+        lo = int(np.searchsorted(self.starts, start, side='left'))
+        hi = int(np.searchsorted(self.starts, start, side='right'))
+        position = lo + int(np.searchsorted(self.keys[lo:hi], key))
+
+        self.keys = np.insert(self.keys, position, key)
+        self.starts = np.insert(self.starts, position, start)
+        self.ends = np.insert(self.ends, position, end)
+        self._build()
+
+    def remove(self, key):
+        """حذف فترة بمفتاحها، ويعيد True إذا وُجدت"""
+        positions = np.flatnonzero(self.keys == key)
+        if not len(positions):
+            return False
+        self.keys = np.delete(self.keys, positions)
+        self.starts = np.delete(self.starts, positions)
+        self.ends = np.delete(self.ends, positions)
+        self._build()
+        return True
+
+    def stab(self, t):
+        """مفاتيح الفترات التي تحتوي t، بترتيب البداية"""
+        limit = int(np.searchsorted(self.starts, t, side='right'))
+        return self.keys[self._search(limit, t)]
+
+    def overlap(self, start, end):
+        """مفاتيح الفترات المتقاطعة مع [start, end)، بترتيب البداية"""
+        limit = int(np.searchsorted(self.starts, end, side='left'))
+        return self.keys[self._search(limit, start)]
+
+    def _search(self, limit, threshold):
+        """مواضع الفترات بين أول limit فترة التي تنتهي بعد threshold"""
+        if limit <= 0 or self.tree[1] <= threshold:
+            return np.empty(0, dtype=np.int64)
+
+        found = []
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo >= limit or self.tree[node] <= threshold:
+                continue
+            if hi - lo <= LEAF_BLOCK:
+                stop = min(hi, limit)
+                found.append(lo + np.flatnonzero(self.ends[lo:stop] > threshold))
+                continue
+            middle = (lo + hi) // 2
+            # الفرع الأيمن أولاً في المكدس حتى يخرج الأيسر قبله
+            stack.append((2 * node + 1, middle, hi))
+            stack.append((2 * node, lo, middle))
+
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+class TimelineIndex:
+    """عناصر الخط الزمني لفيلم واحد مع فهرس فترات للكل وآخر لكل طبقة"""
+
+    def __init__(self, items=(), revision=0):
+        self.revision = revision
+        self.items = {item['id']: item for item in items}
+        self.lock = threading.RLock()
+
+        values = list(self.items.values())
+        self.intervals = self._interval_index(values)
+        self.layers = {}
+        for layer in {item.get('layer', 1) for item in values}:
+            self.layers[layer] = self._interval_index([item for item in values if item.get('layer', 1) == layer])
+
+    @classmethod
+    def from_rows(cls, rows, revision=0):
+        """بناء الفهرس من صفوف Timeline"""
+        return cls([row.to_dict() for row in rows], revision)
+
+    def _interval_index(self, items):
+        return IntervalIndex(
+            [item['id'] for item in items],
+            [item.get('start_time') or 0 for item in items],
+            [item.get('end_time') or 0 for item in items]
+        )
+
+    def __len__(self):
+        return len(self.items)
+
+    def upsert(self, item):
+        """إضافة عنصر أو استبداله بعد تعديله"""
+        with self.lock:
+            self.remove(item['id'])
+            self.items[item['id']] = item
+            start, end = item.get('start_time') or 0, item.get('end_time') or 0
+            self.intervals.insert(item['id'], start, end)
+            self.layers.setdefault(item.get('layer', 1), IntervalIndex()).insert(item['id'], start, end)
+
+    def remove(self, item_id):
+        """حذف عنصر إن وجد"""
+        with self.lock:
+            item = self.items.pop(item_id, None)
+            if item is None:
+                return
+            self.intervals.remove(item_id)
+            layer = item.get('layer', 1)
+            self.layers[layer].remove(item_id)
+            if not len(self.layers[layer]):
+                del self.layers[layer]
+
+    def _index(self, layer):
+        return self.intervals if layer is None else self.layers.get(layer)
+
+    def _items(self, keys):
+        # نسخ حتى لا تغير الإضافات (مثل asset_path) العناصر المفهرسة
+        return [dict(self.items[key]) for key in keys.tolist()]
+
+    def at(self, t, layer=None):
+        """العناصر الظاهرة عند اللحظة t (اختيارياً في طبقة واحدة)"""
+        with self.lock:
+            index = self._index(layer)
+            return self._items(index.stab(t)) if index else []
+
+    def between(self, start, end, layer=None):
+        """العناصر المتقاطعة مع النافذة [start, end)"""
+        with self.lock:
+            index = self._index(layer)
+            return self._items(index.overlap(start, end)) if index else []
+
+    def all(self, layer=None):
+        """كل العناصر (أو عناصر طبقة) بترتيب البداية"""
+        with self.lock:
+            index = self._index(layer)
+            return self._items(index.keys) if index else []
+
+    def layer_numbers(self):
+        """أرقام الطبقات تصاعدياً"""
+        with self.lock:
+            return sorted(self.layers)
+
+    @property
+    def duration(self):
+        with self.lock:
+            return self.intervals.end
+
+class TimelineIndexCache:
+    """فهارس الخطوط الزمنية المحفوظة لكل فيلم، صالحة ما دامت مراجعة المشروع نفسها"""
+
+    def __init__(self, max_projects=None):
+        self.max_projects = max_projects or int(os.environ.get('TIMELINE_INDEX_PROJECTS', 64))
+        self.entries = OrderedDict()  # movie_id -> TimelineIndex
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+        self.lock = threading.Lock()
+
+    def get(self, movie_id, revision):
+        """فهرس الفيلم عند المراجعة المعطاة، ويُبنى باستعلام واحد عند الحاجة"""
+        with self.lock:
+            index = self.entries.get(movie_id)
+            if index is not None and index.revision == revision:
+                self.entries.move_to_end(movie_id)
+                self.hits += 1
+                return index
+            self.misses += 1
+
+        rows = Timeline.query.filter_by(movie_id=movie_id).all()
+        index = TimelineIndex.from_rows(rows, revision)
+
+        with self.lock:
+            self.entries[movie_id] = index
+            while len(self.entries) > self.max_projects:
+                self.entries.popitem(last=False)
+        return index
+
+    def apply(self, movie_id, revision, upsert=None, remove=None):
+        """تطبيق تعديل عنصر على الفهرس المحفوظ إذا كان على المراجعة السابقة مباشرة
+
+        أي تعديل فائت (من عملية أخرى مثلاً) يجعل الفهرس يُبنى من جديد عند الطلب التالي.
+        """
+        with self.lock:
+            index = self.entries.get(movie_id)
+            if index is None:
+                return
+            if index.revision != revision - 1:
+                del self.entries[movie_id]
+                return
+            self.updates += 1
+
+        with index.lock:
+            if remove is not None:
+                index.remove(remove)
+            if upsert is not None:
+                index.upsert(upsert)
+            index.revision = revision
+
+    def get_stats(self):
+        """إحصائيات الفهارس المحفوظة"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'projects': len(self.entries),
+                'max_projects': self.max_projects,
+                'items': sum(len(index) for index in self.entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'updates': self.updates,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+# إنشاء مثيل عام للاستخدام
+timeline_indexes = TimelineIndexCache()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# الاختبارات تستورد الخدمة كحزمة src كما تفعل main.py
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
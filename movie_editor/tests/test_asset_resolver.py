@@ -0,0 +1,101 @@
+import os
+import pytest
+from flask import Flask
+from src.models.movie_project import db, AssetLibrary
+from src.services.asset_resolver import AssetResolver
+
+def write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return str(path)
+
+@pytest.fixture
+def resolver(tmp_path):
+    return AssetResolver(store_dir=str(tmp_path / 'store'), max_bytes=10 ** 6)
+
+def test_local_source_is_copied_not_linked(tmp_path, resolver):
+    source = write(tmp_path / 'a.png', b'a' * 100)
+    mtime = os.stat(source).st_mtime_ns
+    blob = resolver._ingest_local(source)
+
+    assert os.stat(blob).st_ino != os.stat(source).st_ino
+    assert resolver._ingest_local(source) == blob
+    assert os.stat(source).st_mtime_ns == mtime
+
+    # إعادة كتابة المصدر في مكانه لا تغير نسخة المخزن
+    write(source, b'b' * 100)
+    with open(blob, 'rb') as f:
+        assert f.read(1) == b'a'
+
+def test_identical_content_shares_one_blob(tmp_path, resolver):
+    first = resolver._ingest_local(write(tmp_path / 'a.png', b'same'))
+    second = resolver._ingest_local(write(tmp_path / 'b.png', b'same'))
+    assert first == second
+    assert resolver.get_stats()['blobs'] == 1
+
+def test_evict_skips_held_blobs(tmp_path, resolver):
+    resolver.max_bytes = 250
+    blobs = [resolver._ingest_local(write(tmp_path / f'{name}.png', name.encode() * 100)) for name in 'ab']
+    held = []
+    assert resolver._hold_path(blobs[0], held)
+
+    resolver._ingest_local(write(tmp_path / 'c.png', b'c' * 100))
+    assert os.path.exists(blobs[0])
+    assert not os.path.exists(blobs[1])
+
+    resolver.release(held)
+    assert resolver.get_stats()['held'] == 0
+
+@pytest.fixture
+def assets(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        assets = [
+            AssetLibrary(movie_id=1, asset_type='image', source_service='visual', name=f'asset {position}',
+                         file_path=write(tmp_path / f'{position}.png', bytes([position]) * 10))
+            for position in range(3)
+        ]
+        db.session.add_all(assets)
+        db.session.commit()
+        yield assets
+
+def test_resolve_timeline_queries_once(resolver, assets):
+    timeline = [{'element_type': 'image', 'element_id': asset.id} for asset in assets * 2]
+    timeline.append({'element_type': 'text', 'element_id': 1})
+    resolver.resolve_timeline(1, timeline)
+    assert all(item['asset_path'].startswith(resolver.blobs_dir) for item in timeline[:-1])
+    assert 'asset_path' not in timeline[-1]
+
+    again = [{'element_type': 'image', 'element_id': asset.id} for asset in assets]
+    resolver.resolve_timeline(1, again)
+    assert resolver.queries == 1
+
+def test_resolve_timeline_holds_paths_it_returns(resolver, assets):
+    timeline = [{'element_type': 'image', 'element_id': asset.id} for asset in assets]
+    held = []
+    resolver.resolve_timeline(1, timeline, held=held)
+
+    assert sorted(held) == sorted(item['asset_path'] for item in timeline)
+    resolver.max_bytes = 0
+    resolver.evict()
+    assert all(os.path.exists(path) for path in held)
+
+    resolver.release(held)
+    resolver.evict()
+    assert resolver.get_stats()['blobs'] == 0
+
+def test_blob_evicted_after_lookup_is_fetched_again(resolver, assets):
+    timeline = [{'element_type': 'image', 'element_id': assets[0].id}]
+    resolver.resolve_timeline(1, timeline)
+    os.unlink(timeline[0]['asset_path'])
+
+    held = []
+    again = [{'element_type': 'image', 'element_id': assets[0].id}]
+    resolver.resolve_timeline(1, again, held=held)
+
+    assert held == [again[0]['asset_path']]
+    assert os.path.exists(held[0])
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+editor = pytest.importorskip('moviepy.editor')
+from src.services.compositor import LayerCompositor, compose_layers
+
+SIZE = (160, 90)
+
+def build_layers(seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = SIZE
+    background = [
+        editor.ImageClip(np.full((height, width, 3), rng.integers(0, 255, 3), dtype=np.uint8))
+        .set_start(start).set_duration(2.5)
+        for start in (0.0, 2.0, 4.0)
+    ]
+    overlay = [
+        editor.ImageClip(rng.integers(0, 255, (40, 60, 3), dtype=np.uint8))
+        .set_position((30, 20)).set_opacity(0.6).set_start(0.5).set_duration(3.0),
+        editor.ImageClip(rng.integers(0, 255, (30, 200, 3), dtype=np.uint8))
+        .set_position((-20, 70)).set_start(3.0).set_duration(2.0)
+    ]
+    titles = [
+        editor.ImageClip(np.full((10, 40, 3), 255, dtype=np.uint8)).add_mask()
+        .set_position(('center', 'bottom')).set_start(1.0).set_duration(4.0)
+    ]
+    return [background, overlay, titles]
+
+def test_frames_match_composite_video_clip():
+    layers = build_layers()
+    reference = editor.CompositeVideoClip([clip for clips in layers for clip in clips], size=SIZE)
+    clip = compose_layers(layers, SIZE)
+
+    assert clip.duration == pytest.approx(reference.duration)
+    for t in np.linspace(0, reference.duration, 25, endpoint=False):
+        expected = reference.get_frame(t).astype(int)
+        # الفرق الوحيد المسموح هو تقريب المزج بالقناع
+        assert np.abs(clip.get_frame(t).astype(int) - expected).max() <= 1
+
+def test_background_fills_gaps():
+    layers = [[editor.ImageClip(np.full((90, 160, 3), 200, dtype=np.uint8)).set_start(1.0).set_duration(1.0)]]
+    compositor = LayerCompositor(layers, SIZE)
+    assert compositor.make_frame(0.5).max() == 0
+    assert compositor.make_frame(1.5).min() == 200
+
+def test_opaque_full_frame_clip_hides_lower_layers():
+    layers = build_layers()
+    compositor = LayerCompositor(layers, SIZE)
+    compositor.make_frame(0.25)
+    assert compositor.get_stats()['occluded'] == 0
+
+    # خلفية معتمة فوقها طبقة أخرى معتمة بملء الإطار: الأدنى لا يُرسم
+    cover = [editor.ImageClip(np.zeros((90, 160, 3), dtype=np.uint8)).set_duration(5.0)]
+    compositor = LayerCompositor(layers[:1] + [cover], SIZE)
+    compositor.make_frame(0.25)
+    assert compositor.get_stats() == {'frames': 1, 'blits': 1, 'occluded': 1}
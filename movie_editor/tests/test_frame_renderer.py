@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+editor = pytest.importorskip('moviepy.editor')
+from PIL import Image
+from src.services.frame_renderer import FrameRenderer, FrameSources
+
+SIZE = (64, 36)
+FPS = 10
+
+@pytest.fixture
+def video(tmp_path):
+    # كل إطار بلون مختلف حتى يظهر أي خطأ في رقم الإطار
+    path = str(tmp_path / 'source.mp4')
+    frames = [np.full((SIZE[1], SIZE[0], 3), value, dtype=np.uint8) for value in range(0, 200, 20)]
+    editor.ImageSequenceClip(frames, fps=FPS).write_videofile(path, fps=FPS, codec='libx264', audio=False,
+                                                                  logger=None)
+    return path
+
+def timeline(tmp_path, video):
+    image = str(tmp_path / 'overlay.png')
+    Image.fromarray(np.full((10, 20, 3), 255, dtype=np.uint8)).save(image)
+    return [
+        {'id': 1, 'element_type': 'video', 'asset_path': video, 'start_time': 0, 'end_time': 1, 'layer': 1},
+        {'id': 2, 'element_type': 'image', 'asset_path': image, 'start_time': 0, 'end_time': 1, 'layer': 2,
+         'position_x': 5, 'position_y': 5}
+    ]
+
+def test_frames_match_file_reader(video):
+    sources = FrameSources(10 ** 7)
+    clip = sources.video(video)
+    reference = editor.VideoFileClip(video)
+    try:
+        for t in (0.0, 0.35, 0.7, 0.1):
+            assert np.array_equal(clip.get_frame(t), reference.get_frame(t))
+    finally:
+        reference.close()
+        sources.close()
+
+def test_scrubbing_back_reuses_decoded_frames(video):
+    sources = FrameSources(10 ** 7)
+    clip = sources.video(video)
+    for t in (0.0, 0.3, 0.6, 0.3, 0.0):
+        clip.get_frame(t)
+
+    assert sources.get_stats()['frames']['misses'] == 3
+    assert sources.get_stats()['frames']['hits'] == 2
+    sources.close()
+
+def test_reader_limit_closes_only_oldest(tmp_path, video):
+    other = str(tmp_path / 'other.mp4')
+    editor.VideoFileClip(video).write_videofile(other, fps=FPS, codec='libx264', audio=False, logger=None)
+
+    sources = FrameSources(10 ** 7, max_readers=1)
+    first, second = sources.video(video), sources.video(other)
+    assert sources.get_stats()['readers'] == 1
+    assert sources._source(other).reader is not None
+
+    # القارئ المغلق يُعاد فتحه عند الحاجة
+    first.get_frame(0.5)
+    assert sources._source(video).reader is not None
+    assert sources._source(other).reader is None
+    second.get_frame(0.5)
+    assert sources.get_stats()['opened'] == 4
+    sources.close()
+
+def test_render_frame_keeps_clips_and_compositor_per_revision(tmp_path, video):
+    renderer = FrameRenderer()
+    items = timeline(tmp_path, video)
+
+    first = renderer.composite(1, 1, items, 0.5, SIZE, FPS)
+    again = renderer.composite(1, 1, items, 0.5, SIZE, FPS)
+    assert np.array_equal(first, again)
+    assert renderer.get_stats()['clips']['misses'] == 2
+    assert renderer.get_stats()['clips']['hits'] == 2
+    assert renderer.get_stats()['compositors'] == 1
+
+    # الصورة فوق الفيديو في موضعها
+    assert first[10, 10].min() == 255
+    assert first[30, 50].max() < 255
+
+    # مراجعة جديدة تُنشئ مقاطعها وتلغي محركات المراجعة السابقة
+    renderer.composite(1, 2, items, 0.5, SIZE, FPS)
+    assert list(renderer.compositors) == [(1, 2, SIZE)]
+    renderer.sources.close()
+
+def test_rendered_frame_is_cached(tmp_path, video):
+    renderer = FrameRenderer()
+    items = timeline(tmp_path, video)
+
+    data = renderer.render_frame(1, 1, items, 0.5, SIZE, FPS, width=32)
+    assert renderer.render_frame(1, 1, items, 0.5, SIZE, FPS, width=32) == data
+    assert renderer.get_stats()['composited_frames']['hits'] == 1
+    renderer.sources.close()
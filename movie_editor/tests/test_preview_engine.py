@@ -0,0 +1,66 @@
+import os
+import pytest
+from PIL import Image
+
+pytest.importorskip('cv2')
+pytest.importorskip('moviepy.editor')
+
+from src.services import preview_engine as preview_module
+from src.services.preview_engine import PreviewEngine
+
+def write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return str(path)
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = PreviewEngine(output_dir=str(tmp_path / 'previews'), proxy_dir=str(tmp_path / 'proxies'))
+    renders = []
+
+    def create_movie_from_timeline(items, output_path, settings):
+        renders.append(output_path)
+        write(output_path, 1000)
+        return True
+
+    monkeypatch.setattr(preview_module.movie_editor, 'create_movie_from_timeline', create_movie_from_timeline)
+    engine.renders = renders
+    return engine
+
+TIMELINE = [{'id': 1, 'element_type': 'text', 'content': 'title', 'start_time': 0, 'end_time': 20}]
+
+def test_same_window_reuses_preview_file(engine):
+    first = engine.render_preview(TIMELINE, 0, 5, (1280, 720))
+    again = engine.render_preview([dict(item) for item in TIMELINE], 0, 5, (1280, 720))
+
+    assert first == again and len(engine.renders) == 1
+    assert os.listdir(engine.output_dir) == [os.path.basename(first)]
+
+    edited = [dict(TIMELINE[0], content='other')]
+    assert engine.render_preview(edited, 0, 5, (1280, 720)) != first
+
+def test_previews_are_capped(engine):
+    paths = [engine.render_preview(TIMELINE, start, start + 1, (1280, 720)) for start in range(4)]
+    for age, path in enumerate(paths):
+        os.utime(path, (age, age))
+
+    # إعادة استخدام معاينة تجعلها الأحدث
+    assert engine.render_preview(TIMELINE, 1, 2, (1280, 720)) == paths[1]
+    engine.max_preview_bytes = 2500
+    engine.evict_previews()
+    assert [os.path.exists(path) for path in paths] == [False, True, False, True]
+
+def test_held_proxy_survives_eviction(engine, tmp_path):
+    source = str(tmp_path / 'source.png')
+    Image.new('RGB', (64, 64), (10, 20, 30)).save(source)
+    engine.max_proxy_bytes = 0
+    held = []
+
+    proxy = engine.get_proxy(source, 0.5, held)
+    assert held == [proxy]
+    engine.evict_proxies()
+    assert os.path.exists(proxy)
+
+    engine.release(held)
+    engine.evict_proxies()
+    assert not os.path.exists(proxy)
@@ -0,0 +1,52 @@
+import os
+import time
+from src.services.render_cache import RenderCache, PARTIAL_MAX_AGE
+
+SETTINGS = {'resolution': (640, 360), 'fps': 24, 'quality': 'high'}
+
+def write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return str(path)
+
+def test_key_ignores_volatile_fields_and_effect_encoding():
+    cache_items = [{'id': 1, 'scene_id': 3, 'element_type': 'text', 'effects': '[{"type": "fade_in"}]'}]
+    same_items = [{'id': 9, 'scene_id': 4, 'element_type': 'text', 'effects': [{'type': 'fade_in'}]}]
+    cache = RenderCache.__new__(RenderCache)
+    assert cache.make_key(cache_items, SETTINGS, 2.0) == cache.make_key(same_items, SETTINGS, 2.0)
+    assert cache.make_key(cache_items, SETTINGS, 2.0) != cache.make_key(cache_items, dict(SETTINGS, fps=30), 2.0)
+
+def test_store_and_fetch(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), 10 ** 6)
+    rendered = write(tmp_path / 'segment.mp4', 100)
+    assert cache.store('k', rendered)
+
+    destination = str(tmp_path / 'copy.mp4')
+    assert cache.fetch('k', destination)
+    assert os.path.getsize(destination) == 100
+    assert not cache.fetch('missing', str(tmp_path / 'none.mp4'))
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), 10 ** 6)
+    for position, key in enumerate(('a', 'b', 'c')):
+        cache.store(key, write(tmp_path / f'{key}.mp4', 100))
+        os.utime(cache.entry_path(key), (position, position))
+    cache.max_bytes = 250
+
+    # استخدام a يجعله الأحدث فيُحذف b بدلاً منه
+    cache.fetch('a', str(tmp_path / 'a_copy.mp4'))
+    cache.evict()
+    assert os.path.exists(cache.entry_path('a'))
+    assert not os.path.exists(cache.entry_path('b'))
+    assert cache.get_stats()['size_bytes'] <= 250
+
+def test_evict_sweeps_stale_partials(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), 10 ** 6)
+    stale = write(cache.partial_path('old').replace(str(os.getpid()), '1'), 10)
+    fresh = write(cache.partial_path('new'), 10)
+    old = time.time() - PARTIAL_MAX_AGE - 60
+    os.utime(stale, (old, old))
+
+    cache.evict()
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
@@ -0,0 +1,111 @@
+import numpy as np
+from flask import Flask
+from src.models.movie_project import db, Timeline
+from src.services.timeline_index import IntervalIndex, TimelineIndex, TimelineIndexCache
+
+def random_intervals(count, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0, 500, count)
+    ends = starts + rng.exponential(3, count)
+    # بعض الفترات الطويلة جداً حتى تُختبر فروع الشجرة البعيدة
+    ends[::97] += 200
+    return list(range(count)), starts, ends
+
+def brute_stab(keys, starts, ends, t):
+    found = [key for key in keys if starts[key] <= t < ends[key]]
+    return sorted(found, key=lambda key: (starts[key], key))
+
+def brute_overlap(keys, starts, ends, start, end):
+    found = [key for key in keys if starts[key] < end and ends[key] > start]
+    return sorted(found, key=lambda key: (starts[key], key))
+
+def test_stab_matches_brute_force():
+    keys, starts, ends = random_intervals(2000)
+    index = IntervalIndex(keys, starts, ends)
+    for t in np.random.default_rng(1).uniform(-10, 800, 200):
+        assert index.stab(t).tolist() == brute_stab(keys, starts, ends, t)
+
+def test_overlap_matches_brute_force():
+    keys, starts, ends = random_intervals(2000)
+    index = IntervalIndex(keys, starts, ends)
+    rng = np.random.default_rng(2)
+    for start in rng.uniform(-10, 800, 200):
+        end = start + rng.uniform(0, 30)
+        assert index.overlap(start, end).tolist() == brute_overlap(keys, starts, ends, start, end)
+
+def test_insert_and_remove_match_brute_force():
+    keys, starts, ends = random_intervals(500)
+    index = IntervalIndex(keys, starts, ends)
+    rng = np.random.default_rng(3)
+
+    for _ in range(100):
+        key = int(rng.integers(0, len(keys)))
+        assert index.remove(key)
+        starts[key] = rng.uniform(0, 500)
+        ends[key] = starts[key] + rng.exponential(3)
+        index.insert(key, starts[key], ends[key])
+
+    assert len(index) == len(keys)
+    assert index.end == ends.max()
+    for t in rng.uniform(0, 800, 100):
+        assert index.stab(t).tolist() == brute_stab(keys, starts, ends, t)
+
+def test_empty_index_and_missing_key():
+    index = IntervalIndex()
+    assert index.stab(1.0).tolist() == []
+    assert index.overlap(0, 10).tolist() == []
+    assert index.end == 0.0
+    assert not index.remove(5)
+
+def test_interval_is_half_open():
+    index = IntervalIndex([1, 2], [0.0, 2.0], [2.0, 4.0])
+    assert index.stab(2.0).tolist() == [2]
+    assert index.overlap(2.0, 2.5).tolist() == [2]
+
+def test_timeline_index_layers_and_updates():
+    items = [
+        {'id': 1, 'layer': 1, 'start_time': 0, 'end_time': 5},
+        {'id': 2, 'layer': 2, 'start_time': 1, 'end_time': 3},
+        {'id': 3, 'layer': 1, 'start_time': 5, 'end_time': 8}
+    ]
+    index = TimelineIndex(items)
+    assert [item['id'] for item in index.at(2)] == [1, 2]
+    assert [item['id'] for item in index.at(2, layer=2)] == [2]
+    assert index.layer_numbers() == [1, 2]
+
+    index.upsert({'id': 2, 'layer': 3, 'start_time': 6, 'end_time': 7})
+    assert index.layer_numbers() == [1, 3]
+    assert [item['id'] for item in index.between(5.5, 6.5)] == [3, 2]
+
+    index.remove(3)
+    assert index.duration == 7
+    # النتائج نسخ لا تغير العناصر المفهرسة
+    index.at(6)[0]['asset_path'] = 'x'
+    assert 'asset_path' not in index.at(6)[0]
+
+def test_index_cache_rebuilds_on_missed_revision():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        for position in range(3):
+            db.session.add(Timeline(movie_id=1, scene_id=1, element_type='text', element_id=position,
+                                    start_time=position, end_time=position + 2, layer=1))
+        db.session.commit()
+
+        cache = TimelineIndexCache(max_projects=2)
+        index = cache.get(1, 0)
+        assert len(index) == 3
+        assert cache.get(1, 0) is index
+
+        # تعديل على المراجعة التالية يُطبق على الفهرس نفسه
+        cache.apply(1, 1, remove=index.all()[0]['id'])
+        assert cache.get(1, 1) is index and len(index) == 2
+
+        # تعديل فائت يجعل الفهرس يُبنى من قاعدة البيانات
+        cache.apply(1, 3, remove=index.all()[0]['id'])
+        rebuilt = cache.get(1, 3)
+        assert rebuilt is not index and len(rebuilt) == 3
+        assert cache.get_stats()['misses'] == 2
@@ -0,0 +1,84 @@
+"""قياس زمن توليد الصورة على المعالج لكل إعداد من إعدادات التحسين"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import torch
+from src.services.image_generator import ImageGenerator, DEFAULT_MODEL
+
+PROMPT = "a traditional market in an old city at sunset"
+
+def build_configurations(args, bf16_supported):
+    """الإعدادات المقارنة: من الأساس حتى النموذج المقطر
+
+    بدون دعم bfloat16 يُحذف سطره لأنه يطابق السطر السابق، وتُوسم الأسطر التالية بأنها float32.
+    """
+    configurations = [
+        ('baseline float32', dict(attention_slicing=False, channels_last=False, use_bf16=False), {}),
+        ('slicing + channels_last', dict(attention_slicing=True, channels_last=True, use_bf16=False), {}),
+    ]
+    if bf16_supported:
+        configurations.append(('+ bfloat16', dict(attention_slicing=True, channels_last=True, use_bf16=True), {}))
+
+    fallback = '' if bf16_supported else ' (float32 fallback)'
+    configurations.append((
+        f'+ dpm scheduler{fallback}',
+        dict(attention_slicing=True, channels_last=True, use_bf16=bf16_supported),
+        {'scheduler': 'dpm', 'num_inference_steps': args.fast_steps}
+    ))
+    if args.distilled_model:
+        configurations.append((
+            f'distilled {args.distilled_model}{fallback}',
+            dict(attention_slicing=True, channels_last=True, use_bf16=bf16_supported, default_model=args.distilled_model),
+            {'scheduler': 'dpm', 'num_inference_steps': args.fast_steps}
+        ))
+    return configurations
+
+def run_configuration(name, options, overrides, args):
+    """تشغيل إعداد واحد ويعيد الثواني لكل صورة"""
+    generator = ImageGenerator(cpu_threads=args.threads, device='cpu', **options)
+    if not generator.load_model(options.get('default_model', args.model)):
+        raise RuntimeError(f"Failed to load model for {name}")
+
+    params = dict(width=args.size, height=args.size, num_inference_steps=args.steps, seed=0)
+    params.update(overrides)
+
+    # تشغيل تسخيني لا يُحسب
+    generator.generate_image(PROMPT, **dict(params, num_inference_steps=1))
+
+    started = time.time()
+    for _ in range(args.images):
+        generator.generate_image(PROMPT, **params)
+    seconds = (time.time() - started) / args.images
+
+    generator.cleanup_models()
+    return seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--distilled-model', default=os.environ.get('IMAGE_CPU_MODEL'))
+    parser.add_argument('--threads', type=int, default=os.cpu_count())
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--fast-steps', type=int, default=12)
+    parser.add_argument('--images', type=int, default=2)
+    args = parser.parse_args()
+
+    bf16_supported = ImageGenerator(device='cpu', use_bf16=False).bf16_supported()
+    print(f"torch {torch.__version__}, {args.threads} threads, {args.size}x{args.size}, "
+          f"bfloat16 {'supported' if bf16_supported else 'not supported'}")
+    print(f"{'configuration':<40} {'s/image':>10}")
+
+    for name, options, overrides in build_configurations(args, bf16_supported):
+        try:
+            seconds = run_configuration(name, options, overrides, args)
+            print(f"{name:<40} {seconds:>10.2f}")
+        except Exception as e:
+            print(f"{name:<40} {'failed':>10}  ({str(e)})")
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,9 @@ from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.visual import visual_bp
+from src.routes.visual import visual_bp, GENERATED_FILES_DIR
+from src.services.generation_scheduler import generation_scheduler
+from src.services.image_generator import image_generator
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -24,10 +26,20 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
 # إضافة نماذج المحتوى البصري إلى قاعدة البيانات
-from src.models.visual_content import VisualContent, GenerationTask
+from src.models.visual_content import VisualContent, GenerationTask, GenerationCacheEntry
+from src.models.visual_content import db as visual_db
+visual_db.init_app(app)
 
 with app.app_context():
     db.create_all()
+    visual_db.create_all()
+
+# تشغيل مجدول التوليد المجمع (عامل واحد يملك النموذج)
+generation_scheduler.start(app, GENERATED_FILES_DIR)
+
+# تسخين النموذج الافتراضي عند بدء الخدمة وتفريغ النماذج الخاملة
+warmup_models = [image_generator.default_model] if os.environ.get('IMAGE_MODEL_WARMUP', '0') == '1' else []
+image_generator.registry.start(warmup_models)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
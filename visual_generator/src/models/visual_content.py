@@ -50,10 +50,14 @@ class GenerationTask(db.Model):
     scene_id = db.Column(db.Integer, nullable=True)
     prompt = db.Column(db.Text, nullable=False)
     parameters = db.Column(db.Text, nullable=True)  # JSON string
-    status = db.Column(db.String(50), default='queued')  # queued, processing, completed, failed
+    status = db.Column(db.String(50), default='queued')  # queued, processing, completed, failed, cancelled
     result_path = db.Column(db.String(500), nullable=True)
+    preview_path = db.Column(db.String(500), nullable=True)  # معاينة منخفضة الدقة أثناء التوليد
     error_message = db.Column(db.Text, nullable=True)
     progress = db.Column(db.Integer, default=0)  # 0-100
+    current_step = db.Column(db.Integer, default=0)
+    total_steps = db.Column(db.Integer, nullable=True)
+    request_data = db.Column(db.Text, nullable=True)  # طلب التوليد كاملاً (JSON) لإعادته إلى الطابور بعد إعادة التشغيل
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -67,9 +71,38 @@ class GenerationTask(db.Model):
             'parameters': self.parameters,
             'status': self.status,
             'result_path': self.result_path,
+            'preview_path': self.preview_path,
             'error_message': self.error_message,
             'progress': self.progress,
+            'current_step': self.current_step,
+            'total_steps': self.total_steps,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+
+class GenerationCacheEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False, index=True)  # بصمة الإعدادات كاملة مع البذرة
+    variant_key = db.Column(db.String(64), nullable=False, index=True)  # بصمة الإعدادات بدون البذرة
+    model_name = db.Column(db.String(200), nullable=False)
+    seed = db.Column(db.BigInteger, nullable=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_size = db.Column(db.Integer, nullable=True)  # بالبايت
+    hit_count = db.Column(db.Integer, default=0)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'cache_key': self.cache_key,
+            'variant_key': self.variant_key,
+            'model_name': self.model_name,
+            'seed': self.seed,
+            'file_path': self.file_path,
+            'file_size': self.file_size,
+            'hit_count': self.hit_count,
+            'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
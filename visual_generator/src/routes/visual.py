@@ -1,12 +1,13 @@
 from flask import Blueprint, jsonify, request, send_file
 from flask_cors import cross_origin
 from src.models.visual_content import VisualContent, GenerationTask, db
-from src.services.image_generator import image_generator
+from src.services.image_generator import image_generator, SCHEDULERS
+from src.services.generation_scheduler import generation_scheduler
+from src.services.result_cache import result_cache
 import json
 import os
 import uuid
 from datetime import datetime
-import threading
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -67,32 +68,35 @@ def generate_image():
         prompt = data.get('prompt', '')
         movie_id = data.get('movie_id')
         scene_id = data.get('scene_id')
+        parameters = data.get('parameters', {})
         
         if not prompt:
             return jsonify({'success': False, 'error': 'Prompt is required'}), 400
         
+        if parameters.get('scheduler') and parameters['scheduler'] not in SCHEDULERS:
+            return jsonify({'success': False, 'error': f"Unknown scheduler: {parameters['scheduler']}"}), 400
+        
         # إنشاء مهمة توليد
         task = GenerationTask(
             task_type='image',
             movie_id=movie_id,
             scene_id=scene_id,
             prompt=prompt,
-            parameters=json.dumps(data.get('parameters', {})),
-            status='processing'
+            parameters=json.dumps(parameters),
+            status='queued'
         )
         db.session.add(task)
         db.session.commit()
         
-        # بدء توليد الصورة في خيط منفصل
-        thread = threading.Thread(
-            target=generate_image_async,
-            args=(task.id, prompt, data.get('parameters', {}))
+        # إضافة الطلب إلى طابور التوليد المجمع
+        queue_position = generation_scheduler.submit(
+            build_generation_request(task, prompt, parameters, 'image', 'Generated Image', 'image')
         )
-        thread.start()
         
         return jsonify({
             'success': True,
             'task_id': task.id,
+            'queue_position': queue_position,
             'message': 'Image generation started'
         })
         
@@ -100,82 +104,27 @@ def generate_image():
         logger.error(f"Error in generate_image: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def generate_image_async(task_id, prompt, parameters):
-    """توليد الصورة بشكل غير متزامن"""
-    try:
-        # الحصول على المهمة
-        task = GenerationTask.query.get(task_id)
-        if not task:
-            return
-        
-        # تحديث حالة المهمة
-        task.status = 'processing'
-        task.progress = 10
-        db.session.commit()
-        
-        # تحميل النموذج
-        if not image_generator.load_model():
-            task.status = 'failed'
-            task.error_message = 'Failed to load image generation model'
-            db.session.commit()
-            return
-        
-        task.progress = 30
-        db.session.commit()
-        
-        # توليد الصورة
-        image = image_generator.generate_image(
-            prompt=prompt,
-            width=parameters.get('width', 512),
-            height=parameters.get('height', 512),
-            num_inference_steps=parameters.get('steps', 20),
-            guidance_scale=parameters.get('guidance_scale', 7.5),
-            seed=parameters.get('seed')
-        )
-        
-        task.progress = 80
-        db.session.commit()
-        
-        # حفظ الصورة
-        filename = f"image_{task_id}_{uuid.uuid4().hex[:8]}.png"
-        file_path = os.path.join(GENERATED_FILES_DIR, filename)
-        
-        if image_generator.save_image(image, file_path):
-            # إنشاء سجل المحتوى البصري
-            visual_content = VisualContent(
-                movie_id=task.movie_id,
-                scene_id=task.scene_id,
-                content_type='image',
-                title=f"Generated Image - {task_id}",
-                prompt=prompt,
-                file_path=file_path,
-                width=image.width,
-                height=image.height,
-                model_used='stable-diffusion-v1-5',
-                generation_params=task.parameters,
-                status='completed'
-            )
-            db.session.add(visual_content)
-            
-            # تحديث المهمة
-            task.status = 'completed'
-            task.result_path = file_path
-            task.progress = 100
-            db.session.commit()
-            
-            logger.info(f"Image generation completed for task {task_id}")
-        else:
-            task.status = 'failed'
-            task.error_message = 'Failed to save generated image'
-            db.session.commit()
-            
-    except Exception as e:
-        logger.error(f"Error in generate_image_async: {str(e)}")
-        task = GenerationTask.query.get(task_id)
-        if task:
-            task.status = 'failed'
-            task.error_message = str(e)
-            db.session.commit()
+def build_generation_request(task, prompt, parameters, content_type, title, filename_prefix,
+                             description=None, original_prompt=None):
+    """بناء طلب التوليد المرسل إلى المجدول"""
+    return {
+        'task_id': task.id,
+        'prompt': prompt,
+        'original_prompt': original_prompt or prompt,
+        'negative_prompt': parameters.get('negative_prompt', ''),
+        'width': parameters.get('width', 512),
+        'height': parameters.get('height', 512),
+        'steps': parameters.get('steps', 20),
+        'guidance_scale': parameters.get('guidance_scale', 7.5),
+        'seed': parameters.get('seed'),
+        'scheduler': parameters.get('scheduler'),
+        'preview_every': parameters.get('preview_every'),
+        'any_variant': bool(parameters.get('any_variant', False)),
+        'content_type': content_type,
+        'title': title,
+        'description': description,
+        'filename_prefix': filename_prefix
+    }
 
 @visual_bp.route('/generate-character-image', methods=['POST'])
 @cross_origin()
@@ -196,21 +145,27 @@ def generate_character_image():
             movie_id=movie_id,
             prompt=character_description,
             parameters=json.dumps({'style': style}),
-            status='processing'
+            status='queued'
         )
         db.session.add(task)
         db.session.commit()
         
-        # بدء توليد الصورة في خيط منفصل
-        thread = threading.Thread(
-            target=generate_character_image_async,
-            args=(task.id, character_description, style)
-        )
-        thread.start()
+        # إضافة الطلب إلى طابور التوليد المجمع
+        queue_position = generation_scheduler.submit(build_generation_request(
+            task,
+            image_generator.build_character_prompt(character_description, style),
+            data.get('parameters', {}),
+            'character_image',
+            'Character Image',
+            'character',
+            description=character_description,
+            original_prompt=character_description
+        ))
         
         return jsonify({
             'success': True,
             'task_id': task.id,
+            'queue_position': queue_position,
             'message': 'Character image generation started'
         })
         
@@ -218,71 +173,6 @@ def generate_character_image():
         logger.error(f"Error in generate_character_image: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def generate_character_image_async(task_id, character_description, style):
-    """توليد صورة الشخصية بشكل غير متزامن"""
-    try:
-        task = GenerationTask.query.get(task_id)
-        if not task:
-            return
-        
-        task.progress = 20
-        db.session.commit()
-        
-        # تحميل النموذج
-        if not image_generator.load_model():
-            task.status = 'failed'
-            task.error_message = 'Failed to load image generation model'
-            db.session.commit()
-            return
-        
-        task.progress = 50
-        db.session.commit()
-        
-        # توليد صورة الشخصية
-        image = image_generator.generate_character_image(character_description, style)
-        
-        task.progress = 90
-        db.session.commit()
-        
-        # حفظ الصورة
-        filename = f"character_{task_id}_{uuid.uuid4().hex[:8]}.png"
-        file_path = os.path.join(GENERATED_FILES_DIR, filename)
-        
-        if image_generator.save_image(image, file_path):
-            # إنشاء سجل المحتوى البصري
-            visual_content = VisualContent(
-                movie_id=task.movie_id,
-                content_type='character_image',
-                title=f"Character Image - {task_id}",
-                description=character_description,
-                prompt=character_description,
-                file_path=file_path,
-                width=image.width,
-                height=image.height,
-                model_used='stable-diffusion-v1-5',
-                generation_params=task.parameters,
-                status='completed'
-            )
-            db.session.add(visual_content)
-            
-            task.status = 'completed'
-            task.result_path = file_path
-            task.progress = 100
-            db.session.commit()
-            
-        else:
-            task.status = 'failed'
-            task.error_message = 'Failed to save generated character image'
-            db.session.commit()
-            
-    except Exception as e:
-        logger.error(f"Error in generate_character_image_async: {str(e)}")
-        task = GenerationTask.query.get(task_id)
-        if task:
-            task.status = 'failed'
-            task.error_message = str(e)
-            db.session.commit()
-
 @visual_bp.route('/generate-scene-image', methods=['POST'])
 @cross_origin()
 def generate_scene_image():
@@ -304,21 +194,27 @@ def generate_scene_image():
             scene_id=scene_id,
             prompt=scene_description,
             parameters=json.dumps({'mood': mood}),
-            status='processing'
+            status='queued'
         )
         db.session.add(task)
         db.session.commit()
         
-        # بدء توليد الصورة في خيط منفصل
-        thread = threading.Thread(
-            target=generate_scene_image_async,
-            args=(task.id, scene_description, mood)
-        )
-        thread.start()
+        # إضافة الطلب إلى طابور التوليد المجمع
+        queue_position = generation_scheduler.submit(build_generation_request(
+            task,
+            image_generator.build_scene_prompt(scene_description, mood),
+            data.get('parameters', {}),
+            'scene_image',
+            'Scene Image',
+            'scene',
+            description=scene_description,
+            original_prompt=scene_description
+        ))
         
         return jsonify({
             'success': True,
             'task_id': task.id,
+            'queue_position': queue_position,
             'message': 'Scene image generation started'
         })
         
@@ -326,71 +222,23 @@ def generate_scene_image():
         logger.error(f"Error in generate_scene_image: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def generate_scene_image_async(task_id, scene_description, mood):
-    """توليد صورة المشهد بشكل غير متزامن"""
-    try:
-        task = GenerationTask.query.get(task_id)
-        if not task:
-            return
-        
-        task.progress = 20
-        db.session.commit()
-        
-        # تحميل النموذج
-        if not image_generator.load_model():
-            task.status = 'failed'
-            task.error_message = 'Failed to load image generation model'
-            db.session.commit()
-            return
-        
-        task.progress = 50
-        db.session.commit()
-        
-        # توليد صورة المشهد
-        image = image_generator.generate_scene_image(scene_description, mood)
-        
-        task.progress = 90
-        db.session.commit()
-        
-        # حفظ الصورة
-        filename = f"scene_{task_id}_{uuid.uuid4().hex[:8]}.png"
-        file_path = os.path.join(GENERATED_FILES_DIR, filename)
-        
-        if image_generator.save_image(image, file_path):
-            # إنشاء سجل المحتوى البصري
-            visual_content = VisualContent(
-                movie_id=task.movie_id,
-                scene_id=task.scene_id,
-                content_type='scene_image',
-                title=f"Scene Image - {task_id}",
-                description=scene_description,
-                prompt=scene_description,
-                file_path=file_path,
-                width=image.width,
-                height=image.height,
-                model_used='stable-diffusion-v1-5',
-                generation_params=task.parameters,
-                status='completed'
-            )
-            db.session.add(visual_content)
-            
-            task.status = 'completed'
-            task.result_path = file_path
-            task.progress = 100
-            db.session.commit()
-            
-        else:
-            task.status = 'failed'
-            task.error_message = 'Failed to save generated scene image'
-            db.session.commit()
-            
-    except Exception as e:
-        logger.error(f"Error in generate_scene_image_async: {str(e)}")
-        task = GenerationTask.query.get(task_id)
-        if task:
-            task.status = 'failed'
-            task.error_message = str(e)
-            db.session.commit()
+@visual_bp.route('/generation-queue', methods=['GET'])
+@cross_origin()
+def get_generation_queue_status():
+    """الحصول على حالة طابور التوليد"""
+    return jsonify(generation_scheduler.get_stats())
+
+@visual_bp.route('/models/status', methods=['GET'])
+@cross_origin()
+def get_models_status():
+    """الحصول على حالة النماذج المحملة وأزمنة تحميلها"""
+    return jsonify(image_generator.registry.get_stats())
+
+@visual_bp.route('/image-cache', methods=['GET'])
+@cross_origin()
+def get_image_cache_status():
+    """الحصول على إحصائيات مخزن الصور المولدة"""
+    return jsonify(result_cache.get_stats())
 
 @visual_bp.route('/tasks/<int:task_id>', methods=['GET'])
 @cross_origin()
@@ -399,6 +247,29 @@ def get_task_status(task_id):
     task = GenerationTask.query.get_or_404(task_id)
     return jsonify(task.to_dict())
 
+@visual_bp.route('/tasks/<int:task_id>/cancel', methods=['POST'])
+@cross_origin()
+def cancel_task(task_id):
+    """إلغاء مهمة توليد في الطابور أو أثناء التنفيذ"""
+    task = GenerationTask.query.get_or_404(task_id)
+    
+    try:
+        if task.status not in ('queued', 'processing'):
+            return jsonify({'success': False, 'error': f'Task is already {task.status}'}), 409
+        
+        result = generation_scheduler.cancel(task_id)
+        # المهام التي لم تعد في المجدول لا يوجد ما يوقفها
+        if result in ('dequeued', 'not_running'):
+            task.status = 'cancelled'
+            db.session.commit()
+        
+        # المهام الجارية تتوقف عند نهاية خطوة الانتشار الحالية
+        return jsonify({'success': True, 'task_id': task_id, 'result': result})
+        
+    except Exception as e:
+        logger.error(f"Error cancelling task: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @visual_bp.route('/tasks', methods=['GET'])
 @cross_origin()
 def get_tasks():
@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from src.models.visual_content import VisualContent, GenerationTask, db
+from src.services.image_generator import image_generator, GenerationCancelled
+from src.services.result_cache import result_cache, copy_file
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class GenerationScheduler:
+    def __init__(self, max_batch_size=None, batch_window=None):
+        self.max_batch_size = max_batch_size or int(os.environ.get('IMAGE_BATCH_SIZE', 4))
+        self.batch_window = batch_window or float(os.environ.get('IMAGE_BATCH_WINDOW', 0.25))
+        self.pending = []
+        # مهام الدفعة الجارية، والإلغاء لا يُسجل إلا لها
+        self.running = set()
+        self.cancelled = set()
+        # كتابة معاينة كل N خطوات (0 لتعطيلها ما لم يطلبها الطلب)
+        self.preview_every = int(os.environ.get('IMAGE_PREVIEW_EVERY', 0))
+        self.condition = threading.Condition()
+        self.app = None
+        self.output_dir = None
+        self.worker = None
+
+    def start(self, app, output_dir):
+        """تشغيل العامل الوحيد المالك للنموذج"""
+        if self.worker is not None:
+            return
+
+        self.app = app
+        self.output_dir = output_dir
+
+        with app.app_context():
+            self.recover_pending_tasks()
+
+        self.worker = threading.Thread(target=self._worker_loop, name='image-generation-worker', daemon=True)
+        self.worker.start()
+        logger.info(f"Generation scheduler started (batch size {self.max_batch_size})")
+
+    def recover_pending_tasks(self):
+        """إعادة المهام المنتظرة والمقطوعة إلى الطابور بعد إعادة التشغيل"""
+        tasks = GenerationTask.query.filter(
+            GenerationTask.status.in_(('queued', 'processing'))
+        ).order_by(GenerationTask.id).all()
+
+        recovered = []
+        for task in tasks:
+            if task.request_data:
+                task.status = 'queued'
+                task.progress = 0
+                task.current_step = 0
+                recovered.append(json.loads(task.request_data))
+            else:
+                # مهام أقدم من حفظ الطلبات لا يمكن إعادة بنائها
+                task.status = 'failed'
+                task.error_message = 'Interrupted by service restart'
+        if tasks:
+            db.session.commit()
+
+        with self.condition:
+            self.pending.extend(recovered)
+            self.condition.notify()
+        if recovered:
+            logger.info(f"Re-queued {len(recovered)} interrupted generation tasks")
+
+    def submit(self, request):
+        """إضافة طلب توليد إلى الطابور، ويعيد موقعه (0 إذا خُدم فوراً من المخزن)"""
+        task = GenerationTask.query.get(request['task_id'])
+
+        # الطلبات المكررة تُخدم مباشرة دون المرور بالنموذج
+        entry = result_cache.lookup(request)
+        if entry and task:
+            self._save_file(task, request, entry.file_path, request['width'], request['height'])
+            db.session.commit()
+            return 0
+
+        # الطلب يُحفظ مع المهمة حتى لا يضيع إذا توقفت الخدمة قبل تنفيذه
+        if task:
+            task.request_data = json.dumps(request)
+            db.session.commit()
+
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify()
+            return len(self.pending)
+
+    def batch_key(self, request):
+        """الطلبات المتوافقة يمكن توليدها في استدعاء واحد للنموذج"""
+        return (
+            request['width'],
+            request['height'],
+            request['steps'],
+            request['guidance_scale'],
+            request.get('scheduler') or 'default'
+        )
+
+    def _next_batch(self):
+        """انتظار أول طلب ثم تجميع الطلبات المتوافقة خلال نافذة قصيرة"""
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+
+            batch = [self.pending.pop(0)]
+            # الطلب يصبح جارياً لحظة خروجه من الطابور حتى لا يضيع إلغاء يصل أثناء النافذة
+            self.running.add(batch[0]['task_id'])
+            key = self.batch_key(batch[0])
+            deadline = time.time() + self.batch_window
+
+            while len(batch) < self.max_batch_size:
+                for request in list(self.pending):
+                    if len(batch) >= self.max_batch_size:
+                        break
+                    if self.batch_key(request) == key:
+                        self.pending.remove(request)
+                        self.running.add(request['task_id'])
+                        batch.append(request)
+
+                remaining = deadline - time.time()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            return batch
+
+    def _worker_loop(self):
+        """حلقة العامل: دفعة واحدة في كل مرة"""
+        while True:
+            batch = self._next_batch()
+            try:
+                with self.app.app_context():
+                    self._run_batch(batch)
+            except Exception as e:
+                logger.error(f"Error in generation worker: {str(e)}")
+            finally:
+                # لا يبقى في قائمة الإلغاء إلا ما يخص دفعة جارية
+                with self.condition:
+                    self.cancelled -= self.running
+                    self.running = set()
+
+    def _run_batch(self, batch):
+        """توليد دفعة وحفظ نتائجها في قاعدة البيانات"""
+        # الطلبات الملغاة قبل بدء الدفعة لا تدخل النموذج
+        with self.condition:
+            dropped = [request['task_id'] for request in batch if request['task_id'] in self.cancelled]
+            batch = [request for request in batch if request['task_id'] not in self.cancelled]
+        if dropped:
+            self._finish_cancelled({task_id: GenerationTask.query.get(task_id) for task_id in dropped})
+        if not batch:
+            return
+
+        tasks = {request['task_id']: GenerationTask.query.get(request['task_id']) for request in batch}
+
+        for task in tasks.values():
+            if task:
+                task.status = 'processing'
+                task.progress = 5
+                task.current_step = 0
+                task.total_steps = batch[0]['steps']
+        db.session.commit()
+
+        # البذرة تُحدد مسبقاً حتى تُخزن كل نتيجة بمفتاح قابل للتكرار
+        seeds = [
+            request['seed'] if request.get('seed') is not None else random.randrange(2 ** 31)
+            for request in batch
+        ]
+
+        # الطلبات المتطابقة داخل نفس الدفعة تُولد مرة واحدة
+        unique = {}
+        for index, request in enumerate(batch):
+            if request.get('seed') is not None:
+                unique.setdefault(result_cache.make_keys(request)[0], index)
+            else:
+                unique[('unseeded', index)] = index
+        indices = sorted(unique.values())
+
+        # موقع صورة كل طلب داخل مخرجات النموذج
+        positions = []
+        for index, request in enumerate(batch):
+            source = unique[result_cache.make_keys(request)[0]] if request.get('seed') is not None else index
+            positions.append(indices.index(source))
+
+        try:
+            if not image_generator.load_model():
+                raise Exception('Failed to load image generation model')
+
+            first = batch[0]
+            generated = image_generator.generate_images(
+                [batch[i]['prompt'] for i in indices],
+                [batch[i].get('negative_prompt', '') for i in indices],
+                width=first['width'],
+                height=first['height'],
+                num_inference_steps=first['steps'],
+                guidance_scale=first['guidance_scale'],
+                seeds=[seeds[i] for i in indices],
+                scheduler=first.get('scheduler'),
+                step_callback=lambda step, total, latents, rows: self._on_step(
+                    batch, tasks, positions, step, total, latents, rows
+                )
+            )
+        except GenerationCancelled:
+            # أُلغيت كل مهام الدفعة
+            self._finish_cancelled(tasks)
+            return
+        except Exception as e:
+            logger.error(f"Batch generation failed: {str(e)}")
+            for task in tasks.values():
+                if task:
+                    task.status = 'failed'
+                    task.error_message = str(e)
+            db.session.commit()
+            return
+
+        for index, request in enumerate(batch):
+            task = tasks.get(request['task_id'])
+            if not task or generated[positions[index]] is None or self._is_cancelled(task):
+                continue
+            file_path = self._save_result(task, request, generated[positions[index]])
+            if file_path and index in indices:
+                result_cache.store(request, seeds[index], file_path)
+
+        self._finish_cancelled(tasks)
+        logger.info(f"Generated batch of {len(indices)} images for {len(batch)} requests")
+
+    def _on_step(self, batch, tasks, positions, step, total, latents, rows):
+        """تحديث التقدم بعد كل خطوة انتشار، ويعيد صفوف المهام الملغاة لإسقاطها من الدفعة
+
+        rows هي صفوف الدفعة الأصلية الباقية في latents، وبقية المهام تكمل خطواتها.
+        """
+        active = {}
+        for index, request in enumerate(batch):
+            task = tasks.get(request['task_id'])
+            if task and not self._is_cancelled(task):
+                active[index] = task
+
+        # الصف المشترك بين طلبات متطابقة يبقى ما دام أحدها غير ملغى
+        live_rows = {positions[index] for index in active}
+        dropped = [row for row in rows if row not in live_rows]
+
+        previews = None
+        for index, task in active.items():
+            task.current_step = step
+            task.progress = 5 + int(85 * step / total)
+
+            preview_every = batch[index].get('preview_every') or self.preview_every
+            if preview_every and step % preview_every == 0 and step < total:
+                if previews is None:
+                    previews = image_generator.latents_to_images(latents)
+                task.preview_path = self._save_preview(task, previews[rows.index(positions[index])])
+
+        # المهام الملغاة تُثبت فوراً بدل انتظار نهاية الدفعة
+        self._finish_cancelled(tasks)
+        return dropped
+
+    def _save_preview(self, task, image):
+        """حفظ معاينة مرحلية فوق السابقة بشكل ذري"""
+        preview_dir = os.path.join(self.output_dir, 'previews')
+        os.makedirs(preview_dir, exist_ok=True)
+        preview_path = os.path.join(preview_dir, f"preview_{task.id}.png")
+        partial_path = preview_path + '.partial.png'
+        image.save(partial_path)
+        os.replace(partial_path, preview_path)
+        return preview_path
+
+    def cancel(self, task_id):
+        """إلغاء مهمة: تُزال من الطابور، أو تُسقط من دفعتها الجارية عند نهاية الخطوة الحالية
+
+        يعيد 'dequeued' أو 'interrupting'، أو 'not_running' إذا لم يعد المجدول يعرف المهمة.
+        """
+        with self.condition:
+            for request in list(self.pending):
+                if request['task_id'] == task_id:
+                    self.pending.remove(request)
+                    return 'dequeued'
+            if task_id in self.running:
+                self.cancelled.add(task_id)
+                return 'interrupting'
+            return 'not_running'
+
+    def _is_cancelled(self, task):
+        """هل طُلب إلغاء المهمة أو ثُبت"""
+        if task.status == 'cancelled':
+            return True
+        with self.condition:
+            return task.id in self.cancelled
+
+    def _finish_cancelled(self, tasks):
+        """تثبيت حالة المهام الملغاة وتنظيف قائمة الإلغاء"""
+        with self.condition:
+            for task_id, task in tasks.items():
+                if task_id in self.cancelled:
+                    self.cancelled.discard(task_id)
+                    if task and task.status != 'completed':
+                        task.status = 'cancelled'
+        db.session.commit()
+
+    def _save_result(self, task, request, image):
+        """حفظ صورة واحدة وإنشاء سجل المحتوى البصري، ويعيد مسار الملف"""
+        filename = f"{request['filename_prefix']}_{task.id}_{uuid.uuid4().hex[:8]}.png"
+        file_path = os.path.join(self.output_dir, filename)
+
+        if not image_generator.save_image(image, file_path):
+            task.status = 'failed'
+            task.error_message = 'Failed to save generated image'
+            return None
+
+        self._record_result(task, request, file_path, image.width, image.height)
+        return file_path
+
+    def _save_file(self, task, request, source_path, width, height):
+        """نسخ نتيجة مخزنة كمخرج للمهمة"""
+        filename = f"{request['filename_prefix']}_{task.id}_{uuid.uuid4().hex[:8]}.png"
+        file_path = os.path.join(self.output_dir, filename)
+        copy_file(source_path, file_path)
+
+        self._record_result(task, request, file_path, width, height)
+        logger.info(f"Served task {task.id} from image cache")
+
+    def _record_result(self, task, request, file_path, width, height):
+        """إنشاء سجل المحتوى البصري وإكمال المهمة"""
+        visual_content = VisualContent(
+            movie_id=task.movie_id,
+            scene_id=task.scene_id,
+            content_type=request['content_type'],
+            title=f"{request['title']} - {task.id}",
+            description=request.get('description'),
+            prompt=request.get('original_prompt', request['prompt']),
+            file_path=file_path,
+            width=width,
+            height=height,
+            model_used=image_generator.current_model,
+            generation_params=task.parameters,
+            status='completed'
+        )
+        db.session.add(visual_content)
+
+        task.status = 'completed'
+        task.result_path = file_path
+        task.progress = 100
+
+    def get_stats(self):
+        """حالة الطابور"""
+        with self.condition:
+            return {
+                'pending': len(self.pending),
+                'running': len(self.running),
+                'cancelling': len(self.cancelled),
+                'max_batch_size': self.max_batch_size,
+                'batch_window': self.batch_window
+            }
+
+# إنشاء مثيل عام للاستخدام
+generation_scheduler = GenerationScheduler()
@@ -1,92 +1,279 @@
 import os
 import torch
+import diffusers
 from diffusers import StableDiffusionPipeline, DiffusionPipeline
 from PIL import Image
 import requests
 from io import BytesIO
 import json
 import logging
+from src.services.model_registry import ModelRegistry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# إضافة ثابتة لكل negative prompt
+NEGATIVE_PROMPT_SUFFIX = ", nsfw, inappropriate, explicit"
+
+DEFAULT_MODEL = "runwayml/stable-diffusion-v1-5"
+
+# المُجدولات المتاحة لكل طلب (الأسرع تعطي نتائج جيدة بخطوات أقل)
+SCHEDULERS = {
+    'default': None,
+    'dpm': 'DPMSolverMultistepScheduler',
+    'euler': 'EulerDiscreteScheduler',
+    'euler_a': 'EulerAncestralDiscreteScheduler',
+    'ddim': 'DDIMScheduler',
+    'lcm': 'LCMScheduler'
+}
+
+# إسقاط خطي تقريبي لقنوات latent الأربع إلى RGB (معاينة رخيصة بدون VAE)
+LATENT_RGB_FACTORS = [
+    [0.298, 0.207, 0.208],
+    [0.187, 0.286, 0.173],
+    [-0.158, 0.189, 0.264],
+    [-0.184, -0.271, -0.473]
+]
+
+class GenerationCancelled(Exception):
+    """يُرفع من داخل حلقة الانتشار لإيقاف التوليد"""
+    pass
+
 class ImageGenerator:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.models = {}
+    def __init__(self, cpu_threads=None, use_bf16=None, attention_slicing=None,
+                 channels_last=None, default_model=None, device=None):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.registry = ModelRegistry(self._load_pipeline)
+        self.models = self.registry.models
         self.current_model = None
         
-    def load_model(self, model_name="runwayml/stable-diffusion-v1-5"):
+        # إعدادات وضع المعالج (تُستخدم فقط عند غياب GPU)
+        self.cpu_threads = cpu_threads if cpu_threads is not None else int(os.environ.get('IMAGE_CPU_THREADS', 0))
+        self.use_bf16 = use_bf16 if use_bf16 is not None else os.environ.get('IMAGE_CPU_BF16', '0') == '1'
+        self.attention_slicing = attention_slicing if attention_slicing is not None else \
+            os.environ.get('IMAGE_CPU_ATTENTION_SLICING', '1') == '1'
+        self.channels_last = channels_last if channels_last is not None else \
+            os.environ.get('IMAGE_CPU_CHANNELS_LAST', '1') == '1'
+        
+        # نموذج أصغر أو مقطر لعقد المعالج
+        self.default_model = default_model or (
+            os.environ.get('IMAGE_CPU_MODEL') if self.device == "cpu" else None
+        ) or DEFAULT_MODEL
+        
+        if self.device == "cpu":
+            if self.cpu_threads > 0:
+                torch.set_num_threads(self.cpu_threads)
+            if self.use_bf16 and not self.bf16_supported():
+                logger.warning("bfloat16 is not supported on this CPU, using float32")
+                self.use_bf16 = False
+        
+    def bf16_supported(self):
+        """هل يدعم المعالج الحساب بدقة bfloat16"""
+        try:
+            return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+        except Exception:
+            return False
+    
+    def _load_pipeline(self, model_name):
+        """تحميل أنبوب Stable Diffusion من اسمه"""
+        # تحميل النموذج مع تحسينات الذاكرة
+        pipe = StableDiffusionPipeline.from_pretrained(
+            model_name,
+            torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+            safety_checker=None,
+            requires_safety_checker=False
+        )
+        
+        pipe = pipe.to(self.device)
+        
+        # تحسينات الذاكرة
+        if self.device == "cuda":
+            pipe.enable_memory_efficient_attention()
+            pipe.enable_xformers_memory_efficient_attention()
+        else:
+            self._optimize_for_cpu(pipe)
+        
+        return pipe
+    
+    def _optimize_for_cpu(self, pipe):
+        """تحسينات الاستدلال على المعالج"""
+        if self.attention_slicing:
+            pipe.enable_attention_slicing()
+        
+        # تخطيط channels-last أسرع لطبقات الالتفاف على المعالج
+        if self.channels_last:
+            pipe.unet.to(memory_format=torch.channels_last)
+            pipe.vae.to(memory_format=torch.channels_last)
+    
+    def autocast(self):
+        """سياق الدقة المختلطة المناسب للجهاز"""
+        if self.device == "cuda":
+            return torch.autocast("cuda")
+        return torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.use_bf16)
+    
+    def with_scheduler(self, pipe, scheduler):
+        """أنبوب يشارك نفس الأوزان مع مُجدول مختلف"""
+        scheduler_class = SCHEDULERS.get(scheduler or 'default')
+        if scheduler_class is None:
+            return pipe
+        
+        components = dict(pipe.components)
+        components['scheduler'] = getattr(diffusers, scheduler_class).from_config(pipe.scheduler.config)
+        return type(pipe)(**components, requires_safety_checker=False)
+    
+    def load_model(self, model_name=None):
         """تحميل نموذج توليد الصور"""
+        model_name = model_name or self.default_model
         try:
-            if model_name not in self.models:
-                logger.info(f"Loading model: {model_name}")
-                
-                # تحميل النموذج مع تحسينات الذاكرة
-                pipe = StableDiffusionPipeline.from_pretrained(
-                    model_name,
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                    safety_checker=None,
-                    requires_safety_checker=False
-                )
-                
-                pipe = pipe.to(self.device)
-                
-                # تحسينات الذاكرة
-                if self.device == "cuda":
-                    pipe.enable_memory_efficient_attention()
-                    pipe.enable_xformers_memory_efficient_attention()
-                
-                self.models[model_name] = pipe
-                self.current_model = model_name
-                logger.info(f"Model {model_name} loaded successfully")
-                
+            self.registry.get(model_name)
+            self.current_model = model_name
             return True
         except Exception as e:
             logger.error(f"Error loading model {model_name}: {str(e)}")
             return False
     
     def generate_image(self, prompt, negative_prompt="", width=512, height=512, 
-                      num_inference_steps=20, guidance_scale=7.5, seed=None):
+                      num_inference_steps=20, guidance_scale=7.5, seed=None, scheduler=None):
         """توليد صورة من النص"""
+        return self.generate_images(
+            [prompt],
+            [negative_prompt],
+            width=width,
+            height=height,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            seeds=[seed],
+            scheduler=scheduler
+        )[0]
+    
+    def generate_images(self, prompts, negative_prompts=None, width=512, height=512,
+                        num_inference_steps=20, guidance_scale=7.5, seeds=None, scheduler=None,
+                        step_callback=None):
+        """توليد دفعة صور بنفس الإعدادات في استدعاء واحد للنموذج
+
+        step_callback(step, total_steps, latents, rows) يُستدعى بعد كل خطوة، وrows صفوف الدفعة الأصلية
+        الباقية في latents، ويعيد الصفوف المطلوب إسقاطها. الصور المسقطة تعود None، وإسقاط الكل يلغي التوليد.
+        """
         try:
-            if not self.current_model or self.current_model not in self.models:
-                # تحميل النموذج الافتراضي
-                if not self.load_model():
-                    raise Exception("Failed to load default model")
+            if scheduler and scheduler not in SCHEDULERS:
+                raise ValueError(f"Unknown scheduler: {scheduler}")
+            
+            model_name = self.current_model or self.default_model
             
-            pipe = self.models[self.current_model]
+            negative_prompts = negative_prompts or [""] * len(prompts)
+            seeds = seeds or [None] * len(prompts)
             
-            # تعيين البذرة للحصول على نتائج قابلة للتكرار
-            if seed is not None:
-                generator = torch.Generator(device=self.device).manual_seed(seed)
-            else:
-                generator = None
+            # مولد مستقل لكل صورة: البذرة المحددة تعطي نتائج قابلة للتكرار
+            generators = []
+            for seed in seeds:
+                generator = torch.Generator(device=self.device)
+                if seed is not None:
+                    generator.manual_seed(seed)
+                else:
+                    generator.seed()
+                generators.append(generator)
             
             # تحسين الـ prompt للثقافة العربية
-            enhanced_prompt = self.enhance_prompt_for_arabic_culture(prompt)
+            enhanced_prompts = [self.enhance_prompt_for_arabic_culture(prompt) for prompt in prompts]
+            negatives = [self.resolve_negative_prompt(negative) for negative in negative_prompts]
             
-            # توليد الصورة
-            logger.info(f"Generating image with prompt: {enhanced_prompt}")
+            # توليد الصور
+            logger.info(f"Generating batch of {len(prompts)} images")
             
-            with torch.autocast(self.device):
+            # صفوف الدفعة الأصلية الباقية في latents بعد إسقاط الملغى منها
+            rows = list(range(len(prompts)))
+            
+            # السجل يحمل النموذج عند الحاجة ويمنع تفريغه أثناء التوليد
+            with self.registry.use(model_name) as pipe, self.autocast():
+                pipe = self.with_scheduler(pipe, scheduler)
                 result = pipe(
-                    prompt=enhanced_prompt,
-                    negative_prompt=negative_prompt + ", nsfw, inappropriate, explicit",
+                    prompt=enhanced_prompts,
+                    negative_prompt=negatives,
                     width=width,
                     height=height,
                     num_inference_steps=num_inference_steps,
                     guidance_scale=guidance_scale,
-                    generator=generator
+                    generator=generators,
+                    callback_on_step_end=self._step_end_callback(step_callback, num_inference_steps, rows, generators),
+                    callback_on_step_end_tensor_inputs=self._step_tensor_inputs(pipe, step_callback)
                 )
             
-            image = result.images[0]
-            return image
+            images = [None] * len(prompts)
+            for row, image in zip(rows, result.images):
+                images[row] = image
+            return images
             
+        except GenerationCancelled:
+            logger.info("Image generation cancelled")
+            raise
         except Exception as e:
-            logger.error(f"Error generating image: {str(e)}")
+            logger.error(f"Error generating images: {str(e)}")
             raise e
     
+    def _step_end_callback(self, step_callback, num_inference_steps, rows, generators):
+        """تحويل دالة التقدم إلى صيغة callback_on_step_end في diffusers"""
+        if step_callback is None:
+            return None
+        
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            dropped = set(step_callback(step + 1, num_inference_steps, callback_kwargs['latents'], list(rows)) or ())
+            keep = [position for position, row in enumerate(rows) if row not in dropped]
+            if not keep:
+                raise GenerationCancelled()
+            if len(keep) < len(rows):
+                self._drop_rows(pipe, callback_kwargs, keep, rows, generators)
+            return callback_kwargs
+        
+        return on_step_end
+    
+    def _step_tensor_inputs(self, pipe, step_callback):
+        """المصفوفات التي يمررها الأنبوب إلى دالة الخطوة: latents والتضمينات المرتبطة بصفوف الدفعة"""
+        if step_callback is None:
+            return ['latents']
+        allowed = getattr(pipe, '_callback_tensor_inputs', ['latents'])
+        return [name for name in ('latents', 'prompt_embeds', 'add_text_embeds', 'add_time_ids') if name in allowed]
+    
+    def _drop_rows(self, pipe, callback_kwargs, keep, rows, generators):
+        """إسقاط صفوف من الدفعة بين خطوتين دون إيقاف بقية الصفوف"""
+        batch = len(rows)
+        
+        # مع guidance تكون التضمينات نصفين [negative, positive] لكل الدفعة
+        for name, value in callback_kwargs.items():
+            if torch.is_tensor(value) and value.shape[0] % batch == 0:
+                halves = value.shape[0] // batch
+                index = [half * batch + position for half in range(halves) for position in keep]
+                callback_kwargs[name] = value[torch.tensor(index, device=value.device)]
+        
+        # المُجدولات متعددة الخطوات (مثل DPM) تحفظ مخرجات الخطوات السابقة لكل صف
+        scheduler = pipe.scheduler
+        for name, value in list(vars(scheduler).items()):
+            if self._is_batch_tensor(value, batch):
+                setattr(scheduler, name, value[torch.tensor(keep, device=value.device)])
+            elif isinstance(value, list) and any(self._is_batch_tensor(item, batch) for item in value):
+                setattr(scheduler, name, [
+                    item[torch.tensor(keep, device=item.device)] if self._is_batch_tensor(item, batch) else item
+                    for item in value
+                ])
+        
+        # المولدات تُستخدم بالموضع في المُجدولات العشوائية، فتُسقط معها
+        rows[:] = [rows[position] for position in keep]
+        generators[:] = [generators[position] for position in keep]
+    
+    def _is_batch_tensor(self, value, batch):
+        """مصفوفة بشكل latents لصفوف الدفعة"""
+        return torch.is_tensor(value) and value.dim() == 4 and value.shape[0] == batch
+    
+    def latents_to_images(self, latents):
+        """معاينات منخفضة الدقة (1/8 من الأبعاد) مباشرة من latents"""
+        factors = torch.tensor(LATENT_RGB_FACTORS, dtype=torch.float32, device=latents.device)
+        rgb = torch.einsum('bchw,cr->bhwr', latents.float(), factors)
+        rgb = ((rgb + 1.0) * 127.5).clamp(0, 255).to(torch.uint8).cpu().numpy()
+        return [Image.fromarray(frame) for frame in rgb]
+    
+    def resolve_negative_prompt(self, negative_prompt):
+        """الـ negative prompt النهائي المرسل للنموذج"""
+        return (negative_prompt or "") + NEGATIVE_PROMPT_SUFFIX
+    
     def enhance_prompt_for_arabic_culture(self, prompt):
         """تحسين الـ prompt ليناسب الثقافة العربية"""
         # إضافة كلمات مفتاحية للثقافة العربية والإسلامية
@@ -117,6 +304,10 @@ class ImageGenerator:
     
     def generate_character_image(self, character_description, style="realistic"):
         """توليد صورة شخصية بناءً على الوصف"""
+        return self.generate_image(self.build_character_prompt(character_description, style))
+    
+    def build_character_prompt(self, character_description, style="realistic"):
+        """بناء الـ prompt الكامل لصورة شخصية"""
         style_prompts = {
             "realistic": "photorealistic, high quality, detailed",
             "cartoon": "cartoon style, animated, colorful",
@@ -125,12 +316,14 @@ class ImageGenerator:
         }
         
         style_prompt = style_prompts.get(style, style_prompts["realistic"])
-        full_prompt = f"{character_description}, {style_prompt}"
-        
-        return self.generate_image(full_prompt)
+        return f"{character_description}, {style_prompt}"
     
     def generate_scene_image(self, scene_description, mood="neutral"):
         """توليد صورة مشهد بناءً على الوصف"""
+        return self.generate_image(self.build_scene_prompt(scene_description, mood))
+    
+    def build_scene_prompt(self, scene_description, mood="neutral"):
+        """بناء الـ prompt الكامل لصورة مشهد"""
         mood_prompts = {
             "happy": "bright, cheerful, positive atmosphere",
             "sad": "melancholic, somber, emotional",
@@ -141,19 +334,11 @@ class ImageGenerator:
         }
         
         mood_prompt = mood_prompts.get(mood, mood_prompts["neutral"])
-        full_prompt = f"{scene_description}, {mood_prompt}, cinematic quality"
-        
-        return self.generate_image(full_prompt)
+        return f"{scene_description}, {mood_prompt}, cinematic quality"
     
     def cleanup_models(self):
         """تنظيف الذاكرة من النماذج"""
-        for model_name in list(self.models.keys()):
-            del self.models[model_name]
-        
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-        
-        self.models = {}
+        self.registry.unload_all()
         self.current_model = None
         logger.info("Models cleaned up from memory")
 
@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import torch
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    def __init__(self, loader, max_resident=None, idle_timeout=None):
+        # دالة تحميل النموذج من اسمه (يوفرها مولد الصور)
+        self.loader = loader
+        self.max_resident = max_resident or int(os.environ.get('IMAGE_MAX_RESIDENT_MODELS', 1))
+        # 0 يعني عدم تفريغ النماذج الخاملة
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(
+            os.environ.get('IMAGE_MODEL_IDLE_TIMEOUT', 900)
+        )
+        self.models = OrderedDict()  # الأحدث استخداماً في النهاية
+        self.info = {}
+        self.in_use = {}
+        self.load_locks = {}
+        self.lock = threading.RLock()
+        self.reaper = None
+
+    def start(self, warmup_models=None):
+        """تشغيل مراقب الخمول وتسخين النماذج المطلوبة في الخلفية"""
+        if self.idle_timeout > 0 and self.reaper is None:
+            self.reaper = threading.Thread(target=self._reaper_loop, name='model-idle-reaper', daemon=True)
+            self.reaper.start()
+
+        if warmup_models:
+            threading.Thread(
+                target=self.warm_up, args=(warmup_models,), name='model-warmup', daemon=True
+            ).start()
+
+    def warm_up(self, model_names):
+        """تحميل النماذج مسبقاً حتى لا يدفع أول طلب تكلفة التحميل"""
+        for model_name in model_names:
+            try:
+                self.get(model_name)
+                logger.info(f"Model {model_name} warmed up")
+            except Exception as e:
+                logger.error(f"Error warming up model {model_name}: {str(e)}")
+
+    def _load_lock(self, model_name):
+        """قفل تحميل لكل نموذج حتى لا يُحمل مرتين في نفس الوقت"""
+        with self.lock:
+            if model_name not in self.load_locks:
+                self.load_locks[model_name] = threading.Lock()
+            return self.load_locks[model_name]
+
+    def is_loaded(self, model_name):
+        """هل النموذج محمل في الذاكرة"""
+        with self.lock:
+            return model_name in self.models
+
+    def get(self, model_name):
+        """الحصول على النموذج وتحميله عند الحاجة"""
+        with self.lock:
+            if model_name in self.models:
+                self.models.move_to_end(model_name)
+                self.info[model_name]['last_used_at'] = time.time()
+                return self.models[model_name]
+
+        with self._load_lock(model_name):
+            # ربما حمّله طلب آخر أثناء انتظار القفل
+            with self.lock:
+                if model_name in self.models:
+                    self.models.move_to_end(model_name)
+                    return self.models[model_name]
+
+            logger.info(f"Loading model: {model_name}")
+            started = time.time()
+            pipe = self.loader(model_name)
+            load_seconds = time.time() - started
+
+            with self.lock:
+                self.models[model_name] = pipe
+                self.info[model_name] = {
+                    'load_seconds': round(load_seconds, 2),
+                    'memory_bytes': estimate_memory(pipe),
+                    'loaded_at': time.time(),
+                    'last_used_at': time.time()
+                }
+                self._evict_excess(keep=model_name)
+
+            logger.info(f"Model {model_name} loaded in {load_seconds:.1f}s")
+            return pipe
+
+    @contextmanager
+    def use(self, model_name):
+        """استخدام النموذج مع منع تفريغه أثناء التوليد"""
+        with self.lock:
+            self.in_use[model_name] = self.in_use.get(model_name, 0) + 1
+        try:
+            yield self.get(model_name)
+        finally:
+            with self.lock:
+                self.in_use[model_name] -= 1
+                if model_name in self.info:
+                    self.info[model_name]['last_used_at'] = time.time()
+
+    def _evict_excess(self, keep=None):
+        """تفريغ الأقل استخداماً حتى لا يتجاوز العدد الحد (يُستدعى مع القفل)"""
+        for model_name in list(self.models.keys()):
+            if len(self.models) <= self.max_resident:
+                break
+            # النماذج قيد الاستخدام تبقى حتى لو تجاوز العدد الحد مؤقتاً
+            if model_name == keep or self.in_use.get(model_name):
+                continue
+            self._unload(model_name, 'evicted')
+
+    def _unload(self, model_name, reason):
+        """إزالة نموذج من الذاكرة (يُستدعى مع القفل)"""
+        self.models.pop(model_name, None)
+        self.info.pop(model_name, None)
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info(f"Model {model_name} unloaded ({reason})")
+
+    def unload(self, model_name):
+        """تفريغ نموذج محدد إن لم يكن قيد الاستخدام"""
+        with self.lock:
+            if model_name not in self.models or self.in_use.get(model_name):
+                return False
+            self._unload(model_name, 'requested')
+            return True
+
+    def unload_all(self):
+        """تفريغ كل النماذج غير المستخدمة"""
+        with self.lock:
+            for model_name in list(self.models.keys()):
+                if not self.in_use.get(model_name):
+                    self._unload(model_name, 'cleanup')
+
+    def _reaper_loop(self):
+        """تفريغ النماذج التي لم تُستخدم منذ مدة الخمول"""
+        while True:
+            time.sleep(max(1.0, min(60.0, self.idle_timeout / 4)))
+            now = time.time()
+            with self.lock:
+                for model_name in list(self.models.keys()):
+                    if self.in_use.get(model_name):
+                        continue
+                    if now - self.info[model_name]['last_used_at'] >= self.idle_timeout:
+                        self._unload(model_name, 'idle')
+
+    def get_stats(self):
+        """حالة النماذج المحملة"""
+        now = time.time()
+        with self.lock:
+            models = [
+                {
+                    'name': model_name,
+                    'load_seconds': info['load_seconds'],
+                    'memory_bytes': info['memory_bytes'],
+                    'idle_seconds': round(now - info['last_used_at'], 1),
+                    'in_use': self.in_use.get(model_name, 0)
+                }
+                for model_name, info in self.info.items()
+            ]
+            return {
+                'models': models,
+                'resident_memory_bytes': sum(model['memory_bytes'] for model in models),
+                'max_resident': self.max_resident,
+                'idle_timeout': self.idle_timeout
+            }
+
+def estimate_memory(pipe):
+    """تقدير الذاكرة التي تشغلها أوزان النموذج بالبايت"""
+    total = 0
+    for component in getattr(pipe, 'components', {}).values():
+        if isinstance(component, torch.nn.Module):
+            total += sum(p.numel() * p.element_size() for p in component.parameters())
+            total += sum(b.numel() * b.element_size() for b in component.buffers())
+    return total
@@ -0,0 +1,148 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from src.models.visual_content import GenerationCacheEntry, db
+from src.services.image_generator import image_generator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get(
+            'IMAGE_CACHE_DIR',
+            os.path.join(os.path.dirname(__file__), '..', 'image_cache')
+        )
+        self.max_bytes = max_bytes or int(os.environ.get('IMAGE_CACHE_MAX_MB', 1024)) * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def model_name(self):
+        """النموذج الذي سيولد الطلب"""
+        return image_generator.current_model or image_generator.default_model
+
+    def make_keys(self, request):
+        """بصمة الإعدادات المحلولة بالكامل، مع البذرة وبدونها"""
+        params = {
+            'prompt': image_generator.enhance_prompt_for_arabic_culture(request['prompt']),
+            'negative_prompt': image_generator.resolve_negative_prompt(request.get('negative_prompt', '')),
+            'width': request['width'],
+            'height': request['height'],
+            'steps': request['steps'],
+            'guidance_scale': float(request['guidance_scale']),
+            'scheduler': request.get('scheduler') or 'default',
+            'model': self.model_name()
+        }
+        variant_key = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+        params['seed'] = request.get('seed')
+        cache_key = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+        return cache_key, variant_key
+
+    def lookup(self, request):
+        """البحث عن نتيجة مخزنة للطلب، ويعيد السجل أو None"""
+        cache_key, variant_key = self.make_keys(request)
+        entry = None
+
+        if request.get('seed') is not None:
+            entry = GenerationCacheEntry.query.filter_by(cache_key=cache_key).first()
+        elif request.get('any_variant'):
+            # أي صورة سابقة بنفس الإعدادات تكفي عندما لا تُحدد البذرة
+            entry = GenerationCacheEntry.query.filter_by(variant_key=variant_key).order_by(
+                GenerationCacheEntry.last_used_at.desc()
+            ).first()
+
+        if entry and not os.path.exists(entry.file_path):
+            db.session.delete(entry)
+            db.session.commit()
+            entry = None
+
+        with self.lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry:
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_used_at = datetime.utcnow()
+            db.session.commit()
+
+        return entry
+
+    def store(self, request, seed, image_path):
+        """حفظ نتيجة مولدة في المخزن"""
+        try:
+            cache_key, variant_key = self.make_keys(dict(request, seed=seed))
+            if GenerationCacheEntry.query.filter_by(cache_key=cache_key).first():
+                return
+
+            cached_path = os.path.join(self.cache_dir, f"{cache_key}.png")
+            copy_file(image_path, cached_path)
+
+            entry = GenerationCacheEntry(
+                cache_key=cache_key,
+                variant_key=variant_key,
+                model_name=self.model_name(),
+                seed=seed,
+                file_path=cached_path,
+                file_size=os.path.getsize(cached_path)
+            )
+            db.session.add(entry)
+            db.session.commit()
+
+            self.evict()
+
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Could not cache generated image: {str(e)}")
+
+    def evict(self):
+        """حذف الأقل استخداماً حتى يعود الحجم تحت الحد"""
+        total = db.session.query(db.func.coalesce(db.func.sum(GenerationCacheEntry.file_size), 0)).scalar()
+        if total <= self.max_bytes:
+            return
+
+        for entry in GenerationCacheEntry.query.order_by(GenerationCacheEntry.last_used_at).all():
+            if total <= self.max_bytes:
+                break
+            total -= entry.file_size or 0
+            if os.path.exists(entry.file_path):
+                os.unlink(entry.file_path)
+            db.session.delete(entry)
+
+        db.session.commit()
+
+    def get_stats(self):
+        """إحصائيات المخزن"""
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+
+        return {
+            'entries': GenerationCacheEntry.query.count(),
+            'size_bytes': db.session.query(
+                db.func.coalesce(db.func.sum(GenerationCacheEntry.file_size), 0)
+            ).scalar(),
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 3) if lookups else 0.0
+        }
+
+def copy_file(source_path, destination_path):
+    """نسخ ملف بربط صلب إن أمكن"""
+    try:
+        os.link(source_path, destination_path)
+    except OSError:
+        shutil.copyfile(source_path, destination_path)
+
+# إنشاء مثيل عام للاستخدام
+result_cache = ResultCache()
@@ -0,0 +1,175 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('diffusers')
+
+from flask import Flask
+from PIL import Image
+from src.models.visual_content import GenerationTask, db
+from src.services import generation_scheduler as scheduler_module
+from src.services.image_generator import GenerationCancelled
+from src.services.generation_scheduler import GenerationScheduler
+from src.services.result_cache import result_cache
+
+class StubGenerator:
+    """بديل مولد الصور يحاكي حلقة الانتشار ودالة الخطوة دون نموذج"""
+
+    current_model = 'stub-model'
+    default_model = 'stub-model'
+
+    def __init__(self):
+        self.calls = []
+        self.rows_per_step = []
+        self.on_step = None
+
+    def load_model(self, model_name=None):
+        return True
+
+    def generate_images(self, prompts, negative_prompts=None, width=512, height=512,
+                        num_inference_steps=20, guidance_scale=7.5, seeds=None, scheduler=None,
+                        step_callback=None):
+        self.calls.append(list(prompts))
+        rows = list(range(len(prompts)))
+        for step in range(1, num_inference_steps + 1):
+            self.rows_per_step.append(list(rows))
+            if self.on_step:
+                self.on_step(step)
+            dropped = set(step_callback(step, num_inference_steps, None, list(rows)) or ())
+            rows = [row for row in rows if row not in dropped]
+            if not rows:
+                raise GenerationCancelled()
+
+        images = [None] * len(prompts)
+        for row in rows:
+            images[row] = Image.new('RGB', (width, height), (row * 40, 0, 0))
+        return images
+
+    def latents_to_images(self, latents):
+        return []
+
+    def save_image(self, image, file_path):
+        image.save(file_path)
+        return True
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'app.db'}"
+    db.init_app(app)
+    monkeypatch.setattr(result_cache, 'cache_dir', str(tmp_path))
+    with app.app_context():
+        db.create_all()
+        yield app
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = StubGenerator()
+    monkeypatch.setattr(scheduler_module, 'image_generator', stub)
+    return stub
+
+@pytest.fixture
+def scheduler(app, stub, tmp_path):
+    scheduler = GenerationScheduler(max_batch_size=4, batch_window=0.01)
+    scheduler.app = app
+    scheduler.output_dir = str(tmp_path)
+    return scheduler
+
+def make_request(width=64, steps=4, prompt='a market'):
+    task = GenerationTask(task_type='image', movie_id=1, prompt=prompt)
+    db.session.add(task)
+    db.session.commit()
+    return {
+        'task_id': task.id,
+        'prompt': prompt,
+        'negative_prompt': '',
+        'width': width,
+        'height': 64,
+        'steps': steps,
+        'guidance_scale': 7.5,
+        'seed': None,
+        'filename_prefix': 'image',
+        'content_type': 'image',
+        'title': 'test'
+    }
+
+def test_batch_groups_compatible_requests_only(scheduler):
+    first = make_request(width=64)
+    other = make_request(width=128)
+    second = make_request(width=64)
+    scheduler.pending.extend([first, other, second])
+
+    batch = scheduler._next_batch()
+
+    assert [request['task_id'] for request in batch] == [first['task_id'], second['task_id']]
+    assert scheduler.pending == [other]
+    assert scheduler.running == {first['task_id'], second['task_id']}
+
+def test_batch_key_separates_schedulers_and_steps(scheduler):
+    request = make_request()
+    assert scheduler.batch_key(request) == scheduler.batch_key(dict(request, prompt='other'))
+    assert scheduler.batch_key(request) != scheduler.batch_key(dict(request, steps=8))
+    assert scheduler.batch_key(request) != scheduler.batch_key(dict(request, scheduler='dpm'))
+
+def test_batch_runs_in_one_model_call(scheduler, stub):
+    batch = [make_request(prompt='one'), make_request(prompt='two')]
+    scheduler._run_batch(batch)
+
+    assert len(stub.calls) == 1
+    for request in batch:
+        task = db.session.get(GenerationTask, request['task_id'])
+        assert task.status == 'completed' and task.progress == 100
+
+def test_cancel_queued_request_dequeues(scheduler):
+    request = make_request()
+    scheduler.pending.append(request)
+
+    assert scheduler.cancel(request['task_id']) == 'dequeued'
+    assert scheduler.pending == []
+    assert scheduler.cancel(request['task_id']) == 'not_running'
+
+def test_cancel_during_batch_window_is_not_lost(scheduler, stub):
+    scheduler.batch_window = 1.0
+    request = make_request()
+    scheduler.pending.append(request)
+
+    batches = []
+    worker = threading.Thread(target=lambda: batches.append(scheduler._next_batch()))
+    worker.start()
+    # الطلب خرج من الطابور والعامل ما زال ينتظر طلبات متوافقة
+    deadline = time.time() + 0.5
+    while scheduler.pending and time.time() < deadline:
+        time.sleep(0.001)
+
+    assert scheduler.cancel(request['task_id']) == 'interrupting'
+    worker.join(5)
+    scheduler._run_batch(batches[0])
+
+    assert stub.calls == []
+    assert db.session.get(GenerationTask, request['task_id']).status == 'cancelled'
+
+def test_cancel_mid_batch_drops_only_that_row(scheduler, stub):
+    cancelled, kept = make_request(prompt='one'), make_request(prompt='two')
+    stub.on_step = lambda step: step == 2 and scheduler.cancel(cancelled['task_id'])
+    scheduler.running = {cancelled['task_id'], kept['task_id']}
+
+    scheduler._run_batch([cancelled, kept])
+
+    # الصف الملغى يُسقط عند نهاية الخطوة والآخر يكمل كل خطواته في نفس الاستدعاء
+    assert len(stub.calls) == 1
+    assert stub.rows_per_step == [[0, 1], [0, 1], [1], [1]]
+    assert db.session.get(GenerationTask, cancelled['task_id']).status == 'cancelled'
+    task = db.session.get(GenerationTask, kept['task_id'])
+    assert task.status == 'completed' and task.current_step == 4
+
+def test_cancelling_every_task_stops_the_batch(scheduler, stub):
+    request = make_request()
+    stub.on_step = lambda step: scheduler.cancel(request['task_id'])
+    scheduler.running = {request['task_id']}
+
+    scheduler._run_batch([request])
+
+    assert stub.rows_per_step == [[0]]
+    assert db.session.get(GenerationTask, request['task_id']).status == 'cancelled'
+    assert not scheduler.cancelled
@@ -0,0 +1,55 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip('torch')
+
+from src.services.model_registry import ModelRegistry
+
+class CountingLoader:
+    """دالة تحميل تعد مرات التحميل لكل نموذج"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.loads = []
+
+    def __call__(self, model_name):
+        self.loads.append(model_name)
+        time.sleep(self.delay)
+        return object()
+
+def test_concurrent_gets_load_once():
+    loader = CountingLoader(delay=0.05)
+    registry = ModelRegistry(loader, max_resident=1, idle_timeout=0)
+    pipes = []
+
+    threads = [threading.Thread(target=lambda: pipes.append(registry.get('model'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert loader.loads == ['model']
+    assert len({id(pipe) for pipe in pipes}) == 1
+
+def test_least_recently_used_model_is_evicted():
+    loader = CountingLoader()
+    registry = ModelRegistry(loader, max_resident=2, idle_timeout=0)
+    registry.get('a')
+    registry.get('b')
+    registry.get('a')
+    registry.get('c')
+
+    assert registry.is_loaded('a') and registry.is_loaded('c')
+    assert not registry.is_loaded('b')
+
+def test_model_in_use_is_not_unloaded():
+    registry = ModelRegistry(CountingLoader(), max_resident=1, idle_timeout=0)
+
+    with registry.use('a'):
+        registry.get('b')
+        assert registry.is_loaded('a')
+        assert not registry.unload('a')
+
+    assert registry.unload('a')
+    assert registry.get_stats()['models'][0]['name'] == 'b'
@@ -0,0 +1,80 @@
+import os
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('diffusers')
+
+from flask import Flask
+from PIL import Image
+from src.models.visual_content import GenerationCacheEntry, db
+from src.services.result_cache import ResultCache
+
+REQUEST = {
+    'prompt': 'a market at sunset',
+    'negative_prompt': '',
+    'width': 64,
+    'height': 64,
+    'steps': 20,
+    'guidance_scale': 7.5,
+    'seed': 7
+}
+
+@pytest.fixture
+def cache(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'app.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield ResultCache(cache_dir=str(tmp_path / 'cache'), max_bytes=10 ** 7)
+
+def generated_image(tmp_path, name='out.png'):
+    path = str(tmp_path / name)
+    Image.new('RGB', (64, 64), (200, 100, 50)).save(path)
+    return path
+
+def test_keys_follow_resolved_parameters(cache):
+    cache_key, variant_key = cache.make_keys(REQUEST)
+
+    assert cache.make_keys(dict(REQUEST)) == (cache_key, variant_key)
+    # guidance 7.5 و 7.50 نفس الإعداد بعد التحويل
+    assert cache.make_keys(dict(REQUEST, guidance_scale='7.50')) == (cache_key, variant_key)
+
+    reseeded = cache.make_keys(dict(REQUEST, seed=8))
+    assert reseeded[0] != cache_key and reseeded[1] == variant_key
+    assert cache.make_keys(dict(REQUEST, steps=12))[1] != variant_key
+
+def test_seeded_request_hits_after_store(cache, tmp_path):
+    assert cache.lookup(REQUEST) is None
+
+    cache.store(REQUEST, REQUEST['seed'], generated_image(tmp_path))
+    entry = cache.lookup(REQUEST)
+
+    assert entry is not None and os.path.exists(entry.file_path)
+    assert entry.hit_count == 1
+    assert cache.lookup(dict(REQUEST, seed=8)) is None
+    assert cache.get_stats()['hits'] == 1
+
+def test_unseeded_request_uses_any_variant_only_when_asked(cache, tmp_path):
+    cache.store(REQUEST, 7, generated_image(tmp_path))
+    unseeded = dict(REQUEST, seed=None)
+
+    assert cache.lookup(unseeded) is None
+    assert cache.lookup(dict(unseeded, any_variant=True)).seed == 7
+
+def test_missing_file_drops_entry(cache, tmp_path):
+    cache.store(REQUEST, REQUEST['seed'], generated_image(tmp_path))
+    os.unlink(GenerationCacheEntry.query.one().file_path)
+
+    assert cache.lookup(REQUEST) is None
+    assert GenerationCacheEntry.query.count() == 0
+
+def test_evict_removes_least_recently_used(cache, tmp_path):
+    cache.store(REQUEST, 1, generated_image(tmp_path, 'one.png'))
+    cache.store(REQUEST, 2, generated_image(tmp_path, 'two.png'))
+    cache.lookup(dict(REQUEST, seed=1))
+
+    cache.max_bytes = GenerationCacheEntry.query.first().file_size
+    cache.evict()
+
+    assert [entry.seed for entry in GenerationCacheEntry.query.all()] == [1]